@@ -2,7 +2,8 @@ from migen.fhdl.std import *
 from migen.bank.description import AutoCSR
 
 from components.crg import CRGDiffBasic
-from components.gpio import Blinker, GPIOOut
+from components.gpio import Blinker, GPIOOut, Debouncer
+from library.timestamp import Timestamp
 
 class AppToplevel(Module, AutoCSR):
 	def __init__(self, stl):
@@ -16,3 +17,11 @@ class AppToplevel(Module, AutoCSR):
 
 		self.submodules.blinker = Blinker(platform.request("user_led"))
 		self.submodules.leds = GPIOOut(Cat(*[platform.request("user_led") for i in range(3)]))
+
+		# On RHINO, the timestamp counts system clock cycles, and its PPS
+		# or trigger input is the first user push button, debounced (there
+		# is no PPS input on the board).
+		if platform.name == "rhino":
+			self.submodules.pps = Debouncer(platform.request("user_btn"))
+			self.submodules.timestamp = RenameClockDomains(Timestamp(), {"signal": "sys"})
+			self.comb += self.timestamp.pps.eq(self.pps.o)
@@ -5,6 +5,7 @@ from library.crg_radar import CRGRadar
 class CRGDiffBasic(Module):
 	def __init__(self, platform, pads, period=10.0):
 		self.clock_domains.cd_sys = ClockDomain()
+		self.sys_clk_freq = 1e9/period
 		platform.add_platform_command("""
 NET "{clk}" TNM_NET = "GRPclk";
 TIMESPEC "TSclk" = PERIOD "GRPclk" """+str(float(period))+""" ns HIGH 50%;
@@ -1,7 +1,204 @@
 from migen.fhdl.std import *
 from migen.genlib.cdc import MultiReg
+from migen.genlib.fsm import FSM, NextState
 from migen.bank.description import *
 
+# SPI devices, with their default word length and whether they latch
+# data on falling clock edges
+_spi_devices = [
+	("adc", 16, True),		# ADS62P49
+	("cdce", 32, False),	# CDCE72010
+	("dac", 16, False),		# DAC3283
+	("mon", 32, True)		# AMC7823
+]
+
+# SPI master for the devices of the FMC150
+#
+# Words are sent MSB first, with the chip select of the device and the
+# word length and clock polarity of its profile. The clock is inverted
+# for devices that latch data on falling edges, so that data is latched
+# in the middle of the bit period. The SDO line of the device is sampled
+# on every bit, and the whole received word is latched into read_data
+# (read transactions are written with the read bit of the device set).
+#
+# Commands are written by the host (word, device, then start) or played
+# from the init memory: entries hold the word, the device index above it
+# and a last flag above the device index. Writing a start index to
+# init_start plays the entries up to the next one flagged last.
+#
+# divider is the number of system clock cycles per half SPI clock period,
+# and must be at least 3 for SDO to be sampled through its synchronizer.
+class FMC150SPI(Module, AutoCSR):
+	def __init__(self, sdos, init_depth=256):
+		ndevices = len(_spi_devices)
+		device_bits = bits_for(ndevices - 1)
+		self.specials._mem_init = Memory(32 + device_bits + 1, init_depth)
+
+		self._r_divider = CSRStorage(8, reset=8)
+		for name, bits, invert in _spi_devices:
+			setattr(self, "_r_" + name + "_bits", CSRStorage(6, reset=bits, name=name + "_bits"))
+			setattr(self, "_r_" + name + "_invert", CSRStorage(reset=int(invert), name=name + "_invert"))
+		self._r_word = CSRStorage(32)
+		self._r_device = CSRStorage(device_bits)
+		self._r_start = CSR()
+		self._r_init_start = CSR(bits_for(init_depth - 1))
+		self._r_busy = CSRStatus()
+		self._r_read_data = CSRStatus(32)
+		self._r_count = CSRStatus(32)
+
+		self.sclk = Signal()
+		self.data = Signal()
+		self.en_n = Signal(ndevices, reset=2**ndevices - 1)
+
+		###
+
+		# command source
+		word = Signal(32)
+		device = Signal(device_bits)
+		start = Signal()
+		index = Signal(max=init_depth)
+		sequencing = Signal()
+		loading = Signal()
+		next_command = Signal()
+		port = self._mem_init.get_port()
+		self.specials += port
+		self.comb += port.adr.eq(index)
+		self.sync += If(self._r_init_start.re,
+				index.eq(self._r_init_start.r),
+				loading.eq(1),
+				sequencing.eq(1)
+			).Elif(loading,
+				# the entry is read on the next cycle
+				loading.eq(0)
+			).Elif(next_command,
+				If(port.dat_r[32+device_bits],
+					sequencing.eq(0)
+				).Else(
+					index.eq(index + 1),
+					loading.eq(1)
+				)
+			)
+		self.comb += If(sequencing,
+				word.eq(port.dat_r[:32]),
+				device.eq(port.dat_r[32:32+device_bits]),
+				start.eq(~loading)
+			).Else(
+				word.eq(self._r_word.storage),
+				device.eq(self._r_device.storage),
+				start.eq(self._r_start.re)
+			)
+
+		# device profile
+		bits = Signal(6)
+		invert = Signal()
+		self.comb += [
+			bits.eq(Array(getattr(self, "_r_" + name + "_bits").storage
+				for name, b, i in _spi_devices)[device]),
+			invert.eq(Array(getattr(self, "_r_" + name + "_invert").storage
+				for name, b, i in _spi_devices)[device])
+		]
+
+		# half clock period timer
+		timer = Signal(8)
+		tick = Signal()
+		running = Signal()
+		self.comb += tick.eq(timer == 0)
+		self.sync += If(~running | tick,
+				timer.eq(self._r_divider.storage - 1)
+			).Else(
+				timer.eq(timer - 1)
+			)
+
+		# shift registers
+		sr = Signal(32)
+		sr_in = Signal(32)
+		remaining = Signal(6)
+		current = Signal(device_bits)
+		current_invert = Signal()
+		current_init = Signal()
+		load = Signal()
+		shift = Signal()
+		sdo = Signal()
+		self.comb += sdo.eq(Array(sdos)[current])
+		self.sync += [
+			If(load,
+				sr.eq(word << (32 - bits)),
+				sr_in.eq(0),
+				remaining.eq(bits - 1),
+				current.eq(device),
+				current_invert.eq(invert),
+				current_init.eq(sequencing)
+			).Elif(shift,
+				sr.eq(sr << 1),
+				sr_in.eq(Cat(sdo, sr_in[:31])),
+				remaining.eq(remaining - 1)
+			)
+		]
+
+		# transfer
+		sclk = Signal()
+		select = Signal()
+		done = Signal()
+		fsm = FSM()
+		self.submodules += fsm
+		fsm.act("IDLE",
+			If(start,
+				load.eq(1),
+				NextState("POLARITY")
+			)
+		)
+		# the clock takes the polarity of the device before it is selected
+		fsm.act("POLARITY",
+			running.eq(1),
+			If(tick, NextState("SETUP"))
+		)
+		fsm.act("SETUP",
+			running.eq(1),
+			select.eq(1),
+			If(tick, NextState("LOW"))
+		)
+		fsm.act("LOW",
+			running.eq(1),
+			select.eq(1),
+			If(tick, NextState("HIGH"))
+		)
+		fsm.act("HIGH",
+			running.eq(1),
+			select.eq(1),
+			sclk.eq(1),
+			If(tick,
+				shift.eq(1),
+				If(remaining == 0,
+					NextState("HOLD")
+				).Else(
+					NextState("LOW")
+				)
+			)
+		)
+		fsm.act("HOLD",
+			running.eq(1),
+			select.eq(1),
+			If(tick,
+				done.eq(1),
+				NextState("IDLE")
+			)
+		)
+		self.comb += next_command.eq(done & current_init)
+
+		# outputs, registered
+		self.sync += [
+			self.sclk.eq(sclk ^ current_invert),
+			self.data.eq(sr[31]),
+			self.en_n.eq(~(Cat(select) << current))
+		]
+
+		# status
+		self.comb += self._r_busy.status.eq(running | sequencing)
+		self.sync += If(done,
+				self._r_read_data.status.eq(sr_in),
+				self._r_count.status.eq(self._r_count.status + 1)
+			)
+
 class FMC150Controller(Module, AutoCSR):
 	def __init__(self, pads):
 		for name, is_output in [
@@ -29,10 +226,26 @@ class FMC150Controller(Module, AutoCSR):
 			if is_output:
 				reset = 1 if name in ["adc_en_n", "cdce_en_n", "dac_en_n", "mon_en_n"] else 0
 				csr = CSRStorage(name=name, reset=reset)
-				self.comb += getattr(pads, name).eq(csr.storage)
 			else:
 				csr = CSRStatus(name=name)
 				self.specials += MultiReg(getattr(pads, name), csr.status)
 			setattr(self, "_r_"+name, csr)
 
+		# SPI lines are driven by the SPI master when spi_hw is set, and
+		# by their pin registers otherwise
+		self._r_spi_hw = CSRStorage()
+		self.submodules.spi = FMC150SPI([getattr(self, "_r_" + name + "_sdo").status
+			for name, bits, invert in _spi_devices])
+		spi_outputs = [("spi_sclk", self.spi.sclk), ("spi_data", self.spi.data)]
+		spi_outputs += [(name + "_en_n", self.spi.en_n[i])
+			for i, (name, bits, invert) in enumerate(_spi_devices)]
+		for name, signal in spi_outputs:
+			self.comb += If(self._r_spi_hw.storage,
+					getattr(pads, name).eq(signal)
+				).Else(
+					getattr(pads, name).eq(getattr(self, "_r_" + name).storage)
+				)
+		for name in ["adc_reset", "cdce_reset_n", "cdce_pd_n", "cdce_ref_en", "mon_reset_n"]:
+			self.comb += getattr(pads, name).eq(getattr(self, "_r_" + name).storage)
+
 		self.comb += pads.pg_c2m.eq(1)
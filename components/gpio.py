@@ -17,3 +17,23 @@ class Blinker(Module):
 		counter = Signal(divbits)
 		self.comb += signal.eq(counter[divbits-1])
 		self.sync += counter.eq(counter + 1)
+
+# Follows an asynchronous input (e.g. a push button) once it has been
+# stable for 2**divbits cycles
+class Debouncer(Module):
+	def __init__(self, signal, divbits=20):
+		self.o = Signal()
+
+		###
+
+		synced = Signal()
+		self.specials += MultiReg(signal, synced)
+		counter = Signal(divbits)
+		self.sync += If(synced == self.o,
+				counter.eq(0)
+			).Else(
+				counter.eq(counter + 1),
+				If(counter == 2**divbits - 1,
+					self.o.eq(synced)
+				)
+			)
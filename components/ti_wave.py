@@ -2,14 +2,20 @@ from migen.fhdl.std import *
 from migen.bank.description import AutoCSR
 
 from library.waveform_memory import WaveformMemoryOut, WaveformMemoryIn
+from library.stream_capture import StreamCapture
+from library.stream_playback import StreamPlayback
+from library.ddc import DDC
+from library.pulse_compression import MatchedFilter, FastMatchedFilter
 from library.ti_io import DAC, DAC2X, ADC
 
+# Waveform memories deeper than a CSR bank window (e.g. the 16K-64K
+# samples of radar-length pulses) are mapped on the native bus.
 class WaveformGenerator(Module, AutoCSR):
-	def __init__(self, crg, pads, double_dac):
+	def __init__(self, crg, pads, double_dac, depth=1024):
 		width = 2*flen(pads.dat_p)
 		spc = 2 if double_dac else 1
 		dac_class = DAC2X if double_dac else DAC
-		self.submodules.wm = WaveformMemoryOut(1024, width, spc)
+		self.submodules.wm = WaveformMemoryOut(depth, width, spc)
 		self.submodules.dac = dac_class(pads, crg.dacio_strb)
 	
 		if double_dac:
@@ -25,14 +31,111 @@ class WaveformGenerator(Module, AutoCSR):
 				self.dac.q.eq(self.wm.value_q0)
 			]
 
-class WaveformCollector(Module, AutoCSR):
-	def __init__(self, pads_or_adc):
-		if isinstance(pads_or_adc, Module):
-			self.adc = pads_or_adc
-			self.autocsr_exclude = {"adc"}
+class WaveformPlayer(Module, AutoCSR):
+	def __init__(self, crg, pads, double_dac, depth=1024):
+		width = 2*flen(pads.dat_p)
+		spc = 2 if double_dac else 1
+		dac_class = DAC2X if double_dac else DAC
+		self.submodules.sp = StreamPlayback(width, spc, depth)
+		self.submodules.dac = dac_class(pads, crg.dacio_strb)
+
+		if double_dac:
+			self.comb += [
+				self.dac.i0.eq(self.sp.value_i0),
+				self.dac.q0.eq(self.sp.value_q0),
+				self.dac.i1.eq(self.sp.value_i1),
+				self.dac.q1.eq(self.sp.value_q1)
+			]
 		else:
-			self.submodules.adc = ADC(pads_or_adc)
-		width = flen(self.adc.a)
-		self.submodules.wm = WaveformMemoryIn(1024, 2*width)
+			self.comb += [
+				self.dac.i.eq(self.sp.value_i0),
+				self.dac.q.eq(self.sp.value_q0)
+			]
+
+# With ddc set, the ADC channels A and B are taken as the I and Q
+# components of a complex signal (two's complement) and go through a DDC
+# before being captured.
+def _connect_adc(module, pads_or_adc, ddc):
+	if isinstance(pads_or_adc, Module):
+		module.adc = pads_or_adc
+		module.autocsr_exclude = {"adc"}
+	else:
+		module.submodules.adc = ADC(pads_or_adc)
+	width = flen(module.adc.a)
+	if ddc:
+		module.submodules.ddc = DDC(width)
+		module.comb += [
+			module.ddc.i.eq(module.adc.a),
+			module.ddc.q.eq(module.adc.b)
+		]
+		return 2*module.ddc.out_bits, Cat(module.ddc.out_i, module.ddc.out_q), module.ddc.stb
+	else:
+		return 2*width, Cat(module.adc.a, module.adc.b), 1
+
+# DSP48A1 slices of the Spartan-6 LX150T
+_dsp_slices = 180
+
+# With compression set to "fir" (direct form, compression_size taps,
+# 16 by default) or "fft" (fast convolution, frames of compression_size
+# samples, 64 by default), the samples (taken as I and Q, two's
+# complement) go through a matched filter before being captured. The
+# direct form takes four multipliers per tap, out of those the DDC (if
+# any) leaves, and is meant for short codes; "fft" is the path for long
+# codes and chirps. Fast convolution needs one sample per clock, and
+# cannot follow the DDC.
+def _connect_compression(module, width, value, stb, compression, compression_size):
+	in_bits = width//2
+	if compression == "fir":
+		if compression_size is None:
+			compression_size = 16
+		dsp_slices = _dsp_slices
+		if hasattr(module, "ddc"):
+			# mixer, and FIR filter on I and Q
+			dsp_slices -= 4 + 2*len(module.ddc.taps)
+		if 4*compression_size > dsp_slices:
+			raise ValueError("{} taps need more multipliers than the FPGA has left, use \"fft\" for long codes"
+				.format(compression_size))
+		module.submodules.mf = MatchedFilter(in_bits, compression_size)
+		module.comb += module.mf.stb_i.eq(stb)
+		out_bits = module.mf.out_bits
+	elif compression == "fft":
+		if not isinstance(stb, int):
+			raise ValueError("Fast convolution needs one sample per clock")
+		if compression_size is None:
+			compression_size = 64
+		module.submodules.mf = FastMatchedFilter(in_bits, compression_size)
+		out_bits = module.mf.nbits
+	else:
+		raise ValueError("Unknown pulse compression: " + compression)
+	module.comb += [
+		module.mf.i.eq(value[:in_bits]),
+		module.mf.q.eq(value[in_bits:])
+	]
+	return 2*out_bits, Cat(module.mf.out_i, module.mf.out_q), module.mf.stb
+
+# timestamp is the value of a Timestamp, for tagging captures. With
+# integrate_bits, captures integrate pulses on the channels (or on I and
+# Q), each pass starting on wm.trigger.
+class WaveformCollector(Module, AutoCSR):
+	def __init__(self, pads_or_adc, double_buffered=False, ddc=False, depth=1024, timestamp=None, integrate_bits=0,
+	  compression=None, compression_size=None):
+		width, value, stb = _connect_adc(self, pads_or_adc, ddc)
+		if compression is not None:
+			width, value, stb = _connect_compression(self, width, value, stb, compression, compression_size)
+		self.submodules.wm = WaveformMemoryIn(depth, width, double_buffered, timestamp,
+			lanes=2, integrate_bits=integrate_bits)
+
+		self.comb += [
+			self.wm.value.eq(value),
+			self.wm.stb.eq(stb)
+		]
+
+class WaveformStreamer(Module, AutoCSR):
+	def __init__(self, pads_or_adc, depth=256, ddc=False):
+		width, value, stb = _connect_adc(self, pads_or_adc, ddc)
+		self.submodules.sc = StreamCapture(width, depth)
 
-		self.comb += self.wm.value.eq(Cat(self.adc.a, self.adc.b))
+		self.comb += [
+			self.sc.value.eq(value),
+			self.sc.stb.eq(stb)
+		]
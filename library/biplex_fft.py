@@ -3,42 +3,67 @@ from math import sin, cos, pi
 from migen.fhdl.std import *
 from migen.genlib.complex import *
 
-class _Butterfly:
-	def __init__(self, nbits, nfrac, latency):
-		self.nbits = nbits
-		self.nfrac = nfrac
-		self.latency = latency
-		
-		self.A = SignalC(self.nbits)
-		self.B = SignalC(self.nbits)
-		self.w = SignalC(self.nbits) # FIXME
-		self.C = SignalC(self.nbits + 2)
-		self.D = SignalC(self.nbits + 2)
-
-	def get_fragment(self):
-		sC = SignalC(self.nbits + 2)
-		sD = SignalC(self.nbits + 2)
-		Bw = SignalC(2*self.nbits + 1 - self.nfrac)
-		comb = [
-			Bw.eq(self.B*self.w >> self.nfrac),
+# Radix-2 biplex pipelined FFT
+#
+# Two independent streams of complex samples enter on dat_i0 and dat_i1,
+# one sample of each per clock, with sync_i marking the first sample of
+# each N-sample frame. A delay commutator in front of every stage pairs
+# the samples that share a butterfly, so that all log2(N) butterflies
+# are busy on every clock.
+#
+# The results leave as one pair per clock, N clocks after sync_o
+# (asserted with the first pair of each frame): first the N/2 pairs of
+# the spectrum of stream 0, then those of stream 1. Within a spectrum,
+# pair k holds bins bitrev(2k) on dat_o0 and bitrev(2k+1) on dat_o1.
+#
+# Every stage scales its results by 1/2 and saturates them to nbits.
+# Twiddle factors have nfrac fractional bits. The core runs in the
+# sys clock domain; rename it to put it in another one.
+
+def _raw(c):
+	return Cat(c.real, c.imag)
+
+def _bit_reverse(x, bits):
+	r = 0
+	for i in range(bits):
+		r = (r << 1) | ((x >> i) & 1)
+	return r
+
+class _Butterfly(Module):
+	def __init__(self, nbits, nfrac, latency, twiddle=True):
+		self.A = SignalC((nbits, True))
+		self.B = SignalC((nbits, True))
+		self.w = SignalC((nfrac + 2, True))
+		self.C = SignalC((nbits + 2, True))
+		self.D = SignalC((nbits + 2, True))
+
+		###
+
+		sC = SignalC((nbits + 2, True))
+		sD = SignalC((nbits + 2, True))
+		Bw = SignalC((nbits + 3, True))
+		if twiddle:
+			self.comb += Bw.eq(self.B*self.w >> nfrac)
+		else:
+			# multiplication by 1 is exact
+			self.comb += Bw.eq(self.B)
+		self.comb += [
 			sC.eq(self.A + Bw),
 			sD.eq(self.A - Bw)
 		]
-		sync = []
-		for i in range(self.latency):
-			tC = SignalC(self.nbits + 2)
-			tD = SignalC(self.nbits + 2)
-			sync += [
+		for i in range(latency):
+			tC = SignalC((nbits + 2, True))
+			tD = SignalC((nbits + 2, True))
+			self.sync += [
 				tC.eq(sC),
 				tD.eq(sD)
 			]
 			sC = tC
 			sD = tD
-		comb += [
+		self.comb += [
 			self.C.eq(sC),
 			self.D.eq(sD)
 		]
-		return Fragment(comb, sync)
 
 def _twiddle(i, N, nfrac):
 	real = cos(2.0*pi*i/N)
@@ -46,21 +71,139 @@ def _twiddle(i, N, nfrac):
 	scale = 2**nfrac
 	return Complex(int(real*scale), int(imag*scale))
 
-class _BiplexStage:
-	def __init__(self, N, nbits, nfrac, butterfly_latency):
-		self.nbits = nbits
-		
-		self.dat_i0 = SignalC(self.nbits)
-		self.dat_i1 = SignalC(self.nbits)
-		self.dat_o0 = SignalC(self.nbits)
-		self.dat_o1 = SignalC(self.nbits)
-	
-	def get_fragment(self):
-		...
-
-class BiplexFFT:
+class _Delay(Module):
+	def __init__(self, width, delay):
+		self.i = Signal(width)
+		self.o = Signal(width)
+
+		###
+
+		if delay < 16:
+			o = self.i
+			for n in range(delay):
+				r = Signal(width)
+				self.sync += r.eq(o)
+				o = r
+			self.comb += self.o.eq(o)
+		else:
+			# reading the location that is written next gives the sample
+			# written delay cycles before
+			mem = Memory(width, delay)
+			wport = mem.get_port(write_capable=True)
+			rport = mem.get_port()
+			self.specials += mem, wport, rport
+			adr = Signal(log2_int(delay))
+			self.sync += adr.eq(adr + 1)
+			self.comb += [
+				wport.adr.eq(adr),
+				wport.dat_w.eq(self.i),
+				wport.we.eq(1),
+				rport.adr.eq(adr + 1),
+				self.o.eq(rport.dat_r)
+			]
+
+def _scale(o, i, nbits):
+	hi = 2**(nbits-1) - 1
+	lo = -2**(nbits-1)
+	return If((i >> 1) > hi,
+			o.eq(hi)
+		).Elif((i >> 1) < lo,
+			o.eq(lo)
+		).Else(
+			o.eq(i >> 1)
+		)
+
+class _BiplexStage(Module):
+	def __init__(self, N, stage, nbits, nfrac, butterfly_latency):
+		self.dat_i0 = SignalC((nbits, True))
+		self.dat_i1 = SignalC((nbits, True))
+		self.sync_i = Signal()
+		self.dat_o0 = SignalC((nbits, True))
+		self.dat_o1 = SignalC((nbits, True))
+		self.sync_o = Signal()
+
+		D = N >> (stage + 1)
+		self.latency = D + butterfly_latency + 1
+
+		###
+
+		ld = log2_int(D)
+
+		# frame counter
+		cnt = Signal(log2_int(N))
+		c = Signal(log2_int(N))
+		running = Signal()
+		self.comb += If(self.sync_i, c.eq(0)).Else(c.eq(cnt))
+		self.sync += [
+			cnt.eq(c + 1),
+			If(self.sync_i, running.eq(1))
+		]
+		self.comb += self.sync_o.eq((running | self.sync_i) & (c == self.latency))
+
+		# delay commutator
+		bf = _Butterfly(nbits, nfrac, butterfly_latency, stage != 0)
+		delay_bottom = _Delay(2*nbits, D)
+		delay_top = _Delay(2*nbits, D)
+		self.submodules += bf, delay_bottom, delay_top
+		self.comb += [
+			delay_bottom.i.eq(_raw(self.dat_i1)),
+			If(c[ld],
+				delay_top.i.eq(delay_bottom.o),
+				_raw(bf.B).eq(_raw(self.dat_i0))
+			).Else(
+				delay_top.i.eq(_raw(self.dat_i0)),
+				_raw(bf.B).eq(delay_bottom.o)
+			),
+			_raw(bf.A).eq(delay_top.o)
+		]
+
+		# twiddle factors, constant over each block of D pairs
+		if stage:
+			block = Signal(stage)
+			self.comb += block.eq(c[ld:ld+stage] - 1)
+			cases = dict()
+			for j in range(2**stage):
+				w = _twiddle(-_bit_reverse(j, stage)*D, N, nfrac)
+				cases[j] = [bf.w.real.eq(w.real), bf.w.imag.eq(w.imag)]
+			self.comb += Case(block, cases)
+
+		self.sync += [
+			_scale(self.dat_o0.real, bf.C.real, nbits),
+			_scale(self.dat_o0.imag, bf.C.imag, nbits),
+			_scale(self.dat_o1.real, bf.D.real, nbits),
+			_scale(self.dat_o1.imag, bf.D.imag, nbits)
+		]
+
+class BiplexFFT(Module):
 	def __init__(self, N, nbits, nfrac, butterfly_latency=3):
-		...
-	
-	def get_fragment(self):
-		...
+		log2N = log2_int(N)
+		if N < 4 or butterfly_latency + 1 >= N//2:
+			raise ValueError("Unsupported biplex FFT size/latency")
+
+		self.dat_i0 = SignalC((nbits, True))
+		self.dat_i1 = SignalC((nbits, True))
+		self.sync_i = Signal()
+		self.dat_o0 = SignalC((nbits, True))
+		self.dat_o1 = SignalC((nbits, True))
+		self.sync_o = Signal()
+
+		###
+
+		stages = [_BiplexStage(N, stage, nbits, nfrac, butterfly_latency)
+			for stage in range(log2N)]
+		self.submodules += stages
+		self.latency = sum(stage.latency for stage in stages)
+
+		dat_0, dat_1, sync = self.dat_i0, self.dat_i1, self.sync_i
+		for stage in stages:
+			self.comb += [
+				stage.dat_i0.eq(dat_0),
+				stage.dat_i1.eq(dat_1),
+				stage.sync_i.eq(sync)
+			]
+			dat_0, dat_1, sync = stage.dat_o0, stage.dat_o1, stage.sync_o
+		self.comb += [
+			self.dat_o0.eq(dat_0),
+			self.dat_o1.eq(dat_1),
+			self.sync_o.eq(sync)
+		]
@@ -0,0 +1,67 @@
+from math import sin, cos, pi
+
+import numpy as np
+
+# Bit-accurate NumPy model of library.biplex_fft.BiplexFFT
+
+def _bit_reverse(x, bits):
+	r = 0
+	for i in range(bits):
+		r = (r << 1) | ((x >> i) & 1)
+	return r
+
+# must match biplex_fft._twiddle
+def _twiddle(i, N, nfrac):
+	scale = 2**nfrac
+	return int(cos(2.0*pi*i/N)*scale), int(sin(2.0*pi*i/N)*scale)
+
+def _scale(x, nbits):
+	return np.clip(x >> 1, -2**(nbits-1), 2**(nbits-1) - 1)
+
+def _transform(re, im, nbits, nfrac):
+	frames, N = re.shape
+	log2N = N.bit_length() - 1
+	for stage in range(log2N):
+		D = N >> (stage + 1)
+		re = re.reshape(frames, 2**stage, 2*D)
+		im = im.reshape(frames, 2**stage, 2*D)
+		a_re, b_re = re[:, :, :D], re[:, :, D:]
+		a_im, b_im = im[:, :, :D], im[:, :, D:]
+		w = [_twiddle(-_bit_reverse(j, stage)*D, N, nfrac) for j in range(2**stage)]
+		w_re = np.array([x[0] for x in w], dtype=np.int64).reshape(1, -1, 1)
+		w_im = np.array([x[1] for x in w], dtype=np.int64).reshape(1, -1, 1)
+		if stage:
+			t_re = (b_re*w_re - b_im*w_im) >> nfrac
+			t_im = (b_re*w_im + b_im*w_re) >> nfrac
+		else:
+			t_re, t_im = b_re, b_im
+		c_re, c_im = _scale(a_re + t_re, nbits), _scale(a_im + t_im, nbits)
+		d_re, d_im = _scale(a_re - t_re, nbits), _scale(a_im - t_im, nbits)
+		# block j splits into blocks 2j (sums) and 2j+1 (differences)
+		re = np.stack([c_re, d_re], axis=2).reshape(frames, N)
+		im = np.stack([c_im, d_im], axis=2).reshape(frames, N)
+	return re, im
+
+def biplex_fft(re0, im0, re1, im1, N, nbits, nfrac):
+	"""Transforms the two input streams (integer arrays holding a whole
+	number of N-sample frames) and returns the real and imaginary parts
+	of dat_o0 and dat_o1, in output order, as arrays of shape
+	(frames, N)."""
+	streams = []
+	for re, im in [(re0, im0), (re1, im1)]:
+		re = np.asarray(re, dtype=np.int64).reshape(-1, N)
+		im = np.asarray(im, dtype=np.int64).reshape(-1, N)
+		streams.append(_transform(re, im, nbits, nfrac))
+	(re0, im0), (re1, im1) = streams
+	o0_re = np.concatenate([re0[:, 0::2], re1[:, 0::2]], axis=1)
+	o0_im = np.concatenate([im0[:, 0::2], im1[:, 0::2]], axis=1)
+	o1_re = np.concatenate([re0[:, 1::2], re1[:, 1::2]], axis=1)
+	o1_im = np.concatenate([im0[:, 1::2], im1[:, 1::2]], axis=1)
+	return o0_re, o0_im, o1_re, o1_im
+
+def bin_order(N):
+	"""Returns the FFT bins carried by dat_o0 and dat_o1 on each of the
+	N/2 clocks of a spectrum."""
+	log2N = N.bit_length() - 1
+	return ([_bit_reverse(2*k, log2N) for k in range(N//2)],
+		[_bit_reverse(2*k+1, log2N) for k in range(N//2)])
@@ -0,0 +1,91 @@
+import os, re, time, shutil, hashlib, json
+
+from library import ise
+
+# Content-addressed cache of build artifacts.
+#
+# The key covers everything that determines the bitstream and BOF file:
+# the generated Verilog and any additional sources, the UCF, the XST
+# project, the toolchain options, the ISE release and the formatted
+# symtab. Entries are directories named after the key; their
+# modification time records the last use and drives eviction.
+
+_artifact_suffixes = [".bin", ".bit", ".bof", ".symtab", "_map.mrp", ".par", ".twr"]
+
+def _hash_file(h, filename):
+	with open(filename, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			h.update(chunk)
+
+def _project_sources(prj_name):
+	r = []
+	with open(prj_name, "r") as f:
+		for line in f:
+			fields = line.split()
+			if len(fields) >= 3:
+				r.append(fields[2].strip("\""))
+	return r
+
+class BuildCache:
+	def __init__(self, cache_dir, max_size=2*1024**3, max_age=30*24*3600):
+		self.cache_dir = cache_dir
+		self.max_size = max_size
+		self.max_age = max_age
+
+	def get_key(self, platform, build_dir, build_name, symtab, mkbof_hwrtyp, ise_path="/opt/Xilinx"):
+		h = hashlib.sha256()
+		for suffix in [".v", ".ucf", ".xst"]:
+			_hash_file(h, os.path.join(build_dir, build_name + suffix))
+		prj_name = os.path.join(build_dir, build_name + ".prj")
+		for source in _project_sources(prj_name):
+			# the generated Verilog is already part of the key
+			if os.path.basename(source) != build_name + ".v":
+				_hash_file(h, os.path.join(build_dir, source))
+		options = ise.get_options(platform)
+		options["mkbof_hwrtyp"] = mkbof_hwrtyp
+		options["ise_release"] = ise.get_release(ise_path)
+		h.update(json.dumps(options, sort_keys=True).encode())
+		h.update(symtab.encode())
+		return h.hexdigest()
+
+	def restore(self, key, build_dir):
+		entry = os.path.join(self.cache_dir, key)
+		if not os.path.isdir(entry):
+			return False
+		for filename in os.listdir(entry):
+			shutil.copy2(os.path.join(entry, filename), os.path.join(build_dir, filename))
+		os.utime(entry, None)
+		return True
+
+	def store(self, key, build_dir, build_name):
+		if not os.path.isdir(self.cache_dir):
+			os.makedirs(self.cache_dir)
+		entry = os.path.join(self.cache_dir, key)
+		tmp_entry = entry + ".tmp" + str(os.getpid())
+		os.mkdir(tmp_entry)
+		for suffix in _artifact_suffixes:
+			filename = build_name + suffix
+			if os.path.exists(os.path.join(build_dir, filename)):
+				shutil.copy2(os.path.join(build_dir, filename), os.path.join(tmp_entry, filename))
+		try:
+			os.rename(tmp_entry, entry)
+		except OSError:
+			# stored concurrently by another build
+			shutil.rmtree(tmp_entry)
+		self.evict()
+
+	def evict(self):
+		entries = []
+		for name in os.listdir(self.cache_dir):
+			path = os.path.join(self.cache_dir, name)
+			if not re.match("^[0-9a-f]{64}$", name) or not os.path.isdir(path):
+				continue
+			size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+			entries.append((os.path.getmtime(path), size, path))
+		entries.sort()
+		now = time.time()
+		total_size = sum(size for mtime, size, path in entries)
+		for mtime, size, path in entries:
+			if now - mtime > self.max_age or total_size > self.max_size:
+				shutil.rmtree(path)
+				total_size -= size
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import os, sys, re, time, json, argparse, subprocess
+from contextlib import contextmanager
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+# Structured build reports
+#
+# A build is profiled phase by phase: phases run in the build process
+# record its peak resident set size so far, phases run as child
+# processes (the ISE tools, mkbof) their own peak. The report also holds
+# the utilization and timing summaries parsed from the ISE reports, and
+# is written as JSON to <build_name>_report.json in the build directory.
+#
+# Reports of two builds are compared with:
+#	python3 -m library.build_report compare old_report.json new_report.json
+
+def _peak_rss_self():
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# bytes on OS X, kilobytes elsewhere
+	if sys.platform == "darwin":
+		peak //= 1024
+	return peak
+
+# Runs a command and returns its exit status and its peak resident set
+# size in kilobytes (None where unavailable).
+def run_process(args, cwd=None):
+	p = subprocess.Popen(args, cwd=cwd)
+	if not hasattr(os, "wait4"):
+		return p.wait(), None
+	pid, status, rusage = os.wait4(p.pid, 0)
+	# the process is reaped: keep Popen from waiting for it again
+	p.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+	peak = rusage.ru_maxrss
+	if sys.platform == "darwin":
+		peak //= 1024
+	return p.returncode, peak
+
+class BuildReport:
+	def __init__(self, build_name="top"):
+		self.build_name = build_name
+		self.phases = []
+		self.cache = None
+		self.success = False
+		self.utilization = dict()
+		self.timing = dict()
+
+	def add_phase(self, name, duration, peak_rss=None):
+		self.phases.append({"name": name, "time": duration, "peak_rss_kb": peak_rss})
+
+	# Times a phase run in the build process.
+	@contextmanager
+	def phase(self, name):
+		t_start = time.time()
+		yield
+		self.add_phase(name, time.time() - t_start, _peak_rss_self())
+
+	# Runs and times a phase in a child process, and returns its exit
+	# status.
+	def run_phase(self, name, args, cwd=None):
+		t_start = time.time()
+		r, peak = run_process(args, cwd)
+		self.add_phase(name, time.time() - t_start, peak)
+		return r
+
+	def parse_ise_reports(self, build_dir):
+		mrp_name = os.path.join(build_dir, self.build_name + "_map.mrp")
+		par_name = os.path.join(build_dir, self.build_name + ".par")
+		if os.path.exists(mrp_name):
+			with open(mrp_name, "r") as f:
+				self.utilization = parse_map_report(f.read())
+		if os.path.exists(par_name):
+			with open(par_name, "r") as f:
+				self.timing = parse_par_report(f.read())
+
+	def to_dict(self):
+		return {
+			"build_name": self.build_name,
+			"success": self.success,
+			"phases": self.phases,
+			"cache": self.cache,
+			"utilization": self.utilization,
+			"timing": self.timing
+		}
+
+	def write(self, build_dir):
+		filename = os.path.join(build_dir, self.build_name + "_report.json")
+		with open(filename, "w") as f:
+			json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+		return filename
+
+def _number(s):
+	return int(s.replace(",", ""))
+
+# Parses the design summary of a MAP report (.mrp) into a dictionary
+# mapping resources (e.g. "Slice Registers", "occupied Slices",
+# "RAMB16BWERs", "DSP48A1s") to their used and available counts.
+def parse_map_report(text):
+	r = dict()
+	for m in re.finditer(r"^\s*Number of (.+?):\s+([\d,]+) out of\s+([\d,]+)", text, re.MULTILINE):
+		r[m.group(1)] = {"used": _number(m.group(2)), "available": _number(m.group(3))}
+	return r
+
+def _slack(s):
+	m = re.match(r"\s*(-?[\d.]+)ns", s)
+	return float(m.group(1)) if m else None
+
+# Parses the timing constraint table of a PAR report (.par) into a
+# dictionary mapping constraints (their TS identifier, or their text for
+# unnamed ones) to their worst case slack in ns for each check ("SETUP",
+# "HOLD", "MINPERIOD"...) and whether they are met.
+def parse_par_report(text):
+	r = dict()
+	in_table = False
+	new_row = False
+	current = None
+	for line in text.splitlines():
+		stripped = line.strip()
+		if stripped.startswith("Constraint") and "|" in stripped:
+			in_table = True
+			continue
+		if not in_table:
+			continue
+		if stripped.startswith("---"):
+			new_row = True
+			continue
+		columns = line.split("|")
+		if len(columns) < 3:
+			# end of the table
+			if current is not None and not stripped:
+				in_table = False
+			continue
+		check = columns[1].strip()
+		if new_row:
+			text_column = columns[0].strip()
+			met = not text_column.startswith("*")
+			text_column = text_column.lstrip("* ")
+			if not text_column or not check:
+				# second line of the header
+				continue
+			current = text_column.split(" = ")[0].strip()
+			r[current] = {"met": met}
+			new_row = False
+		if current is not None and check:
+			r[current][check] = _slack(columns[2])
+	return r
+
+# Flags, for each phase and resource, an increase beyond the relative
+# tolerance (phases must also take at least min_time seconds longer),
+# and timing constraints whose slack drops by more than slack_tolerance
+# ns or that are no longer met.
+def compare(old, new, tolerance=0.1, min_time=1.0, slack_tolerance=0.1):
+	r = []
+	old_phases = dict((p["name"], p) for p in old["phases"])
+	for phase in new["phases"]:
+		name = phase["name"]
+		if name not in old_phases:
+			continue
+		o = old_phases[name]
+		if phase["time"] > o["time"]*(1 + tolerance) and phase["time"] - o["time"] >= min_time:
+			r.append("{}: {:.1f}s, was {:.1f}s".format(name, phase["time"], o["time"]))
+		if phase["peak_rss_kb"] is not None and o["peak_rss_kb"] is not None \
+		  and phase["peak_rss_kb"] > o["peak_rss_kb"]*(1 + tolerance):
+			r.append("{}: peak memory {} kB, was {} kB".format(name, phase["peak_rss_kb"], o["peak_rss_kb"]))
+	for resource_name, usage in sorted(new["utilization"].items()):
+		o = old["utilization"].get(resource_name)
+		if o is not None and usage["used"] > o["used"]*(1 + tolerance):
+			r.append("{}: {} used, was {}".format(resource_name, usage["used"], o["used"]))
+	for constraint, checks in sorted(new["timing"].items()):
+		o = old["timing"].get(constraint)
+		if o is None:
+			continue
+		if o["met"] and not checks["met"]:
+			r.append("{}: not met".format(constraint))
+		for check, slack in sorted(checks.items()):
+			if check == "met" or slack is None or o.get(check) is None:
+				continue
+			if slack < o[check] - slack_tolerance:
+				r.append("{} {}: slack {:.3f}ns, was {:.3f}ns".format(constraint, check, slack, o[check]))
+	return r
+
+def _print_report(report):
+	print("{:24} {:>10} {:>14}".format("phase", "time (s)", "peak RSS (kB)"))
+	for phase in report["phases"]:
+		print("{:24} {:>10.1f} {:>14}".format(phase["name"], phase["time"],
+			phase["peak_rss_kb"] if phase["peak_rss_kb"] is not None else "-"))
+
+def main():
+	parser = argparse.ArgumentParser(description="Show and compare build reports")
+	subparsers = parser.add_subparsers(dest="command")
+	parser_show = subparsers.add_parser("show", help="show the phases of a build report")
+	parser_show.add_argument("report")
+	parser_compare = subparsers.add_parser("compare", help="flag regressions between two builds")
+	parser_compare.add_argument("old")
+	parser_compare.add_argument("new")
+	parser_compare.add_argument("--tolerance", type=float, default=0.1,
+		help="allowed relative increase in time, memory and resources (default: 0.1)")
+	parser_compare.add_argument("--min-time", type=float, default=1.0,
+		help="ignore phase time increases shorter than this, in seconds (default: 1)")
+	parser_compare.add_argument("--slack-tolerance", type=float, default=0.1,
+		help="allowed drop in worst case slack, in ns (default: 0.1)")
+	args = parser.parse_args()
+
+	if args.command == "show":
+		with open(args.report, "r") as f:
+			_print_report(json.load(f))
+	elif args.command == "compare":
+		with open(args.old, "r") as f:
+			old = json.load(f)
+		with open(args.new, "r") as f:
+			new = json.load(f)
+		regressions = compare(old, new, args.tolerance, args.min_time, args.slack_tolerance)
+		for regression in regressions:
+			print("Regression: " + regression)
+		if regressions:
+			sys.exit(1)
+	else:
+		parser.print_help()
+
+if __name__ == "__main__":
+	main()
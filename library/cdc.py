@@ -0,0 +1,28 @@
+from migen.fhdl.std import *
+from migen.genlib.cdc import MultiReg, GrayCounter
+from migen.genlib.misc import optree
+
+# Counts pulses on i (in idomain) and presents the count on o (in
+# odomain). The counter crosses clock domains in Gray code, so i may be
+# asserted on every cycle. clear (in odomain) restarts the count from 0.
+class EventCounter(Module):
+	def __init__(self, width, idomain, odomain):
+		self.i = Signal()
+		self.clear = Signal()
+		self.o = Signal(width)
+
+		###
+
+		gc = GrayCounter(width)
+		self.submodules += RenameClockDomains(gc, idomain)
+		self.comb += gc.ce.eq(self.i)
+
+		q_gray = Signal(width)
+		q = Signal(width)
+		base = Signal(width)
+		self.specials += MultiReg(gc.q, q_gray, odomain)
+		self.comb += [q[i].eq(optree("^", [q_gray[j] for j in range(i, width)]))
+			for i in range(width)]
+		sync = getattr(self.sync, odomain)
+		sync += If(self.clear, base.eq(q))
+		self.comb += self.o.eq(q - base)
@@ -60,6 +60,7 @@ TIMESPEC "TSclk_adc" = PERIOD "GRPclk_adc" """+str(float(adc_period))+""" ns HIG
 				Instance.Output("O", freerun_buffered)
 			)
 		sys_period = Fraction(1000, 120)
+		self.sys_clk_freq = float(1000/sys_period)*1e6
 		sys_ratio = Fraction(free_run_period/sys_period)
 		sys_clk_unbuffered = Signal()
 		self.specials += Instance("DCM_CLKGEN",
@@ -0,0 +1,244 @@
+from math import sin, cos, pi
+
+from migen.fhdl.std import *
+from migen.bank.description import *
+from migen.genlib.cdc import MultiReg
+
+# Digital down-converter
+#
+# Complex samples (i, q; for a real input, tie q to 0) are mixed down by
+# an NCO, decimated by a CIC filter of runtime-selectable rate and
+# droop-corrected by a compensating FIR filter. One decimated sample
+# leaves on out_i/out_q each time stb is asserted.
+#
+# The NCO adds frequency to a phase accumulator on every clock and
+# multiplies the input by exp(-j*phase). The CIC output, whose gain is
+# rate**cic_order, is scaled down by 2**shift and saturated to out_bits
+# before the FIR filter. All arithmetic is two's complement.
+#
+# The datapath is in the signal clock domain and starts from a cleared
+# state each time enable is set. Program frequency, rate (1 to max_rate)
+# and shift with enable cleared.
+
+def _nco_table(lut_bits, lut_frac):
+	amplitude = 2**lut_frac - 1
+	r = []
+	for n in range(2**lut_bits):
+		c = int(round(cos(2.0*pi*n/2**lut_bits)*amplitude))
+		s = int(round(sin(2.0*pi*n/2**lut_bits)*amplitude))
+		r.append((c, s))
+	return r
+
+def compensation_taps(ntaps, order, nfrac, cutoff=0.25):
+	"""Designs a linear-phase FIR filter that inverts the passband droop
+	of a CIC filter of the given order up to cutoff (in cycles per
+	output sample) and rejects frequencies above it. Returns the
+	coefficients scaled by 2**nfrac."""
+	m = (ntaps - 1)/2
+	points = 2048
+	h = []
+	for n in range(ntaps):
+		acc = 0.0
+		for k in range(points):
+			f = (k + 0.5)*cutoff/points
+			x = pi*f
+			acc += (x/sin(x))**order*cos(2.0*pi*f*(n - m))
+		window = 0.54 - 0.46*cos(2.0*pi*n/(ntaps - 1))
+		h.append(2.0*acc*cutoff/points*window)
+	gain = sum(h)
+	return [int(round(x/gain*2**nfrac)) for x in h]
+
+def _saturate(o, i, nbits):
+	hi = 2**(nbits-1) - 1
+	lo = -2**(nbits-1)
+	return If(i > hi,
+			o.eq(hi)
+		).Elif(i < lo,
+			o.eq(lo)
+		).Else(
+			o.eq(i)
+		)
+
+class DDC(Module, AutoCSR):
+	def __init__(self, in_bits, out_bits=16, nco_bits=32, lut_bits=10, lut_frac=15,
+	  cic_order=4, max_rate=256, fir_taps=21, fir_frac=16):
+		self.in_bits = in_bits
+		self.out_bits = out_bits
+		self.nco_bits = nco_bits
+		self.lut_bits = lut_bits
+		self.lut_frac = lut_frac
+		self.cic_order = cic_order
+		self.fir_frac = fir_frac
+		self.taps = compensation_taps(fir_taps, cic_order, fir_frac)
+		mix_bits = in_bits + 1
+		cic_bits = mix_bits + cic_order*log2_int(max_rate, False)
+
+		# registers are in the system clock domain
+		self._r_enable = CSRStorage()
+		self._r_frequency = CSRStorage(nco_bits)
+		self._r_rate = CSRStorage(bits_for(max_rate), reset=1)
+		self._r_shift = CSRStorage(bits_for(cic_bits))
+
+		# data interface, in signal clock domain
+		self.i = Signal((in_bits, True))
+		self.q = Signal((in_bits, True))
+		self.out_i = Signal((out_bits, True))
+		self.out_q = Signal((out_bits, True))
+		self.stb = Signal()
+
+		###
+
+		# register controls transferred to signal clock domain
+		enable = Signal()
+		frequency = Signal(nco_bits)
+		rate = Signal(bits_for(max_rate))
+		shift = Signal(bits_for(cic_bits))
+		self.specials += [
+			MultiReg(self._r_enable.storage, enable, "signal"),
+			MultiReg(self._r_frequency.storage, frequency, "signal"),
+			MultiReg(self._r_rate.storage, rate, "signal"),
+			MultiReg(self._r_shift.storage, shift, "signal")
+		]
+
+		# NCO
+		phase = Signal(nco_bits)
+		self.sync.signal += If(enable,
+				phase.eq(phase + frequency)
+			).Else(
+				phase.eq(0)
+			)
+		lut_width = lut_frac + 1
+		lut = Memory(2*lut_width, 2**lut_bits,
+			init=[(c & (2**lut_width - 1)) | ((s & (2**lut_width - 1)) << lut_width)
+				for c, s in _nco_table(lut_bits, lut_frac)])
+		lut_port = lut.get_port(clock_domain="signal")
+		self.specials += lut, lut_port
+		c = Signal((lut_width, True))
+		s = Signal((lut_width, True))
+		self.comb += [
+			lut_port.adr.eq(phase[nco_bits-lut_bits:]),
+			c.eq(lut_port.dat_r[:lut_width]),
+			s.eq(lut_port.dat_r[lut_width:])
+		]
+
+		# mixer: (i + jq)*(c - js)
+		x_i = Signal((in_bits, True))
+		x_q = Signal((in_bits, True))
+		p_ic = Signal((in_bits + lut_width, True))
+		p_qs = Signal((in_bits + lut_width, True))
+		p_qc = Signal((in_bits + lut_width, True))
+		p_is = Signal((in_bits + lut_width, True))
+		mix_i = Signal((mix_bits, True))
+		mix_q = Signal((mix_bits, True))
+		valid = [enable] + [Signal() for n in range(3)]
+		self.sync.signal += [valid[n+1].eq(valid[n]) for n in range(3)]
+		self.sync.signal += [
+			x_i.eq(self.i),
+			x_q.eq(self.q),
+			p_ic.eq(x_i*c),
+			p_qs.eq(x_q*s),
+			p_qc.eq(x_q*c),
+			p_is.eq(x_i*s),
+			mix_i.eq((p_ic + p_qs) >> lut_frac),
+			mix_q.eq((p_qc - p_is) >> lut_frac)
+		]
+
+		# CIC integrators, one per clock
+		integ_i = mix_i
+		integ_q = mix_q
+		for n in range(cic_order):
+			v = Signal()
+			r_i = Signal((cic_bits, True))
+			r_q = Signal((cic_bits, True))
+			self.sync.signal += [
+				v.eq(valid[-1]),
+				If(valid[-1],
+					r_i.eq(r_i + integ_i),
+					r_q.eq(r_q + integ_q)
+				).Else(
+					r_i.eq(0),
+					r_q.eq(0)
+				)
+			]
+			valid.append(v)
+			integ_i = r_i
+			integ_q = r_q
+
+		# decimation: keep the result of every rate-th sample
+		count = Signal(bits_for(max_rate))
+		cic_stb = Signal()
+		self.sync.signal += [
+			cic_stb.eq(0),
+			If(valid[-2],
+				If(count == rate - 1,
+					count.eq(0),
+					cic_stb.eq(1)
+				).Else(
+					count.eq(count + 1)
+				)
+			).Else(
+				count.eq(0)
+			)
+		]
+
+		# CIC combs, one per output sample
+		comb_i = integ_i
+		comb_q = integ_q
+		stb = cic_stb
+		for n in range(cic_order):
+			d_i = Signal((cic_bits, True))
+			d_q = Signal((cic_bits, True))
+			r_i = Signal((cic_bits, True))
+			r_q = Signal((cic_bits, True))
+			next_stb = Signal()
+			self.sync.signal += [
+				next_stb.eq(stb),
+				If(~enable,
+					d_i.eq(0),
+					d_q.eq(0)
+				).Elif(stb,
+					d_i.eq(comb_i),
+					d_q.eq(comb_q),
+					r_i.eq(comb_i - d_i),
+					r_q.eq(comb_q - d_q)
+				)
+			]
+			comb_i = r_i
+			comb_q = r_q
+			stb = next_stb
+
+		# gain adjustment
+		cic_i = Signal((out_bits, True))
+		cic_q = Signal((out_bits, True))
+		fir_stb = Signal()
+		self.sync.signal += [
+			fir_stb.eq(stb),
+			_saturate(cic_i, comb_i >> shift, out_bits),
+			_saturate(cic_q, comb_q >> shift, out_bits)
+		]
+
+		# compensating FIR filter, transposed form
+		acc_bits = out_bits + fir_frac + 2 + bits_for(fir_taps)
+		z_i = [Signal((acc_bits, True)) for h in self.taps]
+		z_q = [Signal((acc_bits, True)) for h in self.taps]
+		for n, h in enumerate(self.taps):
+			if n == fir_taps - 1:
+				next_i = cic_i*h
+				next_q = cic_q*h
+			else:
+				next_i = z_i[n+1] + cic_i*h
+				next_q = z_q[n+1] + cic_q*h
+			self.sync.signal += If(~enable,
+					z_i[n].eq(0),
+					z_q[n].eq(0)
+				).Elif(fir_stb,
+					z_i[n].eq(next_i),
+					z_q[n].eq(next_q)
+				)
+		out_stb = Signal()
+		self.sync.signal += [
+			out_stb.eq(fir_stb),
+			self.stb.eq(out_stb),
+			_saturate(self.out_i, z_i[0] >> fir_frac, out_bits),
+			_saturate(self.out_q, z_q[0] >> fir_frac, out_bits)
+		]
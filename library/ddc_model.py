@@ -0,0 +1,52 @@
+from math import sin, cos, pi
+
+import numpy as np
+
+# Bit-accurate NumPy model of library.ddc.DDC
+
+# must match ddc._nco_table
+def _nco_table(lut_bits, lut_frac):
+	amplitude = 2**lut_frac - 1
+	n = np.arange(2**lut_bits)
+	c = [int(round(cos(2.0*pi*k/2**lut_bits)*amplitude)) for k in n]
+	s = [int(round(sin(2.0*pi*k/2**lut_bits)*amplitude)) for k in n]
+	return np.array(c, dtype=np.int64), np.array(s, dtype=np.int64)
+
+def _saturate(x, nbits):
+	return np.clip(x, -2**(nbits-1), 2**(nbits-1) - 1)
+
+def ddc(i, q, frequency, rate, shift, taps, nco_bits=32, lut_bits=10, lut_frac=15,
+  cic_order=4, out_bits=16, fir_frac=16):
+	"""Returns the real and imaginary parts of the output samples produced
+	by the DDC for the input samples i and q, the first of which enters
+	on the first clock with enable set. taps are the FIR coefficients
+	of the DDC (DDC.taps)."""
+	i = np.asarray(i, dtype=np.int64)
+	q = np.asarray(q, dtype=np.int64)
+
+	# NCO and mixer
+	c_table, s_table = _nco_table(lut_bits, lut_frac)
+	phase = (np.arange(len(i), dtype=np.uint64)*np.uint64(frequency)) % np.uint64(2**nco_bits)
+	index = (phase >> np.uint64(nco_bits - lut_bits)).astype(np.int64)
+	c = c_table[index]
+	s = s_table[index]
+	mix_i = (i*c + q*s) >> lut_frac
+	mix_q = (q*c - i*s) >> lut_frac
+
+	# CIC; integrator overflows cancel in the combs, as in the hardware
+	r = []
+	for x in [mix_i, mix_q]:
+		for n in range(cic_order):
+			x = np.cumsum(x)
+		x = x[rate-1::rate]
+		for n in range(cic_order):
+			x = np.diff(x, prepend=0)
+		r.append(_saturate(x >> shift, out_bits))
+
+	# compensating FIR
+	taps = np.array(taps, dtype=np.int64)
+	out = []
+	for x in r:
+		y = np.convolve(x, taps)[:len(x)]
+		out.append(_saturate(y >> fir_frac, out_bits))
+	return out[0], out[1]
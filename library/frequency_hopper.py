@@ -0,0 +1,214 @@
+from migen.fhdl.std import *
+from migen.bank.description import *
+from migen.genlib.cdc import MultiReg, PulseSynchronizer
+from migen.genlib.fsm import FSM, NextState
+from migen.genlib.record import Record
+
+from library.timestamp import TimestampTag
+
+# Steps the synthesizer and the attenuator through a table of hops, each
+# taking effect on a frame pulse (in signal clock domain, to be connected
+# to the frame_trigger of the DAC) so that hops are aligned to DAC frames.
+#
+# synth and attenuator are the CommandSequencers of the drivers. Each
+# table entry holds, from LSB: the index of a synthesizer register
+# sequence and its enable, an attenuation word and its enable, the dwell
+# time in signal clock cycles before the next hop, and a last flag.
+#
+# Writing a start index to start pulses the first frame lead cycles
+# later. Each hop is programmed from lead cycles before its frame; a frame
+# that comes before programming is complete is still pulsed on time, and
+# counted in missed with its table index in missed_index. lead must be
+# less than the dwell times. The hopper stops after the entry flagged
+# last, or wraps to the start index if loop is set.
+#
+# ev_hop pulses with each frame. With a timestamp (in signal clock
+# domain), the last hop is tagged with its timestamp in hop_time.
+class FrequencyHopper(Module, AutoCSR):
+	def __init__(self, synth, attenuator, depth=64, dwell_bits=32, timestamp=None):
+		layout = [
+			("synth_index", flen(synth.trigger_index)),
+			("synth_en", 1),
+			("attn", flen(attenuator.word)),
+			("attn_en", 1),
+			("dwell", dwell_bits),
+			("last", 1)
+		]
+		entry = Record(layout)
+		self.specials._mem = Memory(flen(entry.raw_bits()), depth)
+
+		# registers are in the system clock domain
+		self._r_start = CSR(bits_for(depth - 1))
+		self._r_stop = CSR()
+		self._r_loop = CSRStorage()
+		self._r_lead = CSRStorage(dwell_bits, reset=256)
+		self._r_running = CSRStatus()
+		self._r_index = CSRStatus(bits_for(depth - 1))
+		self._r_hops = CSRStatus(32)
+		self._r_missed = CSRStatus(32)
+		self._r_missed_index = CSRStatus(bits_for(depth - 1))
+		self._r_clear = CSR()
+		if timestamp is not None:
+			self._r_hop_time = CSRStatus(flen(timestamp))
+
+		# in signal clock domain
+		self.frame = Signal()
+		self.ev_hop = self.frame
+
+		###
+
+		# table
+		index = Signal(max=depth)
+		start_index = Signal(max=depth)
+		port = self._mem.get_port()
+		self.specials += port
+		self.comb += [
+			port.adr.eq(index),
+			entry.raw_bits().eq(port.dat_r)
+		]
+
+		# clock domain crossings
+		ps_start = PulseSynchronizer("sys", "signal")
+		ps_stop = PulseSynchronizer("sys", "signal")
+		ps_request = PulseSynchronizer("signal", "sys")
+		ps_done = PulseSynchronizer("sys", "signal")
+		ps_frame = PulseSynchronizer("signal", "sys")
+		ps_missed = PulseSynchronizer("signal", "sys")
+		self.submodules += ps_start, ps_stop, ps_request, ps_done, ps_frame, ps_missed
+		lead = Signal(dwell_bits)
+		dwell = Signal(dwell_bits)
+		dwell_signal = Signal(dwell_bits)
+		final = Signal()
+		final_signal = Signal()
+		running = Signal()
+		self.specials += [
+			MultiReg(self._r_lead.storage, lead, "signal"),
+			MultiReg(dwell, dwell_signal, "signal"),
+			MultiReg(final, final_signal, "signal"),
+			MultiReg(running, self._r_running.status)
+		]
+		self.comb += [
+			ps_start.i.eq(self._r_start.re),
+			ps_stop.i.eq(self._r_stop.re)
+		]
+
+		# frame timing, in signal clock domain
+		counter = Signal(dwell_bits)
+		ready = Signal()
+		self.comb += [
+			ps_request.i.eq(running & (counter == lead)),
+			self.frame.eq(running & (counter == 0)),
+			ps_frame.i.eq(self.frame),
+			ps_missed.i.eq(self.frame & ~ready & ~ps_done.o)
+		]
+		self.sync.signal += [
+			If(ps_start.o,
+				running.eq(1),
+				counter.eq(lead),
+				ready.eq(0)
+			).Elif(ps_stop.o,
+				running.eq(0)
+			).Elif(running,
+				counter.eq(counter - 1),
+				If(ps_request.i,
+					ready.eq(0)
+				),
+				If(ps_done.o,
+					ready.eq(1)
+				),
+				If(self.frame,
+					ready.eq(0),
+					counter.eq(dwell_signal - 1),
+					If(final_signal,
+						running.eq(0)
+					)
+				)
+			)
+		]
+
+		# programming
+		requested_index = Signal(max=depth)
+		load = Signal()
+		program = Signal()
+		abort = Signal()
+		self.comb += abort.eq(self._r_start.re | self._r_stop.re)
+		fsm = FSM()
+		self.submodules += fsm
+		fsm.act("IDLE",
+			If(ps_request.o & ~abort,
+				load.eq(1),
+				NextState("LOAD")
+			)
+		)
+		# the entry is read on the next cycle
+		fsm.act("LOAD",
+			If(abort,
+				NextState("IDLE")
+			).Else(
+				NextState("PROGRAM")
+			)
+		)
+		fsm.act("PROGRAM",
+			program.eq(1),
+			synth.trigger.eq(entry.synth_en),
+			synth.trigger_index.eq(entry.synth_index),
+			attenuator.push.eq(entry.attn_en),
+			attenuator.word.eq(entry.attn),
+			NextState("WAIT")
+		)
+		fsm.act("WAIT",
+			If(abort,
+				NextState("IDLE")
+			).Elif(~synth.busy & ~attenuator.busy,
+				ps_done.i.eq(1),
+				NextState("IDLE")
+			)
+		)
+		self.sync += [
+			If(self._r_start.re,
+				index.eq(self._r_start.r),
+				start_index.eq(self._r_start.r),
+				final.eq(0)
+			).Else(
+				If(load,
+					requested_index.eq(index)
+				),
+				If(program,
+					dwell.eq(entry.dwell),
+					final.eq(entry.last & ~self._r_loop.storage)
+				),
+				If(ps_done.i,
+					If(entry.last,
+						index.eq(start_index)
+					).Else(
+						index.eq(index + 1)
+					)
+				)
+			)
+		]
+
+		# status
+		self.sync += [
+			If(ps_frame.o,
+				self._r_index.status.eq(requested_index)
+			),
+			If(self._r_clear.re,
+				self._r_hops.status.eq(0),
+				self._r_missed.status.eq(0)
+			).Else(
+				If(ps_frame.o,
+					self._r_hops.status.eq(self._r_hops.status + 1)
+				),
+				If(ps_missed.o,
+					self._r_missed.status.eq(self._r_missed.status + 1),
+					self._r_missed_index.status.eq(requested_index)
+				)
+			)
+		]
+
+		if timestamp is not None:
+			self.submodules.tag = TimestampTag(timestamp)
+			self.comb += [
+				self.tag.i.eq(self.ev_hop),
+				self._r_hop_time.status.eq(self.tag.o)
+			]
@@ -1,17 +1,239 @@
 from migen.fhdl.std import *
 from migen.genlib.cdc import MultiReg, PulseSynchronizer
+from migen.genlib.fifo import AsyncFIFO
+from migen.genlib.fsm import FSM, NextState
 from migen.bus import wishbone
 
+def _increment_address(adr, burst_length, wrap):
+	if wrap:
+		lb = log2_int(burst_length)
+		return adr[:lb].eq(adr[:lb] + 1)
+	else:
+		return adr.eq(adr + 1)
+
+# Synchronous burst access
+#
+# The host latches the start address with ADV_N and then transfers one
+# 16-bit word per GPMC clock, auto-incrementing the address (optionally
+# wrapping within the burst). WAIT is asserted whenever the bridge cannot
+# supply or accept a beat.
+#
+# Reads are prefetched: as soon as the start address reaches the system
+# clock domain, a Wishbone incrementing burst of burst_length reads is
+# issued and its results queued towards the GPMC clock domain. Words prefetched
+# but not consumed by a shorter host access are discarded.
+#
+# Writes are queued together with their address and retired
+# asynchronously on the Wishbone bus. A write beat is taken on each
+# GPMC clock where the host sees WAIT released, up to burst_length beats
+# per access, so that the cycle after ADV_N and the chip select hold
+# cycles are ignored. WAIT is registered, so a beat may still come on
+# the cycle the queue fills: it is held in a skid register, WAIT staying
+# asserted until it is queued.
+class _GPMCBurst(Module):
+	def __init__(self, gpmc_pads, gpmc_d_i, cs_n_pad, burst_length, wrap):
+		self.wishbone = wishbone.Interface(16)
+		self.d_o = Signal(16)
+		self.oe = Signal()
+		self.wait = Signal(reset=1)
+		self.ev_read = Signal()
+		self.ev_write = Signal()
+		self.active = Signal()
+
+		###
+
+		cmd_fifo = AsyncFIFO([("we", 1), ("adr", 26), ("dat", 16)], 2*burst_length)
+		rd_fifo = AsyncFIFO(16, 2*burst_length)
+		self.submodules += RenameClockDomains(cmd_fifo, {"write": "gpmc", "read": "sys"})
+		self.submodules += RenameClockDomains(rd_fifo, {"write": "sys", "read": "gpmc"})
+
+		# GPMC clock domain
+		adr = Signal(26)
+		active = Signal()
+		active_r = Signal()
+		start = Signal()
+		reading = Signal()
+		writing = Signal()
+		read_request = Signal()
+		self.comb += [
+			active.eq(~cs_n_pad & gpmc_pads.ale_n),
+			start.eq(active & ~active_r),
+			reading.eq(active & gpmc_pads.we_n),
+			writing.eq(active & ~gpmc_pads.we_n),
+			self.oe.eq(reading & ~gpmc_pads.oe_n),
+			self.ev_read.eq(start & gpmc_pads.we_n),
+			self.ev_write.eq(start & ~gpmc_pads.we_n),
+			self.active.eq(active)
+		]
+		# write beats
+		write_beats = Signal(max=burst_length+1)
+		beat = Signal()
+		direct = Signal()
+		skid = Signal()
+		skid_next = Signal()
+		skid_adr = Signal(26)
+		skid_dat = Signal(16)
+		self.comb += [
+			beat.eq(writing & ~self.wait & (write_beats != burst_length)),
+			direct.eq(cmd_fifo.writable & ~skid & ~read_request),
+			If(skid,
+				skid_next.eq(~cmd_fifo.writable)
+			).Else(
+				skid_next.eq(beat & ~direct)
+			)
+		]
+		self.sync.gpmc += [
+			active_r.eq(active),
+			If(start & gpmc_pads.we_n,
+				read_request.eq(1)
+			).Elif(cmd_fifo.writable & ~skid,
+				read_request.eq(0)
+			),
+			If(~cs_n_pad & ~gpmc_pads.ale_n,
+				adr.eq(Cat(gpmc_d_i, gpmc_pads.a)),
+				write_beats.eq(0)
+			).Elif(beat,
+				_increment_address(adr, burst_length, wrap),
+				write_beats.eq(write_beats + 1)
+			),
+			skid.eq(skid_next),
+			If(~skid,
+				skid_adr.eq(adr),
+				skid_dat.eq(gpmc_d_i)
+			)
+		]
+
+		# queued commands: skid register first, so that writes stay
+		# ordered with the reads that follow them
+		self.comb += [
+			If(skid,
+				cmd_fifo.din.we.eq(1),
+				cmd_fifo.din.adr.eq(skid_adr),
+				cmd_fifo.din.dat.eq(skid_dat),
+				cmd_fifo.we.eq(1)
+			).Elif(read_request,
+				cmd_fifo.din.adr.eq(adr),
+				cmd_fifo.we.eq(1)
+			).Else(
+				cmd_fifo.din.we.eq(1),
+				cmd_fifo.din.adr.eq(adr),
+				cmd_fifo.din.dat.eq(gpmc_d_i),
+				cmd_fifo.we.eq(beat)
+			)
+		]
+
+		# read beats: discard leftovers of earlier accesses, then present
+		# at most burst_length words to the host
+		beats = Signal(max=burst_length+1)
+		discard = Signal(max=2*burst_length+1)
+		self.comb += rd_fifo.re.eq(rd_fifo.readable & ((discard != 0) | (reading & (beats != 0))))
+		self.sync.gpmc += [
+			If(start & gpmc_pads.we_n,
+				beats.eq(burst_length)
+			).Elif(~active & (beats != 0),
+				beats.eq(0)
+			).Elif(rd_fifo.re & (discard == 0),
+				beats.eq(beats - 1)
+			),
+			If(~active & (beats != 0),
+				discard.eq(discard + beats - rd_fifo.re)
+			).Elif(rd_fifo.re & (discard != 0),
+				discard.eq(discard - 1)
+			),
+			If(rd_fifo.re & (discard == 0),
+				self.d_o.eq(rd_fifo.dout)
+			),
+			If(reading,
+				self.wait.eq(~rd_fifo.readable | (discard != 0) | (beats == 0))
+			).Elif(writing,
+				self.wait.eq(skid_next | ~cmd_fifo.writable)
+			).Else(
+				self.wait.eq(1)
+			)
+		]
+
+		# System clock domain
+		wb_adr = Signal(26)
+		wb_dat = Signal(16)
+		remaining = Signal(max=burst_length+1)
+		load = Signal()
+		next_read = Signal()
+		self.sync += [
+			If(load,
+				wb_adr.eq(cmd_fifo.dout.adr),
+				wb_dat.eq(cmd_fifo.dout.dat),
+				remaining.eq(burst_length)
+			).Elif(next_read,
+				_increment_address(wb_adr, burst_length, wrap),
+				remaining.eq(remaining - 1)
+			)
+		]
+		self.comb += [
+			self.wishbone.adr.eq(wb_adr),
+			self.wishbone.dat_w.eq(wb_dat),
+			self.wishbone.sel.eq(0b11),
+			rd_fifo.din.eq(self.wishbone.dat_r)
+		]
+		if wrap:
+			self.comb += self.wishbone.bte.eq({4: 1, 8: 2, 16: 3}[burst_length])
+
+		fsm = FSM()
+		self.submodules += fsm
+		fsm.act("IDLE",
+			If(cmd_fifo.readable,
+				cmd_fifo.re.eq(1),
+				load.eq(1),
+				If(cmd_fifo.dout.we,
+					NextState("WRITE")
+				).Else(
+					NextState("READ")
+				)
+			)
+		)
+		fsm.act("WRITE",
+			self.wishbone.cyc.eq(1),
+			self.wishbone.stb.eq(1),
+			self.wishbone.we.eq(1),
+			If(self.wishbone.ack, NextState("IDLE"))
+		)
+		fsm.act("READ",
+			self.wishbone.cyc.eq(rd_fifo.writable),
+			self.wishbone.stb.eq(rd_fifo.writable),
+			If(remaining == 1,
+				self.wishbone.cti.eq(0b111)
+			).Else(
+				self.wishbone.cti.eq(0b010)
+			),
+			If(self.wishbone.ack,
+				rd_fifo.we.eq(1),
+				next_read.eq(1),
+				If(remaining == 1, NextState("IDLE"))
+			)
+		)
+
+# For performance counters, ev_read and ev_write pulse at the start of
+# host accesses, active is asserted during their data phase and stall
+# while WAIT is asserted then (all in GPMC clock domain).
 class GPMC(Module):
-	def __init__(self, gpmc_pads, csr_cs_n_pad):
+	def __init__(self, gpmc_pads, csr_cs_n_pad, burst_cs_n_pad=None, burst_length=8, burst_wrap=False):
+		if burst_length not in (4, 8, 16):
+			raise ValueError("Unsupported GPMC burst length: "+str(burst_length))
 		self.wishbone = wishbone.Interface(16)
-		
+		self.ev_read = Signal()
+		self.ev_write = Signal()
+		self.active = Signal()
+		self.stall = Signal()
+
 		###
 
 		self.clock_domains.cd_gpmc = ClockDomain(reset_less=True)
 		self.comb += self.cd_gpmc.clk.eq(gpmc_pads.clk)
+		# without a data pad (e.g. in simulation), the data bus is accessed
+		# through the data triple
 		gpmc_d = TSTriple(16)
-		self.specials += gpmc_d.get_tristate(gpmc_pads.d)
+		self.data = gpmc_d
+		if gpmc_pads.d is not None:
+			self.specials += gpmc_d.get_tristate(gpmc_pads.d)
 
 		# Register address
 		gpmc_ar = Signal(26)
@@ -23,10 +245,12 @@ class GPMC(Module):
 		gpmc_dw_sys = Signal(16)
 		self.specials += MultiReg(gpmc_ar, gpmc_ar_sys), MultiReg(gpmc_d.i, gpmc_dw_sys)
 
-		# Synchronize read data to GPMC domain and drive GPMC data pins
+		# Synchronize read data to GPMC domain
 		gpmc_dr_sys = Signal(16)
-		self.specials += MultiReg(gpmc_dr_sys, gpmc_d.o, "gpmc")
-		self.comb += gpmc_d.oe.eq(~csr_cs_n_pad & ~gpmc_pads.oe_n & gpmc_pads.ale_n)
+		gpmc_dr = Signal(16)
+		gpmc_oe = Signal()
+		self.specials += MultiReg(gpmc_dr_sys, gpmc_dr, "gpmc")
+		self.comb += gpmc_oe.eq(~csr_cs_n_pad & ~gpmc_pads.oe_n & gpmc_pads.ale_n)
 
 		# Generate read/write pulses in sys domain
 		pulse_read = PulseSynchronizer("gpmc", "sys")
@@ -60,12 +284,43 @@ class GPMC(Module):
 		self.comb += self.wishbone.sel.eq(0b11),
 
 		# Generate GPMC wait signal
+		gpmc_wait = Signal()
 		pulse_done = PulseSynchronizer("sys", "gpmc")
 		self.submodules += pulse_done
 		self.comb += pulse_done.i.eq(self.wishbone.ack)
 		self.sync.gpmc += \
 			If(~gpmc_pads.ale_n,
-				gpmc_pads.wait.eq(1)
+				gpmc_wait.eq(1)
 			).Elif(pulse_done.o,
-				gpmc_pads.wait.eq(0)
+				gpmc_wait.eq(0)
 			)
+
+		# Drive GPMC data and wait pins from the selected chip
+		if burst_cs_n_pad is None:
+			self.comb += [
+				gpmc_d.o.eq(gpmc_dr),
+				gpmc_d.oe.eq(gpmc_oe),
+				gpmc_pads.wait.eq(gpmc_wait),
+				self.ev_read.eq(pulse_read.i),
+				self.ev_write.eq(pulse_write.i),
+				self.active.eq(gpmc_active),
+				self.stall.eq(gpmc_active & gpmc_wait)
+			]
+		else:
+			self.submodules.burst = _GPMCBurst(gpmc_pads, gpmc_d.i, burst_cs_n_pad,
+				burst_length, burst_wrap)
+			self.wishbone_burst = self.burst.wishbone
+			self.comb += [
+				If(~burst_cs_n_pad,
+					gpmc_d.o.eq(self.burst.d_o),
+					gpmc_pads.wait.eq(self.burst.wait)
+				).Else(
+					gpmc_d.o.eq(gpmc_dr),
+					gpmc_pads.wait.eq(gpmc_wait)
+				),
+				gpmc_d.oe.eq(gpmc_oe | self.burst.oe),
+				self.ev_read.eq(pulse_read.i | self.burst.ev_read),
+				self.ev_write.eq(pulse_write.i | self.burst.ev_write),
+				self.active.eq(gpmc_active | self.burst.active),
+				self.stall.eq((gpmc_active & gpmc_wait) | (self.burst.active & self.burst.wait))
+			]
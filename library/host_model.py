@@ -0,0 +1,86 @@
+from migen.fhdl.std import *
+from migen.bank.description import *
+
+from library.toplevel import csr_bank_size
+
+# Transaction-level model of the host, for simulating host software
+# against a design built without bus master (e.g. GPMCToplevel with
+# gpmc_bridge=False).
+#
+# program is a generator function taking the host model; it yields to
+# let simulated time advance and accesses registers by their symtab name
+# through the read and write generators (to be used with "yield from"):
+#
+#	def program(host):
+#		yield from host.write("app_wm_size", 512)
+#		busy = yield from host.read("app_wm_busy")
+#
+# CSRStorage and CSRStatus registers are accessed in zero cycles by
+# poking their storage or sampling their status. Plain CSRs, whose
+# accesses have side effects, go through the CSR bus in one cycle.
+# Memories are accessed in zero cycles with read_memory and write_memory.
+# The simulation ends with the program.
+class HostModel(Module):
+	def __init__(self, toplevel, program):
+		toplevel.finalize()
+		self.submodules.toplevel = toplevel
+		self.bus = toplevel.csr_bus
+		data_width = toplevel.csr_data_width
+
+		self._registers = dict()
+		self._memories = dict()
+		for bankarray in toplevel.csrbankarrays:
+			for name, csrs, mapaddr, rmap in bankarray.banks:
+				adr = mapaddr*csr_bank_size//2
+				for c in csrs:
+					self._registers[name + "_" + c.name] = (c, adr)
+					adr += (c.size + data_width - 1)//data_width
+			for name, memory, mapaddr, mmap in bankarray.srams:
+				self._memories[name + "_" + memory.name_override] = memory
+		for name, memory, adr, size in toplevel.native_memories:
+			self._memories[name + "_" + memory.name_override] = memory
+
+		self.program = program(self)
+		self.s = None
+
+	def read(self, name):
+		c, adr = self._registers[name]
+		if isinstance(c, CSRStorage):
+			return self.s.rd(c.storage_full)
+		elif isinstance(c, CSRStatus):
+			return self.s.rd(c.status)
+		else:
+			self.s.wr(self.bus.adr, adr)
+			yield
+			return self.s.rd(self.bus.dat_r)
+
+	def write(self, name, value):
+		c, adr = self._registers[name]
+		if isinstance(c, CSRStorage):
+			self.s.wr(c.storage_full, value)
+		elif isinstance(c, CSR):
+			self.s.wr(self.bus.adr, adr)
+			self.s.wr(self.bus.dat_w, value)
+			self.s.wr(self.bus.we, 1)
+			yield
+		else:
+			raise TypeError("Register " + name + " is read-only")
+
+	def read_memory(self, name, offset=0, count=None):
+		memory = self._memories[name]
+		if count is None:
+			count = memory.depth - offset
+		return [self.s.rd(memory, offset + i) for i in range(count)]
+
+	def write_memory(self, name, values, offset=0):
+		memory = self._memories[name]
+		for i, value in enumerate(values):
+			self.s.wr(memory, value, offset + i)
+
+	def do_simulation(self, s):
+		self.s = s
+		s.wr(self.bus.we, 0)
+		try:
+			next(self.program)
+		except StopIteration:
+			s.interrupt = True
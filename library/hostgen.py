@@ -0,0 +1,178 @@
+# Generates a standalone Python module giving host software typed access
+# to the registers and memories of a design, from its register map.
+#
+# The generated module maps the register space through /dev/mem. Each
+# CSR becomes an attribute of the Device class that assembles (most
+# significant word first) or splits multi-word values. Each memory
+# becomes a zero-copy NumPy view of the mapped words. read_many and
+# write_many coalesce registers at adjacent addresses into single block
+# transfers.
+
+_runtime = '''
+import os, mmap
+
+import numpy as np
+
+class _Register:
+	def __init__(self, name):
+		self.name = name
+
+	def __get__(self, device, owner):
+		if device is None:
+			return self
+		return device.read(self.name)
+
+	def __set__(self, device, value):
+		device.write(self.name, value)
+
+class _Memory:
+	def __init__(self, name):
+		self.name = name
+
+	def __get__(self, device, owner):
+		if device is None:
+			return self
+		return device.memory(self.name)
+
+def _assemble(words):
+	value = 0
+	for word in words:
+		value = (value << 16) | int(word)
+	return value
+
+def _split(value, nwords):
+	return [(value >> 16*(nwords - 1 - i)) & 0xffff for i in range(nwords)]
+
+class _Device:
+	def __init__(self, dev="/dev/mem"):
+		fd = os.open(dev, os.O_RDWR | os.O_SYNC)
+		try:
+			self._mmap = mmap.mmap(fd, SIZE, offset=BASE)
+		finally:
+			os.close(fd)
+		self._words = np.frombuffer(self._mmap, dtype="<u2")
+
+	# The views returned for memories share the mapping: while one of
+	# them is alive, the mapping is left to be released with the last
+	# of them.
+	def close(self):
+		self._words = None
+		try:
+			self._mmap.close()
+		except BufferError:
+			pass
+		self._mmap = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def read(self, name):
+		offset, nwords, bits, writable = REGISTERS[name]
+		return _assemble(self._words[offset:offset+nwords])
+
+	def write(self, name, value):
+		offset, nwords, bits, writable = REGISTERS[name]
+		if not writable:
+			raise AttributeError("Register " + name + " is read-only")
+		# most significant word first
+		self._words[offset:offset+nwords] = _split(value, nwords)
+
+	def memory(self, name):
+		"""Returns a writable view of the memory, of shape (depth,) for
+		memories up to 16 bits wide, or (depth, words) with the most
+		significant word first."""
+		offset, depth, words_per_entry, bits, writable = MEMORIES[name]
+		view = self._words[offset:offset+depth*words_per_entry]
+		if words_per_entry > 1:
+			view = view.reshape(depth, words_per_entry)
+		if not writable:
+			view = view[:]
+			view.flags.writeable = False
+		return view
+
+	def memory_values(self, name):
+		"""Returns a copy of the memory contents as integers."""
+		offset, depth, words_per_entry, bits, writable = MEMORIES[name]
+		words = self._words[offset:offset+depth*words_per_entry].astype(np.uint64)
+		if words_per_entry == 1:
+			return words
+		words = words.reshape(depth, words_per_entry)
+		r = np.zeros(depth, dtype=np.uint64)
+		for i in range(words_per_entry):
+			r = (r << np.uint64(16)) | words[:, i]
+		return r & np.uint64(2**bits - 1)
+
+	def _runs(self, names):
+		regs = sorted((REGISTERS[name][0], REGISTERS[name][1], name) for name in names)
+		runs = []
+		for offset, nwords, name in regs:
+			if runs and runs[-1][1] == offset:
+				runs[-1][1] += nwords
+				runs[-1][2].append((offset, nwords, name))
+			else:
+				runs.append([offset, offset + nwords, [(offset, nwords, name)]])
+		return runs
+
+	def read_many(self, names):
+		"""Reads several registers, with one block transfer per run of
+		adjacent registers, and returns a dictionary of their values."""
+		r = dict()
+		for start, end, regs in self._runs(names):
+			block = self._words[start:end].copy()
+			for offset, nwords, name in regs:
+				r[name] = _assemble(block[offset-start:offset-start+nwords])
+		return r
+
+	def write_many(self, values):
+		"""Writes a dictionary of register values, with one block transfer
+		per run of adjacent registers."""
+		for name in values:
+			if not REGISTERS[name][3]:
+				raise AttributeError("Register " + name + " is read-only")
+		for start, end, regs in self._runs(values.keys()):
+			block = []
+			for offset, nwords, name in regs:
+				block += _split(values[name], nwords)
+			self._words[start:end] = block
+'''
+
+def get_host_module(register_map, base):
+	"""Returns the source of the host module for a register map given as
+	a list of (name, writable, address, length in bytes, kind, bits,
+	depth) tuples, kind being "csr" or "memory"."""
+	end = max(address + length for name, writable, address, length, kind, bits, depth in register_map)
+	registers = []
+	memories = []
+	for name, writable, address, length, kind, bits, depth in register_map:
+		offset = (address - base)//2
+		if kind == "csr":
+			registers.append((name, (offset, length//2, bits, writable)))
+		else:
+			words_per_entry = length//2//depth
+			memories.append((name, (offset, depth, words_per_entry, bits, writable)))
+
+	r = "# Generated by rhino-gateware, do not edit\n"
+	r += _runtime
+	r += "\nBASE = 0x{:08x}\n".format(base)
+	r += "SIZE = 0x{:x}\n".format((end - base + 0xfff) & ~0xfff)
+	r += "\n# name: (word offset, words, bits, writable)\n"
+	r += "REGISTERS = {\n"
+	for name, info in registers:
+		r += "\t{!r}: {!r},\n".format(name, info)
+	r += "}\n"
+	r += "\n# name: (word offset, depth, words per entry, bits, writable)\n"
+	r += "MEMORIES = {\n"
+	for name, info in memories:
+		r += "\t{!r}: {!r},\n".format(name, info)
+	r += "}\n"
+	r += "\nclass Device(_Device):\n"
+	for name, info in registers:
+		r += "\t{} = _Register({!r})\n".format(name, name)
+	for name, info in memories:
+		r += "\t{} = _Memory({!r})\n".format(name, name)
+	if not registers and not memories:
+		r += "\tpass\n"
+	return r
@@ -0,0 +1,62 @@
+import os, sys, struct, subprocess
+
+# Runs the Xilinx ISE implementation flow on the sources written by
+# mibuild with run=False, one tool per phase.
+
+# Returns the latest ISE release installed in ise_path, e.g. "14.7"
+def get_release(ise_path):
+	versions = []
+	for ver in os.listdir(ise_path):
+		if os.path.isdir(os.path.join(ise_path, ver, "ISE_DS")):
+			try:
+				versions.append((tuple(map(int, ver.split("."))), ver))
+			except ValueError:
+				pass
+	if not versions:
+		raise OSError("No ISE installation found in " + ise_path)
+	return max(versions)[1]
+
+def _settings_file(ise_path):
+	bits = struct.calcsize("P")*8
+	return os.path.join(ise_path, get_release(ise_path), "ISE_DS", "settings{}.sh".format(bits))
+
+def get_phases(platform, build_name):
+	opt = lambda name: getattr(platform, name, "")
+	phases = [
+		("xst", "xst -ifn {build_name}.xst"),
+		("ngdbuild", "ngdbuild {ngdbuild_opt} -uc {build_name}.ucf {build_name}.ngc {build_name}.ngd"),
+		("map", "map {map_opt} -o {build_name}_map.ncd {build_name}.ngd {build_name}.pcf"),
+		("par", "par {par_opt} {build_name}_map.ncd {build_name}.ncd {build_name}.pcf"),
+		("bitgen", "bitgen {bitgen_opt} {build_name}.ncd {build_name}.bit")
+	]
+	r = []
+	for name, command in phases:
+		r.append((name, command.format(build_name=build_name,
+			ngdbuild_opt=opt("ngdbuild_opt"), map_opt=opt("map_opt"),
+			par_opt=opt("par_opt"), bitgen_opt=opt("bitgen_opt"))))
+	ise_commands = opt("ise_commands").format(build_name=build_name).strip()
+	if ise_commands:
+		r.append(("ise_commands", ise_commands))
+	return r
+
+def get_options(platform):
+	return dict((name, getattr(platform, name, "")) for name in
+		["device", "xst_opt", "ngdbuild_opt", "map_opt", "par_opt", "bitgen_opt", "ise_commands"])
+
+# With a report (library.build_report.BuildReport), each phase is timed
+# and its peak memory recorded.
+def run_phase(command, build_dir, ise_path="/opt/Xilinx", source=True, report=None, name=None):
+	script = "set -e\n"
+	if source and sys.platform not in ("win32", "cygwin"):
+		script += "source " + _settings_file(ise_path) + "\n"
+	script += command + "\n"
+	if report is None:
+		r = subprocess.call(["bash", "-c", script], cwd=build_dir)
+	else:
+		r = report.run_phase(name or command.split()[0], ["bash", "-c", script], build_dir)
+	if r != 0:
+		raise OSError("ISE command failed: " + command)
+
+def run(platform, build_dir, build_name="top", ise_path="/opt/Xilinx", source=True, report=None):
+	for name, command in get_phases(platform, build_name):
+		run_phase(command, build_dir, ise_path, source, report, name)
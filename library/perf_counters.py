@@ -0,0 +1,166 @@
+from migen.fhdl.std import *
+from migen.bank.description import *
+from migen.genlib.cdc import MultiReg, PulseSynchronizer
+from migen.genlib.misc import optree
+
+from library.cdc import EventCounter
+
+# Performance counters of the host bus
+#
+# On the GPMC side, reads and writes counts host accesses, wait_total
+# the GPMC clock cycles during which they were held by WAIT and wait_max
+# the largest of those counts for a single access (updated at the end
+# of each access).
+#
+# On the Wishbone side, the transactions of the masters (GPMC bridges)
+# are counted in a histogram of their ack latency, the number of cycles
+# from stb to ack: latency0 counts those acked on the first cycle,
+# latencyN (N > 0) those acked after 2**(N-1) to 2**N - 1 cycles, the
+# last bin collecting all the longer ones. Transactions below native_base
+# are counted per CSR bank, each spanning bank_words bus words, in the
+# memory (one 32-bit entry per bank), and the others in native. The
+# per-bank counts are updated with read-modify-write cycles, relying on
+# the CSR bridge not acking on consecutive cycles.
+#
+# While freeze is set, nothing is counted, so that the host reads a
+# consistent snapshot. Writing clear resets all counters; the memory is
+# cleared over as many cycles as it has entries.
+class PerformanceCounters(Module, AutoCSR):
+	def __init__(self, gpmc, masters, native_base, bank_words, latency_bins=8):
+		banks = native_base//bank_words
+		self.specials._mem = Memory(32, banks)
+		self._mem.bus_read_only = True
+
+		self._r_freeze = CSRStorage()
+		self._r_clear = CSR()
+		self._r_reads = CSRStatus(32)
+		self._r_writes = CSRStatus(32)
+		self._r_wait_total = CSRStatus(32)
+		self._r_wait_max = CSRStatus(16)
+		for n in range(latency_bins):
+			name = "latency" + str(n)
+			setattr(self, "_r_" + name, CSRStatus(32, name=name))
+		self._r_native = CSRStatus(32)
+
+		###
+
+		freeze = self._r_freeze.storage
+		clear = self._r_clear.re
+
+		# GPMC accesses, counted in GPMC clock domain
+		freeze_gpmc = Signal()
+		self.specials += MultiReg(freeze, freeze_gpmc, "gpmc")
+		for event, csr in [(gpmc.ev_read, self._r_reads), (gpmc.ev_write, self._r_writes),
+		  (gpmc.stall, self._r_wait_total)]:
+			counter = EventCounter(32, "gpmc", "sys")
+			self.submodules += counter
+			self.comb += [
+				counter.i.eq(event & ~freeze_gpmc),
+				counter.clear.eq(clear),
+				csr.status.eq(counter.o)
+			]
+
+		# wait cycles of each access, reported at its end
+		wait = Signal(16)
+		wait_latched = Signal(16)
+		active_r = Signal()
+		ps_wait = PulseSynchronizer("gpmc", "sys")
+		self.submodules += ps_wait
+		self.comb += ps_wait.i.eq(active_r & ~gpmc.active & ~freeze_gpmc)
+		self.sync.gpmc += [
+			active_r.eq(gpmc.active),
+			If(gpmc.active & ~active_r,
+				wait.eq(gpmc.stall)
+			).Elif(gpmc.stall & (wait != 2**16 - 1),
+				wait.eq(wait + 1)
+			),
+			If(ps_wait.i,
+				wait_latched.eq(wait)
+			)
+		]
+		wait_max = self._r_wait_max.status
+		self.sync += If(clear,
+				wait_max.eq(0)
+			).Elif(ps_wait.o & (wait_latched > wait_max),
+				wait_max.eq(wait_latched)
+			)
+
+		# Wishbone transactions
+		acks = []
+		latencies = []
+		for master in masters:
+			latency = Signal(16)
+			self.sync += If(master.cyc & master.stb & ~master.ack & (latency != 2**16 - 1),
+					latency.eq(latency + 1)
+				).Elif(master.ack | ~master.stb,
+					latency.eq(0)
+				)
+			acks.append(master.cyc & master.stb & master.ack)
+			latencies.append((master, latency))
+		ack = Signal()
+		adr = Signal(flen(masters[0].adr))
+		latency = Signal(16)
+		self.comb += ack.eq(optree("|", acks))
+		for master, master_latency in latencies:
+			self.comb += If(master.ack,
+					adr.eq(master.adr),
+					latency.eq(master_latency)
+				)
+		count = Signal()
+		self.comb += count.eq(ack & ~freeze)
+
+		# latency histogram
+		latency_bin = Signal(max=latency_bins)
+		self.comb += latency_bin.eq(0)
+		for n in range(1, latency_bins):
+			self.comb += If(latency >= 2**(n-1), latency_bin.eq(n))
+		for n in range(latency_bins):
+			status = getattr(self, "_r_latency" + str(n)).status
+			self.sync += If(clear,
+					status.eq(0)
+				).Elif(count & (latency_bin == n),
+					status.eq(status + 1)
+				)
+
+		# per-bank counts
+		native = Signal()
+		self.comb += native.eq(adr[log2_int(native_base):] != 0)
+		self.sync += If(clear,
+				self._r_native.status.eq(0)
+			).Elif(count & native,
+				self._r_native.status.eq(self._r_native.status + 1)
+			)
+		port = self._mem.get_port(write_capable=True)
+		self.specials += port
+		bank_read = Signal(max=banks)
+		bank_write = Signal(max=banks)
+		read = Signal()
+		write = Signal()
+		clearing = Signal()
+		clear_address = Signal(max=banks)
+		self.sync += [
+			bank_read.eq(adr[log2_int(bank_words):log2_int(native_base)]),
+			read.eq(count & ~native & ~clear),
+			bank_write.eq(bank_read),
+			write.eq(read & ~clear),
+			If(clear,
+				clearing.eq(1),
+				clear_address.eq(0)
+			).Elif(clearing,
+				clear_address.eq(clear_address + 1),
+				If(clear_address == banks - 1,
+					clearing.eq(0)
+				)
+			)
+		]
+		self.comb += If(clearing,
+				port.adr.eq(clear_address),
+				port.dat_w.eq(0),
+				port.we.eq(1)
+			).Elif(write,
+				port.adr.eq(bank_write),
+				port.dat_w.eq(port.dat_r + 1),
+				port.we.eq(1)
+			).Else(
+				port.adr.eq(bank_read)
+			)
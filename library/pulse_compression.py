@@ -0,0 +1,369 @@
+from cmath import exp, pi
+
+from migen.fhdl.std import *
+from migen.bank.description import *
+from migen.genlib.cdc import MultiReg, PulseSynchronizer
+
+from library.biplex_fft import BiplexFFT, _Delay
+
+# Pulse compression
+#
+# Both filters correlate a stream of complex samples (i, q, two's
+# complement) with a reference (chirp or code) r of length L, producing
+#   y[n] = sum(conj(r[k])*x[n-L+1+k] for k in range(L))
+# on out_i/out_q, that is, they convolve it with the time-reversed
+# conjugate of the reference. The datapaths are in the signal clock
+# domain.
+
+def _saturate(o, i, nbits):
+	hi = 2**(nbits-1) - 1
+	lo = -2**(nbits-1)
+	return If(i > hi,
+			o.eq(hi)
+		).Elif(i < lo,
+			o.eq(lo)
+		).Else(
+			o.eq(i)
+		)
+
+def _bit_reverse(s):
+	return Cat(*reversed([s[i] for i in range(flen(s))]))
+
+# Direct form matched filter, for short codes
+#
+# The memory holds the reference samples r[0] to r[taps-1] (I in the
+# LSBs, then Q, coef_bits each). Writing load copies it into the taps
+# (busy is set meanwhile). One sample is processed each time stb_i is
+# asserted, and the result, scaled down by 2**shift and saturated to
+# out_bits, leaves on out_i/out_q with stb two cycles later.
+class MatchedFilter(Module, AutoCSR):
+	def __init__(self, in_bits, taps, coef_bits=16, out_bits=16):
+		self.in_bits = in_bits
+		self.taps = taps
+		self.coef_bits = coef_bits
+		self.out_bits = out_bits
+		acc_bits = in_bits + coef_bits + 1 + bits_for(taps)
+		self.specials._mem = Memory(2*coef_bits, taps)
+
+		# registers are in the system clock domain
+		self._r_load = CSR()
+		self._r_busy = CSRStatus()
+		self._r_shift = CSRStorage(bits_for(acc_bits))
+
+		# data interface, in signal clock domain
+		self.i = Signal((in_bits, True))
+		self.q = Signal((in_bits, True))
+		self.stb_i = Signal(reset=1)
+		self.out_i = Signal((out_bits, True))
+		self.out_q = Signal((out_bits, True))
+		self.stb = Signal()
+
+		###
+
+		# register controls transferred to signal clock domain
+		shift = Signal(bits_for(acc_bits))
+		self.specials += MultiReg(self._r_shift.storage, shift, "signal")
+		self.submodules._ps_load = PulseSynchronizer("sys", "signal")
+		self.submodules._ps_loaded = PulseSynchronizer("signal", "sys")
+		self.comb += self._ps_load.i.eq(self._r_load.re)
+		self.sync += [
+			If(self._r_load.re,
+				self._r_busy.status.eq(1)
+			).Elif(self._ps_loaded.o,
+				self._r_busy.status.eq(0)
+			)
+		]
+
+		# coefficients are shifted in from the memory, r[0] first so
+		# that it ends in coef_i[0]/coef_q[0]
+		loading = Signal()
+		shift_in = Signal()
+		load_address = Signal(max=taps)
+		port = self._mem.get_port(clock_domain="signal")
+		self.specials += port
+		self.comb += [
+			port.adr.eq(load_address),
+			self._ps_loaded.i.eq(shift_in & ~loading)
+		]
+		self.sync.signal += [
+			shift_in.eq(loading),
+			If(self._ps_load.o,
+				loading.eq(1),
+				load_address.eq(0)
+			).Elif(loading,
+				load_address.eq(load_address + 1),
+				If(load_address == taps - 1,
+					loading.eq(0)
+				)
+			)
+		]
+		coef_i = [Signal((coef_bits, True)) for k in range(taps)]
+		coef_q = [Signal((coef_bits, True)) for k in range(taps)]
+		shift_chain = [coef_i[-1].eq(port.dat_r[:coef_bits]), coef_q[-1].eq(port.dat_r[coef_bits:])]
+		shift_chain += [coef_i[k].eq(coef_i[k+1]) for k in range(taps - 1)]
+		shift_chain += [coef_q[k].eq(coef_q[k+1]) for k in range(taps - 1)]
+		self.sync.signal += If(shift_in, *shift_chain)
+
+		# transposed form: tap j multiplies by conj(r[taps-1-j])
+		x_i = Signal((in_bits, True))
+		x_q = Signal((in_bits, True))
+		x_stb = Signal()
+		z_stb = Signal()
+		self.sync.signal += [
+			x_stb.eq(self.stb_i),
+			If(self.stb_i,
+				x_i.eq(self.i),
+				x_q.eq(self.q)
+			)
+		]
+		z_i = [Signal((acc_bits, True)) for k in range(taps)]
+		z_q = [Signal((acc_bits, True)) for k in range(taps)]
+		for j in range(taps):
+			c_i = coef_i[taps-1-j]
+			c_q = coef_q[taps-1-j]
+			p_i = x_i*c_i + x_q*c_q
+			p_q = x_q*c_i - x_i*c_q
+			if j == taps - 1:
+				next_i = p_i
+				next_q = p_q
+			else:
+				next_i = z_i[j+1] + p_i
+				next_q = z_q[j+1] + p_q
+			self.sync.signal += If(x_stb,
+					z_i[j].eq(next_i),
+					z_q[j].eq(next_q)
+				)
+		self.sync.signal += [
+			z_stb.eq(x_stb),
+			self.stb.eq(z_stb),
+			If(z_stb,
+				_saturate(self.out_i, z_i[0] >> shift, out_bits),
+				_saturate(self.out_q, z_q[0] >> shift, out_bits)
+			)
+		]
+
+# Returns the spectrum of the time-reversed conjugate of reference (at
+# most N/2 + 1 complex samples) on N bins, as (real, imaginary) pairs
+# scaled by 2**nfrac, for FastMatchedFilter. The spectrum reaches the
+# sum of the magnitudes of the reference samples, which must be scaled
+# for it to fit the coefficients.
+def fft_coefficients(reference, N, nfrac):
+	L = len(reference)
+	h = [reference[L-1-j].conjugate() for j in range(L)]
+	r = []
+	for b in range(N):
+		x = sum(v*exp(-2j*pi*b*n/N) for n, v in enumerate(h))
+		r.append((int(round(x.real*2**nfrac)), int(round(x.imag*2**nfrac))))
+	return r
+
+# Packs the pairs returned by fft_coefficients into the words of the
+# memory of FastMatchedFilter.
+def fft_coefficient_words(coefficients, N, coef_bits):
+	log2N = log2_int(N)
+	mask = 2**coef_bits - 1
+	words = []
+	for k in range(N//2):
+		word = 0
+		for n, j in enumerate([2*k, 2*k + 1]):
+			b = int("{:0{}b}".format(j, log2N)[::-1], 2)
+			re, im = coefficients[b]
+			word |= ((re & mask) | ((im & mask) << coef_bits)) << (2*n*coef_bits)
+		words.append(word)
+	return words
+
+# Fast convolution matched filter, for long chirps
+#
+# Overlap-save with frames of N samples overlapping by half: stream 0 of
+# a BiplexFFT takes the input and stream 1 the input delayed by N/2. The
+# spectra are multiplied by the spectrum of the time-reversed conjugate
+# of the reference, loaded in the memory (see fft_coefficients and
+# fft_coefficient_words; coef_frac is its number of fractional bits),
+# reordered and transformed back by a second BiplexFFT (inverse
+# transform through conjugation). The last N/2 samples of each frame
+# are kept, so the reference holds up to N/2 + 1 samples.
+#
+# The input takes one sample per clock, left-aligned to nbits. The
+# transforms scale by 1/N, so that the output, saturated to nbits, is
+# the correlation scaled by 2**(nbits-in_bits)/N. stb is asserted with
+# valid output samples, one per clock once the pipeline is filled.
+class FastMatchedFilter(Module, AutoCSR):
+	def __init__(self, in_bits, N, nbits=16, nfrac=15, coef_bits=18, coef_frac=12,
+	  butterfly_latency=3):
+		self.in_bits = in_bits
+		self.N = N
+		self.nbits = nbits
+		self.nfrac = nfrac
+		self.coef_bits = coef_bits
+		self.coef_frac = coef_frac
+		log2N = log2_int(N)
+		self.specials._mem = Memory(4*coef_bits, N//2)
+
+		# data interface, in signal clock domain
+		self.i = Signal((in_bits, True))
+		self.q = Signal((in_bits, True))
+		self.out_i = Signal((nbits, True))
+		self.out_q = Signal((nbits, True))
+		self.stb = Signal()
+
+		###
+
+		fft = BiplexFFT(N, nbits, nfrac, butterfly_latency)
+		ifft = BiplexFFT(N, nbits, nfrac, butterfly_latency)
+		delay = _Delay(2*nbits, N//2)
+		self.submodules.fft = RenameClockDomains(fft, "signal")
+		self.submodules.ifft = RenameClockDomains(ifft, "signal")
+		self.submodules.delay = RenameClockDomains(delay, "signal")
+
+		# framing: stream 1 lags stream 0 by half a frame
+		x_i = Signal((nbits, True))
+		x_q = Signal((nbits, True))
+		count = Signal(log2N)
+		self.sync.signal += [
+			x_i.eq(self.i << (nbits - in_bits)),
+			x_q.eq(self.q << (nbits - in_bits)),
+			count.eq(count + 1)
+		]
+		self.comb += [
+			self.fft.dat_i0.real.eq(x_i),
+			self.fft.dat_i0.imag.eq(x_q),
+			self.delay.i.eq(Cat(x_i, x_q)),
+			self.fft.dat_i1.real.eq(self.delay.o[:nbits]),
+			self.fft.dat_i1.imag.eq(self.delay.o[nbits:]),
+			self.fft.sync_i.eq(count == 0)
+		]
+
+		# spectrum multiplication; pair k of a spectrum (bins
+		# bitrev(2k) and bitrev(2k+1)) is multiplied by memory entry k.
+		# The products are conjugated for the inverse transform.
+		c1 = Signal(log2N)
+		cnt1 = Signal(log2N)
+		running1 = Signal()
+		v1 = Signal()
+		self.comb += [
+			If(self.fft.sync_o, c1.eq(0)).Else(c1.eq(cnt1)),
+			v1.eq(running1 | self.fft.sync_o)
+		]
+		self.sync.signal += [
+			cnt1.eq(c1 + 1),
+			If(self.fft.sync_o, running1.eq(1))
+		]
+		coef_port = self._mem.get_port(clock_domain="signal")
+		self.specials += coef_port
+		self.comb += coef_port.adr.eq(c1[:log2N-1])
+		cr = Signal(log2N)
+		vr = Signal()
+		cp = Signal(log2N)
+		vp = Signal()
+		self.sync.signal += [
+			cr.eq(c1),
+			vr.eq(v1),
+			cp.eq(cr),
+			vp.eq(vr)
+		]
+		products = []
+		for n, o in enumerate([self.fft.dat_o0, self.fft.dat_o1]):
+			a_r = Signal((nbits, True))
+			a_i = Signal((nbits, True))
+			h_r = Signal((coef_bits, True))
+			h_i = Signal((coef_bits, True))
+			t_r = Signal((nbits + coef_bits + 1, True))
+			t_i = Signal((nbits + coef_bits + 1, True))
+			y_r = Signal((nbits, True))
+			y_i = Signal((nbits, True))
+			lsb = 2*n*coef_bits
+			self.sync.signal += [
+				a_r.eq(o.real),
+				a_i.eq(o.imag)
+			]
+			self.comb += [
+				h_r.eq(coef_port.dat_r[lsb:lsb+coef_bits]),
+				h_i.eq(coef_port.dat_r[lsb+coef_bits:lsb+2*coef_bits]),
+				t_r.eq(a_r*h_r - a_i*h_i),
+				t_i.eq(-(a_r*h_i + a_i*h_r))
+			]
+			self.sync.signal += [
+				_saturate(y_r, t_r >> coef_frac, nbits),
+				_saturate(y_i, t_i >> coef_frac, nbits)
+			]
+			products += [y_r, y_i]
+
+		# reordering into natural bin order, one memory per spectrum
+		# holding the lower and upper half bins side by side. Bin
+		# bitrev(2k) is bitrev(k) over log2(N)-1 bits, and bitrev(2k+1)
+		# is N/2 more. A frame is read while the next one is written
+		# in the other bank.
+		bank_a = Signal()
+		ready_a = Signal()
+		half = Signal()
+		self.sync.signal += [
+			half.eq(cp[log2N-1]),
+			If(vp & (cp == N - 1),
+				bank_a.eq(~bank_a),
+				ready_a.eq(1)
+			),
+			self.ifft.sync_i.eq(vp & ready_a & (cp == 0))
+		]
+		for n, d in enumerate([self.ifft.dat_i0, self.ifft.dat_i1]):
+			mem = Memory(4*nbits, N)
+			wport = mem.get_port(write_capable=True, clock_domain="signal")
+			rport = mem.get_port(clock_domain="signal")
+			self.specials += mem, wport, rport
+			self.comb += [
+				wport.adr.eq(Cat(_bit_reverse(cp[:log2N-1]), bank_a)),
+				wport.dat_w.eq(Cat(*products)),
+				wport.we.eq(vp & (cp[log2N-1] == n)),
+				rport.adr.eq(Cat(cp[:log2N-1], ~bank_a)),
+				If(half,
+					d.real.eq(rport.dat_r[2*nbits:3*nbits]),
+					d.imag.eq(rport.dat_r[3*nbits:])
+				).Else(
+					d.real.eq(rport.dat_r[:nbits]),
+					d.imag.eq(rport.dat_r[nbits:2*nbits])
+				)
+			]
+
+		# overlap-save: of each frame, the inverse transform of stream s
+		# (frame input time bitrev(2k+1) on dat_o1 of pair k) is kept,
+		# conjugated back, and the frames are reordered into a stream,
+		# stream 1 (the earlier frame) first
+		c2 = Signal(log2N)
+		cnt2 = Signal(log2N)
+		running2 = Signal()
+		v2 = Signal()
+		self.comb += [
+			If(self.ifft.sync_o, c2.eq(0)).Else(c2.eq(cnt2)),
+			v2.eq(running2 | self.ifft.sync_o)
+		]
+		self.sync.signal += [
+			cnt2.eq(c2 + 1),
+			If(self.ifft.sync_o, running2.eq(1))
+		]
+		r_q = Signal((nbits, True))
+		self.comb += If(self.ifft.dat_o1.imag == -2**(nbits-1),
+				r_q.eq(2**(nbits-1) - 1)
+			).Else(
+				r_q.eq(-self.ifft.dat_o1.imag)
+			)
+		bank_b = Signal()
+		ready_b = Signal()
+		valid = Signal()
+		mem = Memory(2*nbits, 2*N)
+		wport = mem.get_port(write_capable=True, clock_domain="signal")
+		rport = mem.get_port(clock_domain="signal")
+		self.specials += mem, wport, rport
+		self.comb += [
+			wport.adr.eq(Cat(_bit_reverse(c2[:log2N-1]), c2[log2N-1], bank_b)),
+			wport.dat_w.eq(Cat(self.ifft.dat_o1.real, r_q)),
+			wport.we.eq(v2),
+			rport.adr.eq(Cat(c2[:log2N-1], ~c2[log2N-1], ~bank_b))
+		]
+		self.sync.signal += [
+			If(v2 & (c2 == N - 1),
+				bank_b.eq(~bank_b),
+				ready_b.eq(1)
+			),
+			valid.eq(v2 & ready_b),
+			self.stb.eq(valid),
+			self.out_i.eq(rport.dat_r[:nbits]),
+			self.out_q.eq(rport.dat_r[nbits:])
+		]
@@ -0,0 +1,52 @@
+import numpy as np
+
+from library.biplex_fft_model import _transform, _bit_reverse
+
+# Bit-accurate NumPy models of library.pulse_compression
+
+def _saturate(x, nbits):
+	return np.clip(x, -2**(nbits-1), 2**(nbits-1) - 1)
+
+def matched_filter(i, q, reference_i, reference_q, shift, out_bits=16):
+	"""Returns the real and imaginary parts of the output samples of a
+	MatchedFilter loaded with the reference, for the input samples i
+	and q (the filter starting from a cleared state)."""
+	x = np.asarray(i, dtype=np.int64) + 1j*np.asarray(q, dtype=np.int64)
+	h = np.conj(np.asarray(reference_i, dtype=np.int64)
+		+ 1j*np.asarray(reference_q, dtype=np.int64))[::-1]
+	y = np.convolve(x, h)[:len(x)]
+	y_i = np.round(y.real).astype(np.int64)
+	y_q = np.round(y.imag).astype(np.int64)
+	return _saturate(y_i >> shift, out_bits), _saturate(y_q >> shift, out_bits)
+
+def fast_matched_filter(i, q, coefficients, N, in_bits, nbits=16, nfrac=15, coef_frac=12):
+	"""Returns the real and imaginary parts of the output samples of a
+	FastMatchedFilter whose memory holds coefficients (as returned by
+	pulse_compression.fft_coefficients), for the input samples i and q,
+	the first of which enters at the start of a frame. One output
+	sample is returned per input sample of the whole frames."""
+	log2N = N.bit_length() - 1
+	frames = len(i)//N
+	x_r = np.asarray(i[:frames*N], dtype=np.int64) << (nbits - in_bits)
+	x_i = np.asarray(q[:frames*N], dtype=np.int64) << (nbits - in_bits)
+	# stream 1 takes the input delayed by half a frame
+	pad = np.zeros(N//2, dtype=np.int64)
+	s1_r = np.concatenate([pad, x_r])[:frames*N]
+	s1_i = np.concatenate([pad, x_i])[:frames*N]
+	order = np.array([_bit_reverse(j, log2N) for j in range(N)])
+	h_r = np.array([coefficients[b][0] for b in order], dtype=np.int64)
+	h_i = np.array([coefficients[b][1] for b in order], dtype=np.int64)
+	kept = []
+	for re, im in [(s1_r, s1_i), (x_r, x_i)]:
+		# spectrum in output order, position j holding bin bitrev(j)
+		a_r, a_i = _transform(re.reshape(frames, N), im.reshape(frames, N), nbits, nfrac)
+		y_r = _saturate((a_r*h_r - a_i*h_i) >> coef_frac, nbits)
+		y_i = _saturate(-(a_r*h_i + a_i*h_r) >> coef_frac, nbits)
+		# back to natural order, then inverse transform by conjugation
+		z_r, z_i = _transform(y_r[:, order], y_i[:, order], nbits, nfrac)
+		z_r, z_i = z_r[:, order], _saturate(-z_i[:, order], nbits)
+		kept.append((z_r[:, N//2:], z_i[:, N//2:]))
+	(k1_r, k1_i), (k0_r, k0_i) = kept
+	out_r = np.concatenate([k1_r, k0_r], axis=1).ravel()
+	out_i = np.concatenate([k1_i, k0_i], axis=1).ravel()
+	return out_r, out_i
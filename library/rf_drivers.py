@@ -3,141 +3,296 @@ from migen.genlib.cdc import MultiReg
 from migen.flow.actor import *
 from migen.bank.description import *
 from migen.genlib.fsm import FSM, NextState
+from migen.genlib.fifo import SyncFIFO
 
-class I2CDataWriter(Module, AutoCSR):
-	def __init__(self, cycle_bits, data_bits):		
-		# I/O signals
-		self.d = Signal(reset=1)
-		self.clk = Signal(reset=1)
-		
-		# control signals
-		self.pds = Signal()
-		self.pdi = Signal(data_bits)
-		
-		self.clk_high = Signal()
-		self.clk_low = Signal()
-		
+# I2C master
+#
+# The quarter SCL period is derived from the system clock frequency and
+# the SCL frequency. A transaction is a start condition and the slave
+# address with the write bit, followed by write_count bytes from the TX
+# FIFO, then (if read_count is not zero) a repeated start and the slave
+# address with the read bit, followed by read_count bytes into the RX
+# FIFO (the last one is not acknowledged), and a stop condition. Without
+# bytes to write, the transaction starts with the read address.
+#
+# A byte not acknowledged by the slave aborts the transaction with a stop
+# condition and sets nack, which is cleared at the next start. The bytes
+# left to write are then dropped from the TX FIFO. Starts are
+# held while hold is asserted, e.g. while another master uses the bus,
+# and active is asserted while the master drives the bus.
+# SDA is driven as open drain.
+#
+# With program_bytes, the program sink also starts write transactions to
+# addr, of program_bytes bytes taken from its payload (MSB first). They
+# are not reported in nack, and do not use the FIFOs. Host starts take
+# precedence.
+class I2CMaster(Module, AutoCSR):
+	def __init__(self, sys_clk_freq, scl_freq=400e3, fifo_depth=16, addr=0, program_bytes=0):
+		if program_bytes:
+			self.program = Sink([("data", 8*program_bytes)])
+		self.sda = TSTriple(reset_o=1, reset_oe=1)
+		self.scl = Signal(reset=1)
+		self.hold = Signal()
 		self.busy = Signal()
-		self.eoc = Signal()
-		self.ev_clk_high = Signal()
-		self.ev_clk_low = Signal()
-		self.ev_data = Signal()
-		self.ev_start = Signal()
-		self.ev_stop_low = Signal()
-		self.ev_stop_high = Signal()
-		
-		# FSM
-		self.submodules.fsm = FSM()
-		
-		# CSRs
-		self._pos_end_cycle = CSRStorage(cycle_bits, reset=300)
-		self._pos_clk_high = CSRStorage(cycle_bits, reset=175)
-		self._pos_data = CSRStorage(cycle_bits, reset=90)
-		self._pos_start = CSRStorage(cycle_bits, reset=200)
-		self._pos_stop_low = CSRStorage(cycle_bits, reset=90)
-		self._pos_stop_high = CSRStorage(cycle_bits, reset=275)
+		# driving the bus
+		self.active = Signal()
 
-		###	
+		self._r_address = CSRStorage(7, reset=addr)
+		self._r_tx_data = CSRStorage(8)
+		self._r_tx_push = CSR()
+		self._r_write_count = CSRStorage(bits_for(fifo_depth))
+		self._r_read_count = CSRStorage(bits_for(fifo_depth))
+		self._r_start = CSR()
+		self._r_rx_data = CSRStatus(8)
+		self._r_rx_pop = CSR()
+		self._r_tx_level = CSRStatus(bits_for(fifo_depth))
+		self._r_rx_level = CSRStatus(bits_for(fifo_depth))
+		self._r_busy = CSRStatus()
+		self._r_nack = CSRStatus()
 
-		# cycle counter and events
-		cycle_counter = Signal(cycle_bits)
-		cycle_counter_reset = Signal()
-		self.comb += self.eoc.eq(cycle_counter == self._pos_end_cycle.storage)
-		self.sync += If(self.eoc | cycle_counter_reset,
-				cycle_counter.eq(0)
-			).Else(
-				cycle_counter.eq(cycle_counter + 1)
-			)
-		
+		###
+
+		# FIFOs
+		tx_fifo = SyncFIFO(8, fifo_depth)
+		rx_fifo = SyncFIFO(8, fifo_depth)
+		self.submodules += tx_fifo, rx_fifo
 		self.comb += [
-			self.ev_clk_high.eq(cycle_counter == self._pos_clk_high.storage),
-			self.ev_clk_low.eq(cycle_counter == self._pos_end_cycle.storage),
-			self.ev_data.eq(cycle_counter == self._pos_data.storage),
-			self.ev_start.eq(cycle_counter == self._pos_start.storage),
-			self.ev_stop_low.eq(cycle_counter == self._pos_stop_low.storage),
-			self.ev_stop_high.eq(cycle_counter == self._pos_stop_high.storage)
+			tx_fifo.din.eq(self._r_tx_data.storage),
+			tx_fifo.we.eq(self._r_tx_push.re),
+			self._r_tx_level.status.eq(tx_fifo.level),
+			self._r_rx_data.status.eq(rx_fifo.dout),
+			rx_fifo.re.eq(self._r_rx_pop.re),
+			self._r_rx_level.status.eq(rx_fifo.level)
 		]
-		
-		# data
-		sr = Signal(data_bits)
-		sr_load = Signal()
-		sr_shift = Signal()
-		data_start = Signal()
-		data_stop_low = Signal()
-		data_stop_high = Signal()
-		remaining_data = Signal(max=data_bits+1)
-		self.sync += If(sr_load,
-				sr.eq(self.pdi),
-				remaining_data.eq(data_bits)
-			).Elif(sr_shift,
-				sr.eq(sr[1:]),
-				self.d.eq(sr[0]),
-				remaining_data.eq(remaining_data-1)
-			).Elif(data_start,
-				self.d.eq(0)
-			).Elif(data_stop_low,
-				self.d.eq(0)
-			).Elif(data_stop_high,
-				self.d.eq(1)
+
+		# quarter period ticks
+		quarter_cycles = max(int(sys_clk_freq/(4*scl_freq) + 0.5), 1)
+		timer = Signal(max=quarter_cycles)
+		tick = Signal()
+		running = Signal()
+		self.comb += tick.eq(timer == 0)
+		self.sync += If(~running | tick,
+				timer.eq(quarter_cycles - 1)
+			).Else(
+				timer.eq(timer - 1)
 			)
-		
-		# clock
-		clk_p = Signal(reset=1)
+		quarter = Signal(2)
+		self.sync += If(~running,
+				quarter.eq(0)
+			).Elif(tick,
+				quarter.eq(quarter + 1)
+			)
+		end_bit = Signal()
+		self.comb += end_bit.eq(tick & (quarter == 3))
+
+		# lines
+		scl = Signal(reset=1)
+		sda = Signal(reset=1)
+		sda_in = Signal()
+		self.specials += MultiReg(self.sda.i, sda_in)
 		self.sync += [
-			If(self.clk_high,
-				clk_p.eq(1)
-			).Elif(self.clk_low,
-				clk_p.eq(0)
-			),
-			self.clk.eq(clk_p)
+			self.scl.eq(scl),
+			self.sda.o.eq(0),
+			self.sda.oe.eq(~sda)
 		]
-		
-		# control FSM
-		self.fsm.act("WAIT_DATA",
-			cycle_counter_reset.eq(1),
-			sr_load.eq(1),
-			If(self.pds, NextState("START_CONDITION"))
-		)
-		self.fsm.act("START_CONDITION",
-			self.busy.eq(1),
-			self.clk_high.eq(self.ev_clk_high),
-			self.clk_low.eq(self.ev_clk_low),
-			data_start.eq(self.ev_start),
-			If(self.eoc, NextState("TRANSFER_DATA"))
-		)
-		self.fsm.act("TRANSFER_DATA",
-			self.busy.eq(1),
-			self.clk_high.eq(self.ev_clk_high),
-			self.clk_low.eq(self.ev_clk_low),
-			sr_shift.eq(self.ev_data),
-			If(self.eoc & (remaining_data[0:3] == 0),
-				NextState("ACK")
+
+		# byte kinds
+		ADDRESS_WRITE, WRITE, ADDRESS_READ, READ = range(4)
+		kind = Signal(2)
+		next_kind = Signal(2)
+		sr = Signal(8)
+		sr_in = Signal(8)
+		bit = Signal(4)
+		write_remaining = Signal(bits_for(max(fifo_depth, program_bytes)))
+		read_remaining = Signal(bits_for(fifo_depth))
+		pending = Signal()
+		# level sampled in the acknowledge bit, set when not acknowledged
+		nack = Signal()
+		transmitting = Signal()
+		self.comb += transmitting.eq(kind != READ)
+
+		load = Signal()
+		load_program = Signal()
+		programming = Signal()
+		start_done = Signal()
+		sample = Signal()
+		next_bit = Signal()
+		byte_done = Signal()
+		fsm = FSM()
+		self.submodules += fsm
+		idle = If(pending & ~self.hold,
+				load.eq(1),
+				NextState("START")
+			)
+		if program_bytes:
+			idle = idle.Elif(self.program.stb & ~self.hold,
+				load_program.eq(1),
+				NextState("START")
+			)
+			self.comb += self.program.ack.eq(load_program)
+		fsm.act("IDLE", idle)
+		# start or repeated start: SDA falls while SCL is high
+		fsm.act("START",
+			running.eq(1),
+			scl.eq(quarter[0] ^ quarter[1]),
+			sda.eq(~quarter[1]),
+			If(end_bit,
+				start_done.eq(1),
+				NextState("BYTE")
 			)
 		)
-		self.fsm.act("ACK",
-			self.busy.eq(1),
-			self.clk_high.eq(self.ev_clk_high),
-			self.clk_low.eq(self.ev_clk_low),
-			If(self.eoc,
-				If(remaining_data == 0,
-					NextState("STOP_CONDITION")
+		# 8 data bits (MSB first) and acknowledge, SCL high in the middle
+		# of each bit
+		fsm.act("BYTE",
+			running.eq(1),
+			scl.eq(quarter[0] ^ quarter[1]),
+			If(bit == 8,
+				If(transmitting,
+					sda.eq(1)
+				).Else(
+					sda.eq(read_remaining == 1)
+				)
+			).Else(
+				If(transmitting,
+					sda.eq(sr[7])
+				).Else(
+					sda.eq(1)
+				)
+			),
+			sample.eq(tick & (quarter == 2)),
+			next_bit.eq(end_bit & (bit != 8)),
+			If(end_bit & (bit == 8),
+				byte_done.eq(1),
+				If(transmitting & nack,
+					NextState("STOP")
+				).Elif((kind == ADDRESS_WRITE) | (kind == WRITE),
+					If(write_remaining == 0,
+						If(read_remaining == 0,
+							NextState("STOP")
+						).Else(
+							NextState("START")
+						)
+					)
+				).Elif(kind == ADDRESS_READ,
+					If(read_remaining == 0,
+						NextState("STOP")
+					)
 				).Else(
-					NextState("TRANSFER_DATA")
+					If(read_remaining == 1,
+						NextState("STOP")
+					)
 				)
 			)
 		)
-		self.fsm.act("STOP_CONDITION",
-			self.busy.eq(1),
-			self.clk_high.eq(self.ev_clk_high),
-			data_stop_low.eq(self.ev_stop_low),
-			data_stop_high.eq(self.ev_stop_high),
-			If(self.eoc, NextState("WAIT_DATA"))
+		# stop: SDA rises while SCL is high
+		fsm.act("STOP",
+			running.eq(1),
+			scl.eq(quarter != 0),
+			sda.eq(quarter[1]),
+			If(end_bit, NextState("IDLE"))
 		)
 
-class BBI2CDataWriter(Module, AutoCSR):
-	def __init__(self, *args, **kwargs):
-		self.submodules.idw = I2CDataWriter(*args, **kwargs)
+		# program payload, shifted out a byte at a time
+		program_sr = Signal(8*max(program_bytes, 1))
+		if program_bytes:
+			self.sync += If(load_program,
+					program_sr.eq(self.program.payload.data)
+				).Elif(byte_done & programming & transmitting & ~nack & (write_remaining != 0),
+					program_sr.eq(program_sr << 8)
+				)
 
+		flushing = Signal()
+		flush = Signal()
+		self.comb += [
+			flush.eq(flushing & (write_remaining != 0) & tx_fifo.readable),
+			tx_fifo.re.eq((byte_done & transmitting & ~nack & (write_remaining != 0) & ~programming) | flush),
+			rx_fifo.din.eq(sr_in),
+			rx_fifo.we.eq(byte_done & (kind == READ))
+		]
+		self.sync += [
+			If(self._r_start.re,
+				pending.eq(1)
+			),
+			If(load,
+				pending.eq(0),
+				write_remaining.eq(self._r_write_count.storage),
+				read_remaining.eq(self._r_read_count.storage),
+				programming.eq(0),
+				self._r_nack.status.eq(0),
+				flushing.eq(0),
+				If(self._r_write_count.storage == 0,
+					next_kind.eq(ADDRESS_READ)
+				).Else(
+					next_kind.eq(ADDRESS_WRITE)
+				)
+			),
+			If(load_program,
+				write_remaining.eq(program_bytes),
+				read_remaining.eq(0),
+				programming.eq(1),
+				flushing.eq(0),
+				next_kind.eq(ADDRESS_WRITE)
+			),
+			# start conditions are followed by the address
+			If(start_done,
+				kind.eq(next_kind),
+				If(programming,
+					sr.eq(addr << 1)
+				).Else(
+					sr.eq(Cat(next_kind == ADDRESS_READ, self._r_address.storage))
+				),
+				bit.eq(0)
+			),
+			If(sample,
+				If(bit == 8,
+					nack.eq(sda_in)
+				).Else(
+					sr_in.eq(Cat(sda_in, sr_in[:7]))
+				)
+			),
+			If(next_bit,
+				sr.eq(sr << 1),
+				bit.eq(bit + 1)
+			),
+			If(byte_done,
+				bit.eq(0),
+				If(transmitting & nack,
+					If(~programming,
+						self._r_nack.status.eq(1),
+						flushing.eq(1)
+					)
+				).Elif(kind == ADDRESS_READ,
+					kind.eq(READ)
+				).Elif(kind == READ,
+					read_remaining.eq(read_remaining - 1)
+				).Elif(write_remaining != 0,
+					kind.eq(WRITE),
+					If(programming,
+						sr.eq(program_sr[-8:])
+					).Else(
+						sr.eq(tx_fifo.dout)
+					),
+					write_remaining.eq(write_remaining - 1)
+				).Else(
+					next_kind.eq(ADDRESS_READ)
+				)
+			),
+			If(flush,
+				write_remaining.eq(write_remaining - 1)
+			)
+		]
+
+		self.comb += [
+			self.active.eq(running),
+			self.busy.eq(pending | load_program | running),
+			self._r_busy.status.eq(self.busy)
+		]
+
+# The I2C bus is driven by bitbanging when bb_enable is set, or else by
+# the I2C master while it is active. The master is held while
+# bitbanging.
+class BBI2CMaster(Module, AutoCSR):
+	def __init__(self, master):
 		self.sda = TSTriple(reset_o=1, reset_oe=1)
 		self.scl = Signal()
 
@@ -154,46 +309,57 @@ class BBI2CDataWriter(Module, AutoCSR):
 				self.sda.oe.eq(self._bb_out.storage[0]),
 				self.sda.o.eq(self._bb_out.storage[1]),
 				self.scl.eq(self._bb_out.storage[2])
+			).Elif(master.active,
+				self.sda.oe.eq(master.sda.oe),
+				self.sda.o.eq(master.sda.o),
+				self.scl.eq(master.scl)
 			).Else(
-				self.sda.oe.eq(1),
-				self.sda.o.eq(self.idw.d),
-				self.scl.eq(self.idw.clk)
+				self.sda.oe.eq(0),
+				self.sda.o.eq(1),
+				self.scl.eq(1)
 			),
+			master.sda.i.eq(self.sda.i),
+			master.hold.eq(self._bb_enable.storage),
 			self._bb_sda_in.status.eq(sda_synced)
 		]
 
 # I2C IO expander
-class PCA9555Driver(BBI2CDataWriter):
-	def __init__(self, pads, cycle_bits=9, addr=0x20):
+#
+# Register writes come from the program sink, and other transactions,
+# such as register reads, from the host, all through the I2C master.
+# sys_clk_freq is the system clock frequency given by the CRG.
+class PCA9555Driver(BBI2CMaster):
+	def __init__(self, pads, sys_clk_freq, addr=0x20, scl_freq=400e3):
 		self.program = Sink([("addr", 8), ("data", 16)])
 		self.busy = Signal()
-		BBI2CDataWriter.__init__(self, cycle_bits, 32)
-		
+		self.submodules.master = I2CMaster(sys_clk_freq, scl_freq, addr=addr, program_bytes=3)
+		BBI2CMaster.__init__(self, self.master)
+
 		###
 
 		self.comb += pads.scl.eq(self.scl)
 		self.specials += self.sda.get_tristate(pads.sda)
-	
-		word = Signal(32)
-		saddr = Signal(7)
+
+		# register address first, then the data MSB first
 		self.comb += [
-			self.idw.pds.eq(self.program.stb),
-			saddr.eq(addr),
-			word.eq(Cat(self.program.payload.data, self.program.payload.addr, 0, saddr)),
-			self.idw.pdi.eq(word[::-1]),
-			self.busy.eq(self.idw.busy)
+			self.master.program.stb.eq(self.program.stb),
+			self.master.program.payload.data.eq(Cat(self.program.payload.data, self.program.payload.addr)),
+			self.program.ack.eq(self.master.program.ack),
+			self.busy.eq(self.master.busy)
 		]
-		self.idw.fsm.act("WAIT_DATA", self.program.ack.eq(1))
-		
+
 class SerialDataWriter(Module, AutoCSR):
 	def __init__(self, cycle_bits, data_bits, def_end_cycle=20):
 		# I/O signals
 		self.d = Signal()
 		self.clk = Signal()
+		self.di = Signal()
 		
 		# control signals
 		self.pds = Signal()
 		self.pdi = Signal(data_bits)
+		# bits sampled on di, first received bit in MSB
+		self.sr_in = Signal(data_bits)
 		
 		self.clk_high = Signal()
 		self.clk_low = Signal()
@@ -234,6 +400,7 @@ class SerialDataWriter(Module, AutoCSR):
 		sr = Signal(data_bits)
 		self.sr_load = Signal()
 		self.sr_shift = Signal()
+		self.sr_sample = Signal()
 		self.remaining_data = Signal(max=data_bits+1)
 		self.sync += If(self.sr_load,
 				sr.eq(self.pdi),
@@ -243,6 +410,9 @@ class SerialDataWriter(Module, AutoCSR):
 				self.d.eq(sr[0]),
 				self.remaining_data.eq(self.remaining_data-1)
 			)
+		self.sync += If(self.sr_sample,
+				self.sr_in.eq(Cat(self.di, self.sr_in[:-1]))
+			)
 		
 		# clock
 		clk_p = Signal()
@@ -270,6 +440,8 @@ class SerialDataWriter(Module, AutoCSR):
 			self.clk_high.eq(self.ev_clk_high),
 			self.clk_low.eq(self.ev_clk_low),
 			self.sr_shift.eq(self.ev_data),
+			# sample at the end of the high clock phase
+			self.sr_sample.eq(self.ev_clk_low),
 			If(self.eoc & (self.remaining_data == 0),
 				*self.end_action
 			)
@@ -345,8 +517,15 @@ class PE43602Driver(Module, AutoCSR):
 			If(ev_le_low, NextState("WAIT_DATA"))
 		)
 
+# SPI master
+#
+# With read_bits, transactions started while read is asserted are reads:
+# the last read_bits bits of the transaction are shifted in (MSB first)
+# from MISO, or from the data line which is released for them when it is
+# bidirectional. read_done pulses at the end of a read transaction, with
+# the result in read_data, also latched into the read_data register.
 class SPIWriter(Module, AutoCSR):
-	def __init__(self, cycle_bits, data_bits, def_end_cycle, bidir_data):
+	def __init__(self, cycle_bits, data_bits, def_end_cycle, bidir_data, read_bits=0):
 		self.submodules.sdw = SerialDataWriter(cycle_bits, data_bits, def_end_cycle)
 		self.sdw.start_action = [NextState("FIRSTCLK")]
 		self.sdw.end_action = [NextState("CSN_HI")]
@@ -360,6 +539,12 @@ class SPIWriter(Module, AutoCSR):
 			self.miso = Signal()
 		
 		self.spi_busy = Signal()
+
+		if read_bits:
+			self.read = Signal()
+			self.read_data = Signal(read_bits)
+			self.read_done = Signal()
+			self._r_read_data = CSRStatus(read_bits)
 		
 		# bitbang control
 		self._bb_enable = CSRStorage()
@@ -382,6 +567,21 @@ class SPIWriter(Module, AutoCSR):
 			csn.eq(csn_p)
 		]
 		
+		# read transactions
+		reading = Signal()
+		release = Signal()
+		if read_bits:
+			self.sync += If(self.sdw.sr_load & self.sdw.pds,
+				reading.eq(self.read)
+			)
+			self.comb += [
+				release.eq(reading & (self.sdw.remaining_data < read_bits)),
+				self.read_data.eq(self.sdw.sr_in[:read_bits])
+			]
+			self.sync += If(self.read_done,
+				self._r_read_data.status.eq(self.read_data)
+			)
+
 		# bitbang
 		if bidir_data:
 			data_in_synced = Signal()
@@ -396,9 +596,12 @@ class SPIWriter(Module, AutoCSR):
 					self.data.o.eq(self.sdw.d),
 					self.csn.eq(csn),
 					self.clk.eq(self.sdw.clk),
-					self.data.oe.eq(1)
+					self.data.oe.eq(~release)
 				)
-			self.comb += self._bb_miso.status.eq(data_in_synced)
+			self.comb += [
+				self._bb_miso.status.eq(data_in_synced),
+				self.sdw.di.eq(data_in_synced)
+			]
 		else:
 			miso_synced = Signal()
 			self.specials += MultiReg(self.miso, miso_synced)
@@ -412,7 +615,8 @@ class SPIWriter(Module, AutoCSR):
 					self.csn.eq(csn),
 					self.clk.eq(self.sdw.clk)
 				),
-				self._bb_miso.status.eq(miso_synced)
+				self._bb_miso.status.eq(miso_synced),
+				self.sdw.di.eq(miso_synced)
 			]
 		
 		# complete FSM
@@ -441,16 +645,28 @@ class SPIWriter(Module, AutoCSR):
 			),
 			self.spi_busy.eq(1)
 		)
+		if read_bits:
+			fsm.act("CSN_HI",
+				self.read_done.eq(reading & self.sdw.eoc)
+			)
 		
 # RFMD's second-generation integrated synthesizer/mixer/modulator devices, e.g.
 # RFMD2081 IQ Modulator with Synthesizer/VCO
 # RFFC5071 Wideband Synthesizer/VCO with Integrated Mixer
 class RFMDISMMDriver(SPIWriter):
-	def __init__(self, pads, cycle_bits=8):
+	def __init__(self, pads, cycle_bits=8, readback_depth=16):
 		self.program = Sink([("addr", 7), ("data", 16)])
 		self.busy = Signal()
 		self.locked = Signal()
-		SPIWriter.__init__(self, cycle_bits, 25, 6, True)
+		SPIWriter.__init__(self, cycle_bits, 25, 6, True, 16)
+
+		# read back count registers from read_first into the readback memory
+		self.specials._mem_readback = Memory(16, readback_depth)
+		self._mem_readback.bus_read_only = True
+		self._r_read_first = CSRStorage(7)
+		self._r_read_count = CSRStorage(bits_for(readback_depth), reset=1)
+		self._r_read = CSR()
+		self._r_read_busy = CSRStatus()
 		
 		###
 
@@ -462,23 +678,60 @@ class RFMDISMMDriver(SPIWriter):
 			pads.enx.eq(self.csn),
 			pads.sclk.eq(self.clk)
 		]
-		self.specials += self.data.get_tristate(pads.sdata)
+		# without a data pad (e.g. in simulation), the data line is accessed
+		# through the data triple
+		if pads.sdata is not None:
+			self.specials += self.data.get_tristate(pads.sdata)
 
+		# readback
+		read_addr = Signal(7)
+		read_index = Signal(max=readback_depth)
+		read_remaining = Signal(max=readback_depth+1)
+		port = self._mem_readback.get_port(write_capable=True)
+		self.specials += port
+		self.comb += [
+			self.read.eq(read_remaining != 0),
+			port.adr.eq(read_index),
+			port.dat_w.eq(self.read_data),
+			port.we.eq(self.read_done),
+			self._r_read_busy.status.eq(self.read)
+		]
+		self.sync += If(self._r_read.re,
+				read_addr.eq(self._r_read_first.storage),
+				read_index.eq(0),
+				read_remaining.eq(self._r_read_count.storage)
+			).Elif(self.read_done,
+				read_addr.eq(read_addr + 1),
+				read_index.eq(read_index + 1),
+				read_remaining.eq(read_remaining - 1)
+			)
+
+		# reads take precedence over programming: the read/write bit
+		# follows the address
 		word = Signal(25)
 		self.comb += [
-			self.sdw.pds.eq(self.program.stb),
-			word.eq(Cat(self.program.payload.data, self.program.payload.addr)),
+			If(self.read,
+				self.sdw.pds.eq(1),
+				word.eq(Cat(Replicate(0, 16), read_addr, 1))
+			).Else(
+				self.sdw.pds.eq(self.program.stb),
+				word.eq(Cat(self.program.payload.data, self.program.payload.addr))
+			),
 			self.sdw.pdi.eq(word[::-1]),
-			self.busy.eq(self.spi_busy)
+			self.busy.eq(self.spi_busy | self.read)
 		]
-		self.sdw.fsm.act("WAIT_DATA", self.program.ack.eq(1))
+		self.sdw.fsm.act("WAIT_DATA", self.program.ack.eq(~self.read))
 
 # Dual variable gain amplifier
 class LMH6521(SPIWriter):
 	def __init__(self, pads, cycle_bits=8):
 		self.program = Sink([("channel", 1), ("gain", 6)])
 		self.busy = Signal()
-		SPIWriter.__init__(self, cycle_bits, 16, 4, False)
+		SPIWriter.__init__(self, cycle_bits, 16, 4, False, 8)
+
+		# read back the gain register of read_channel into read_data
+		self._r_read_channel = CSRStorage()
+		self._r_read = CSR()
 		
 		###
 
@@ -488,16 +741,152 @@ class LMH6521(SPIWriter):
 			pads.sdi.eq(self.mosi),
 			self.miso.eq(pads.sdo),
 		]
+
+		read_pending = Signal()
+		self.sync += If(self._r_read.re,
+				read_pending.eq(1)
+			).Elif(self.read_done,
+				read_pending.eq(0)
+			)
 	
+		# reads take precedence over programming
 		word = Signal(16)
 		self.comb += [
-			self.sdw.pds.eq(self.program.stb),
-			word.eq(Cat(
-				0,
-				self.program.payload.gain,
-				1,
-				self.program.payload.channel)),
+			self.read.eq(read_pending),
+			If(read_pending,
+				self.sdw.pds.eq(1),
+				word.eq(Cat(Replicate(0, 8), self._r_read_channel.storage, Replicate(0, 6), 1))
+			).Else(
+				self.sdw.pds.eq(self.program.stb),
+				word.eq(Cat(
+					0,
+					self.program.payload.gain,
+					1,
+					self.program.payload.channel))
+			),
 			self.sdw.pdi.eq(word[::-1]),
-			self.busy.eq(self.spi_busy)
+			self.busy.eq(self.spi_busy | read_pending)
+		]
+		self.sdw.fsm.act("WAIT_DATA", self.program.ack.eq(~read_pending))
+
+# Feeds the program sink of a driver from a command FIFO or from a
+# preloaded sequence memory.
+#
+# The host pushes commands by writing word (the sink payload, in layout
+# order from LSB) and then push. Sequences are stored in the memory as
+# the payload with a last flag above its MSB. Writing a start index to
+# trigger plays the sequence from that entry to the next entry flagged
+# last, once the FIFO is empty. busy is set until all commands have been
+# programmed and the driver is idle.
+#
+# Other gateware can push commands and trigger sequences in the same way
+# through the push/word and trigger/trigger_index signals, which take
+# precedence over the CSRs.
+class CommandSequencer(Module, AutoCSR):
+	def __init__(self, sink, busy, fifo_depth=16, sequence_depth=64):
+		payload = sink.payload.raw_bits()
+		width = flen(payload)
+		self.specials._mem = Memory(width + 1, sequence_depth)
+
+		self._r_word = CSRStorage(width)
+		self._r_push = CSR()
+		self._r_trigger = CSR(bits_for(sequence_depth - 1))
+		self._r_clear = CSR()
+		self._r_busy = CSRStatus()
+		self._r_level = CSRStatus(bits_for(fifo_depth))
+		self._r_overflow = CSRStatus()
+		self._r_programmed = CSRStatus(32)
+
+		self.push = Signal()
+		self.word = Signal(width)
+		self.trigger = Signal()
+		self.trigger_index = Signal(bits_for(sequence_depth - 1))
+		self.busy = self._r_busy.status
+
+		###
+
+		# command FIFO
+		fifo = SyncFIFO(width, fifo_depth)
+		self.submodules += fifo
+		self.comb += [
+			If(self.push,
+				fifo.din.eq(self.word)
+			).Else(
+				fifo.din.eq(self._r_word.storage)
+			),
+			fifo.we.eq(self.push | self._r_push.re),
+			self._r_level.status.eq(fifo.level)
+		]
+
+		# sequence memory
+		index = Signal(max=sequence_depth)
+		next_index = Signal()
+		pending = Signal()
+		start = Signal()
+		port = self._mem.get_port()
+		self.specials += port
+		self.comb += port.adr.eq(index)
+		self.sync += [
+			If(self.trigger,
+				index.eq(self.trigger_index),
+				pending.eq(1)
+			).Elif(self._r_trigger.re,
+				index.eq(self._r_trigger.r),
+				pending.eq(1)
+			).Else(
+				If(next_index,
+					index.eq(index + 1)
+				),
+				If(start,
+					pending.eq(0)
+				)
+			)
+		]
+
+		# sink control
+		sequencing = Signal()
+		fsm = FSM()
+		self.submodules += fsm
+		fsm.act("IDLE",
+			sink.stb.eq(fifo.readable),
+			payload.eq(fifo.dout),
+			fifo.re.eq(fifo.readable & sink.ack),
+			If(pending & ~fifo.readable,
+				start.eq(1),
+				NextState("LOAD")
+			)
+		)
+		# the entry is read on the next cycle
+		fsm.act("LOAD",
+			sequencing.eq(1),
+			NextState("SEQUENCE")
+		)
+		fsm.act("SEQUENCE",
+			sequencing.eq(1),
+			sink.stb.eq(1),
+			payload.eq(port.dat_r[:width]),
+			If(sink.ack,
+				If(port.dat_r[width],
+					NextState("IDLE")
+				).Else(
+					next_index.eq(1),
+					NextState("LOAD")
+				)
+			)
+		)
+
+		# status
+		self.comb += self._r_busy.status.eq(fifo.readable | pending | sequencing | busy)
+		self.sync += [
+			If(self._r_clear.re,
+				self._r_overflow.status.eq(0),
+				self._r_programmed.status.eq(0)
+			).Else(
+				If(fifo.we & ~fifo.writable,
+					self._r_overflow.status.eq(1)
+				),
+				If(sink.stb & sink.ack,
+					self._r_programmed.status.eq(self._r_programmed.status + 1)
+				)
+			)
 		]
-		self.sdw.fsm.act("WAIT_DATA", self.program.ack.eq(1))
@@ -0,0 +1,100 @@
+from migen.fhdl.std import *
+from migen.bank.description import *
+from migen.genlib.cdc import MultiReg
+from migen.genlib.fifo import AsyncFIFO
+
+from library.cdc import EventCounter
+
+# Continuous capture of a sample stream
+#
+# Samples (in the signal clock domain), optionally decimated by keeping
+# one sample out of every "decimation", cross into the system clock
+# domain through an asynchronous FIFO and are written into a ring buffer
+# memory. The host reads the ring from read_pointer up to write_pointer
+# and then advances read_pointer. When the ring is full, the FIFO fills
+# up and further samples are dropped and counted.
+class StreamCapture(Module, AutoCSR):
+	def __init__(self, width, depth=256, fifo_depth=64, decimation_bits=16):
+		adr_bits = log2_int(depth)
+		self.specials._mem = Memory(width, depth)
+		self._mem.bus_read_only = True
+
+		# registers are in the system clock domain
+		self._r_enable = CSRStorage()
+		self._r_decimation = CSRStorage(decimation_bits, reset=1)
+		self._r_write_pointer = CSRStatus(adr_bits)
+		self._r_read_pointer = CSRStorage(adr_bits)
+		self._r_level = CSRStatus(adr_bits)
+		self._r_high_water = CSRStatus(adr_bits)
+		self._r_dropped = CSRStatus(32)
+		self._r_clear = CSR()
+
+		# data interface, in signal clock domain
+		# (value is a new sample when stb is asserted)
+		self.value = Signal(width)
+		self.stb = Signal(reset=1)
+
+		###
+
+		# register controls transferred to signal clock domain
+		enable = Signal()
+		decimation = Signal(decimation_bits)
+		self.specials += [
+			MultiReg(self._r_enable.storage, enable, "signal"),
+			MultiReg(self._r_decimation.storage, decimation, "signal")
+		]
+
+		# decimate and push into FIFO
+		fifo = AsyncFIFO(width, fifo_depth)
+		self.submodules += RenameClockDomains(fifo, {"write": "signal", "read": "sys"})
+		keep = Signal()
+		decim_counter = Signal(decimation_bits)
+		self.comb += keep.eq(enable & self.stb & (decim_counter == 0))
+		self.sync.signal += \
+			If(~enable,
+				decim_counter.eq(0)
+			).Elif(self.stb,
+				If((decim_counter == decimation - 1) | (decimation == 0),
+					decim_counter.eq(0)
+				).Else(
+					decim_counter.eq(decim_counter + 1)
+				)
+			)
+		self.comb += [
+			fifo.din.eq(self.value),
+			fifo.we.eq(keep)
+		]
+		self.submodules.dropped = EventCounter(32, "signal", "sys")
+		self.comb += [
+			self.dropped.i.eq(keep & ~fifo.writable),
+			self.dropped.clear.eq(self._r_clear.re),
+			self._r_dropped.status.eq(self.dropped.o)
+		]
+
+		# drain FIFO into ring buffer
+		write_pointer = self._r_write_pointer.status
+		level = self._r_level.status
+		high_water = self._r_high_water.status
+		full = Signal()
+		self.comb += [
+			level.eq(write_pointer - self._r_read_pointer.storage),
+			full.eq(level == depth - 1),
+			fifo.re.eq(~full)
+		]
+		mem_port = self._mem.get_port(write_capable=True)
+		self.specials += mem_port
+		self.comb += [
+			mem_port.adr.eq(write_pointer),
+			mem_port.dat_w.eq(fifo.dout),
+			mem_port.we.eq(fifo.readable & ~full)
+		]
+		self.sync += [
+			If(fifo.readable & ~full,
+				write_pointer.eq(write_pointer + 1)
+			),
+			If(self._r_clear.re,
+				high_water.eq(0)
+			).Elif(level > high_water,
+				high_water.eq(level)
+			)
+		]
@@ -0,0 +1,162 @@
+from migen.fhdl.std import *
+from migen.bank.description import *
+from migen.genlib.cdc import MultiReg
+from migen.genlib.fifo import AsyncFIFO
+
+from library.cdc import EventCounter
+
+# Continuous playback of a sample stream fed by the host
+#
+# The host writes entries into a ring buffer memory and then advances
+# write_pointer; the ring is empty when read_pointer reaches it. Each
+# entry holds spc (I, Q) samples, I0 in the LSBs, then Q0, I1, Q1...
+# The ring is read through two ports, so that up to two entries per
+# system clock cycle cross into the signal clock domain through an
+# asynchronous FIFO: the ring is drained faster than the signal clock,
+# which may be the faster one. low is set while the ring holds fewer than low_water entries,
+# for the host to refill it.
+#
+# The consumer takes samples when stb is asserted (in signal clock
+# domain), and each entry is played for "interpolation" of those
+# strobes (zero-order hold), so that the host only has to supply
+# entries at the signal rate divided by interpolation.
+#
+# Once playback is enabled and has started, a new entry needed while the
+# FIFO is empty is an underrun, counted in underruns, and the outputs
+# are zero then or hold the last samples if hold is set. The outputs are
+# zero while playback is disabled.
+class StreamPlayback(Module, AutoCSR):
+	def __init__(self, width, spc, depth=1024, fifo_depth=64, interpolation_bits=16):
+		adr_bits = log2_int(depth)
+		entry_width = 2*width*spc
+		self.specials._mem = Memory(entry_width, depth)
+
+		# registers are in the system clock domain
+		self._r_enable = CSRStorage()
+		self._r_hold = CSRStorage()
+		self._r_interpolation = CSRStorage(interpolation_bits, reset=1)
+		self._r_write_pointer = CSRStorage(adr_bits)
+		self._r_read_pointer = CSRStatus(adr_bits)
+		self._r_level = CSRStatus(adr_bits)
+		self._r_low_water = CSRStorage(adr_bits, reset=depth//4)
+		self._r_low = CSRStatus()
+		self._r_underruns = CSRStatus(32)
+		self._r_clear = CSR()
+
+		# data interface, in signal clock domain
+		self.stb = Signal(reset=1)
+		for i in range(spc):
+			name = "value_i" + str(i)
+			setattr(self, name, Signal(width, name=name))
+			name = "value_q" + str(i)
+			setattr(self, name, Signal(width, name=name))
+
+		###
+
+		# register controls transferred to signal clock domain, and back
+		# to the system clock domain once playback is enabled there, so
+		# that no entry reaches the FIFO before it is played
+		enable = Signal()
+		enabled = Signal()
+		hold = Signal()
+		interpolation = Signal(interpolation_bits)
+		self.specials += [
+			MultiReg(self._r_enable.storage, enable, "signal"),
+			MultiReg(enable, enabled),
+			MultiReg(self._r_hold.storage, hold, "signal"),
+			MultiReg(self._r_interpolation.storage, interpolation, "signal")
+		]
+
+		# fill FIFO from ring buffer, with the entry at the read pointer
+		# and the next one when the ring holds it
+		fifo = AsyncFIFO([("first", entry_width), ("second", entry_width), ("pair", 1)], fifo_depth)
+		self.submodules += RenameClockDomains(fifo, {"write": "sys", "read": "signal"})
+		read_pointer = self._r_read_pointer.status
+		level = self._r_level.status
+		pair = Signal()
+		self.comb += [
+			level.eq(self._r_write_pointer.storage - read_pointer),
+			self._r_low.status.eq(level < self._r_low_water.storage),
+			fifo.we.eq(self._r_enable.storage & enabled & (level != 0) & fifo.writable),
+			pair.eq(level >= 2)
+		]
+		# the ports are addressed with the next read pointer so that they
+		# present the entries at the read pointer and after it
+		next_read_pointer = Signal(adr_bits)
+		next_read_pointer_1 = Signal(adr_bits)
+		first_port = self._mem.get_port()
+		second_port = self._mem.get_port()
+		self.specials += first_port, second_port
+		self.comb += [
+			If(fifo.we & pair,
+				next_read_pointer.eq(read_pointer + 2)
+			).Elif(fifo.we,
+				next_read_pointer.eq(read_pointer + 1)
+			).Else(
+				next_read_pointer.eq(read_pointer)
+			),
+			next_read_pointer_1.eq(next_read_pointer + 1),
+			first_port.adr.eq(next_read_pointer),
+			second_port.adr.eq(next_read_pointer_1),
+			fifo.din.first.eq(first_port.dat_r),
+			fifo.din.second.eq(second_port.dat_r),
+			fifo.din.pair.eq(pair)
+		]
+		self.sync += read_pointer.eq(next_read_pointer)
+
+		# take entries from FIFO (entries left when playback is disabled
+		# are dropped)
+		interpolation_counter = Signal(interpolation_bits)
+		take = Signal()
+		second = Signal()
+		started = Signal()
+		underrun = Signal()
+		entry = Signal(entry_width)
+		self.comb += [
+			take.eq(enable & self.stb & (interpolation_counter == 0)),
+			fifo.re.eq(~enable | (take & (second | ~fifo.dout.pair))),
+			underrun.eq(take & started & ~fifo.readable),
+			If(second,
+				entry.eq(fifo.dout.second)
+			).Else(
+				entry.eq(fifo.dout.first)
+			)
+		]
+		self.sync.signal += [
+			If(~enable,
+				interpolation_counter.eq(0)
+			).Elif(self.stb,
+				If((interpolation_counter == interpolation - 1) | (interpolation == 0),
+					interpolation_counter.eq(0)
+				).Else(
+					interpolation_counter.eq(interpolation_counter + 1)
+				)
+			),
+			If(~enable,
+				second.eq(0)
+			).Elif(take & fifo.readable,
+				second.eq(~second & fifo.dout.pair)
+			),
+			If(~enable,
+				started.eq(0)
+			).Elif(fifo.readable,
+				started.eq(1)
+			)
+		]
+		self.submodules.underruns = EventCounter(32, "signal", "sys")
+		self.comb += [
+			self.underruns.i.eq(underrun),
+			self.underruns.clear.eq(self._r_clear.re),
+			self._r_underruns.status.eq(self.underruns.o)
+		]
+		for n in range(spc):
+			value_i = getattr(self, "value_i" + str(n))
+			value_q = getattr(self, "value_q" + str(n))
+			lsb = 2*n*width
+			self.sync.signal += If(take & fifo.readable,
+					value_i.eq(entry[lsb:lsb+width]),
+					value_q.eq(entry[lsb+width:lsb+2*width])
+				).Elif(~enable | (take & ~hold),
+					value_i.eq(0),
+					value_q.eq(0)
+				)
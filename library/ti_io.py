@@ -151,6 +151,9 @@ class _BaseDAC(Module, AutoCSR):
 		self._r_test_pattern_q1 = CSRStorage(width, reset=0xAAC6)
 		self._r_pulse_frame = CSR()
 
+		# pulses the frame signal like pulse_frame, in signal clock domain
+		self.frame_trigger = Signal()
+
 		# register data transferred to signal clock domain
 		self._data_en = Signal()
 		self._test_pattern_en = Signal()
@@ -166,7 +169,7 @@ class _BaseDAC(Module, AutoCSR):
 		self.submodules += ps
 		self.comb += [
 			ps.i.eq(self._r_pulse_frame.re),
-			self._pulse_frame.eq(ps.o)
+			self._pulse_frame.eq(ps.o | self.frame_trigger)
 		]
 		self.specials += {
 			MultiReg(self._r_data_en.storage, self._data_en, "signal"),
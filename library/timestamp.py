@@ -0,0 +1,103 @@
+from migen.fhdl.std import *
+from migen.bank.description import *
+from migen.genlib.cdc import MultiReg, PulseSynchronizer
+
+from library.cdc import EventCounter
+
+# Latches a timestamp (in signal clock domain) when i is asserted, and
+# presents it on o (in system clock domain) a few cycles later. Events
+# must be further apart than the synchronization latency (one signal
+# clock cycle and four system clock cycles): closer events are dropped,
+# or their timestamps corrupted.
+class TimestampTag(Module):
+	def __init__(self, timestamp):
+		self.i = Signal()
+		self.o = Signal(flen(timestamp))
+
+		###
+
+		latched = Signal(flen(timestamp))
+		self.sync.signal += If(self.i, latched.eq(timestamp))
+		ps = PulseSynchronizer("signal", "sys")
+		self.submodules += ps
+		self.comb += ps.i.eq(self.i)
+		self.sync += If(ps.o, self.o.eq(latched))
+
+# Counts signal clock cycles (samples) for aligning captures across
+# boards
+#
+# pps is an external trigger or PPS input (asynchronous). On each of its
+# rising edges, the count is latched into pps_time and pps_count is
+# incremented. Writing arm_reset resets the count to 0 on the next PPS
+# edge (armed is cleared then), so that boards armed before a shared
+# PPS count in step. Writing reset resets the count immediately, and
+# writing snapshot latches the current count into time.
+class Timestamp(Module, AutoCSR):
+	def __init__(self, width=64):
+		self.pps = Signal()
+		# in signal clock domain
+		self.value = Signal(width)
+
+		# registers are in the system clock domain
+		self._r_reset = CSR()
+		self._r_arm_reset = CSR()
+		self._r_armed = CSRStatus()
+		self._r_snapshot = CSR()
+		self._r_time = CSRStatus(width)
+		self._r_pps_time = CSRStatus(width)
+		self._r_pps_count = CSRStatus(32)
+
+		###
+
+		# PPS edges
+		pps = Signal()
+		pps_d = Signal()
+		pps_edge = Signal()
+		self.specials += MultiReg(self.pps, pps, "signal")
+		self.sync.signal += pps_d.eq(pps)
+		self.comb += pps_edge.eq(pps & ~pps_d)
+
+		# reset controls
+		ps_reset = PulseSynchronizer("sys", "signal")
+		ps_pps_reset = PulseSynchronizer("signal", "sys")
+		self.submodules += ps_reset, ps_pps_reset
+		armed = Signal()
+		pps_reset = Signal()
+		self.specials += MultiReg(self._r_armed.status, armed, "signal")
+		self.comb += [
+			ps_reset.i.eq(self._r_reset.re),
+			pps_reset.eq(pps_edge & armed),
+			ps_pps_reset.i.eq(pps_reset)
+		]
+		self.sync += If(self._r_arm_reset.re,
+				self._r_armed.status.eq(1)
+			).Elif(ps_pps_reset.o,
+				self._r_armed.status.eq(0)
+			)
+
+		# counter
+		self.sync.signal += If(ps_reset.o | pps_reset,
+				self.value.eq(0)
+			).Else(
+				self.value.eq(self.value + 1)
+			)
+
+		# time of PPS edges and snapshots
+		self.submodules.pps_tag = TimestampTag(self.value)
+		self.comb += [
+			self.pps_tag.i.eq(pps_edge),
+			self._r_pps_time.status.eq(self.pps_tag.o)
+		]
+		self.submodules.pps_counter = EventCounter(32, "signal", "sys")
+		self.comb += [
+			self.pps_counter.i.eq(pps_edge),
+			self._r_pps_count.status.eq(self.pps_counter.o)
+		]
+		ps_snapshot = PulseSynchronizer("sys", "signal")
+		self.submodules += ps_snapshot
+		self.submodules.snapshot_tag = TimestampTag(self.value)
+		self.comb += [
+			ps_snapshot.i.eq(self._r_snapshot.re),
+			self.snapshot_tag.i.eq(ps_snapshot.o),
+			self._r_time.status.eq(self.snapshot_tag.o)
+		]
@@ -4,16 +4,29 @@ from itertools import count
 from migen.fhdl.simplify import FullMemoryWE
 from migen.bank import csrgen
 from migen.bank.description import *
+from migen.genlib.misc import optree
 from migen.bus import csr, wishbone, wishbone2csr
 from mibuild.tools import write_to_file
 
 from library.gpmc import GPMC
+from library.wishbone_sram import WishboneSRAM, WishboneDefaultSlave
+from library.perf_counters import PerformanceCounters
+from library import ise, hostgen
+from library.build_report import BuildReport
 
 BOF_PERM_READ = 0x01
 BOF_PERM_WRITE = 0x02
 
 csr_data_width = 16
 
+# Bus words below native_base are decoded by the CSR banks, each bank
+# spanning csr_bank_size bytes. Memories flagged bus_native, and memories
+# too large for a bank, are served in power-of-two aligned windows above
+# it by native Wishbone slaves instead of through the CSR bridge. Other
+# addresses are acknowledged by a default slave, and read as 0.
+native_base = 2**14
+csr_bank_size = 0x400
+
 class GenericToplevel(Module):
 	def __init__(self, csr_data_width, mkbof_hwrtyp, mibuild_platform, app_toplevel_class):
 		self.csr_data_width = csr_data_width
@@ -21,13 +34,29 @@ class GenericToplevel(Module):
 		self.mibuild_platform = mibuild_platform
 		self._adr_generator = count()
 		self._adr_fixed = dict()
+		self._native_adr = native_base
+		self.native_memories = []
 		self.masters = []
 
 		self.submodules.app = app_toplevel_class(self)
-		self.submodules.csrbankarray = csrgen.BankArray(self.app,
-			self.request_address, data_width=self.csr_data_width)
+		self.csrbankarrays = []
+		self.csrbankarray = self.add_csrbankarray(self.app)
+
+	# Maps the registers and memories of the AutoCSR attributes of source
+	# in banks of their own
+	def add_csrbankarray(self, source):
+		bankarray = csrgen.BankArray(source, self.request_address, data_width=self.csr_data_width)
+		self.submodules += bankarray
+		self.csrbankarrays.append(bankarray)
+		return bankarray
 	
+	def _words_per_entry(self, memory):
+		return 2**log2_int((memory.width + self.csr_data_width - 1)//self.csr_data_width, False)
+
 	def request_address(self, name, memory=None):
+		if memory is not None and (getattr(memory, "bus_native", False)
+		  or 2*self._words_per_entry(memory)*memory.depth > csr_bank_size):
+			return self.request_native_address(name, memory)
 		try:
 			return self._adr_fixed[(name, memory)]
 		except KeyError:
@@ -35,6 +64,14 @@ class GenericToplevel(Module):
 			self._adr_fixed[(name, memory)] = adr
 			return adr
 
+	def request_native_address(self, name, memory):
+		size = 2**log2_int(self._words_per_entry(memory)*memory.depth, False)
+		adr = (self._native_adr + size - 1) & ~(size - 1)
+		self._native_adr = adr + size
+		self.native_memories.append((name, memory, adr, size))
+		# not mapped in the CSR banks
+		return None
+
 	def request_master(self, master=None):
 		if master is None:
 			master = wishbone.Interface(self.csr_data_width)
@@ -42,15 +79,36 @@ class GenericToplevel(Module):
 		return master
 
 	def do_finalize(self):
-		csr_bus = csr.Interface(self.csr_data_width)
+		self.csr_bus = csr.Interface(self.csr_data_width)
+		buses = []
+		for bankarray in self.csrbankarrays:
+			buses += bankarray.get_buses()
+		self.submodules.csrcon = csr.Interconnect(self.csr_bus, buses)
+		if not self.masters:
+			# the CSR bus is left to a transaction-level host model
+			# (library.host_model)
+			return
 		wb_bus = wishbone.Interface(self.csr_data_width)
-		self.submodules.csrcon = csr.Interconnect(csr_bus, self.csrbankarray.get_buses())
-		self.submodules.wishbone2csr = wishbone2csr.WB2CSR(wb_bus, csr_bus)
-		self.submodules.wishbonecon = wishbone.InterconnectShared(self.masters, [(lambda a: 1, wb_bus)])
+		self.submodules.wishbone2csr = wishbone2csr.WB2CSR(wb_bus, self.csr_bus)
+		slaves = [(lambda a: a[log2_int(native_base):] == 0, wb_bus)]
+		for name, memory, adr, size in self.native_memories:
+			sram = WishboneSRAM(memory, getattr(memory, "bus_read_only", False),
+				wishbone.Interface(self.csr_data_width))
+			self.submodules += sram
+			slaves.append((lambda a, adr=adr, size=size: a[log2_int(size):] == adr//size, sram.bus))
+		# unmapped addresses
+		decoders = [decoder for decoder, bus in slaves]
+		default = WishboneDefaultSlave(wishbone.Interface(self.csr_data_width))
+		self.submodules += default
+		slaves.append((lambda a: ~optree("|", [decoder(a) for decoder in decoders]), default.bus))
+		self.submodules.wishbonecon = wishbone.InterconnectShared(self.masters, slaves)
 
 	def get_symtab(self):
 		raise NotImplementedError("GenericToplevel.get_symtab must be overloaded")
 
+	def get_host_module(self):
+		raise NotImplementedError("GenericToplevel.get_host_module must be overloaded")
+
 	def get_formatted_symtab(self):
 		symtab = self.get_symtab()
 		r = ""
@@ -58,39 +116,145 @@ class GenericToplevel(Module):
 			r += "{}\t{}\t0x{:08x}\t0x{:x}\n".format(*s)
 		return r
 
-	def build(self):
-		# FIXME: Workaround for Xst bug with byte-wide WEs connected to FSMs
-		self.mibuild_platform.build(FullMemoryWE(self))
-		symtab = self.get_formatted_symtab()
-		os.chdir("build")
-		build_name = "top"
-		write_to_file(build_name + ".symtab", symtab)
+	def run_mkbof(self, build_dir, build_name, report=None):
 		bof_name = build_name + ".bof"
-		r = subprocess.call(["mkbof",
+		args = ["mkbof",
 			"-t", str(self.mkbof_hwrtyp),
 			"-s", build_name + ".symtab",
 			"-o", bof_name,
-			build_name + ".bin"])
+			build_name + ".bin"]
+		if report is None:
+			r = subprocess.call(args, cwd=build_dir)
+		else:
+			r = report.run_phase("mkbof", args, build_dir)
 		if r != 0:
 			raise OSError("mkbof failed")
+		bof_name = os.path.join(build_dir, bof_name)
 		st = os.stat(bof_name)
 		os.chmod(bof_name, st.st_mode | stat.S_IEXEC | stat.S_IXGRP | stat.S_IXOTH)
-		os.chdir("..")
 
+	# Each phase is timed in report (a BuildReport, created if not given
+	# and written to the build directory), which make.py creates to time
+	# the elaboration of the toplevel as well.
+	def build(self, build_dir="build", cache=None, ise_path="/opt/Xilinx", report=None):
+		build_name = "top"
+		if report is None:
+			report = BuildReport(build_name)
+		if not os.path.isdir(build_dir):
+			os.makedirs(build_dir)
+		try:
+			self._build(build_dir, build_name, cache, ise_path, report)
+			report.success = True
+		finally:
+			report.write(build_dir)
+
+	# Elaborates the design and writes its sources to the build directory
+	# without running the toolchain, then returns the problems found in
+	# the register map (make.py --watch).
+	def check(self, build_dir="build", report=None):
+		build_name = "top"
+		if report is None:
+			report = BuildReport(build_name)
+		if not os.path.isdir(build_dir):
+			os.makedirs(build_dir)
+		self._generate(build_dir, build_name, "/opt/Xilinx", report)
+		with report.phase("check"):
+			return self.check_register_map()
+
+	def check_register_map(self):
+		r = []
+		for bankarray in self.csrbankarrays:
+			for name, csrs, mapaddr, rmap in bankarray.banks:
+				if csr_bank_size*(mapaddr + 1) > 2*native_base:
+					r.append("CSR bank {} overlaps the native bus window".format(name))
+			for name, memory, mapaddr, mmap in bankarray.srams:
+				if csr_bank_size*(mapaddr + 1) > 2*native_base:
+					r.append("memory {} overlaps the native bus window".format(name))
+		symtab = sorted(self.get_symtab(), key=lambda s: s[2])
+		names = set()
+		for name, permission, address, length in symtab:
+			if name in names:
+				r.append("duplicate symbol " + name)
+			names.add(name)
+		for (name_a, permission_a, address_a, length_a), (name_b, permission_b, address_b, length_b) \
+		  in zip(symtab, symtab[1:]):
+			if address_a + length_a > address_b:
+				r.append("{} overlaps {}".format(name_a, name_b))
+		return r
+
+	def _generate(self, build_dir, build_name, ise_path, report):
+		with report.phase("finalize"):
+			self.finalize()
+		# FIXME: Workaround for Xst bug with byte-wide WEs connected to FSMs
+		with report.phase("full_memory_we"):
+			fragment = FullMemoryWE(self).get_fragment()
+		with report.phase("verilog"):
+			self.mibuild_platform.build(fragment, build_dir=build_dir,
+				build_name=build_name, ise_path=ise_path, run=False)
+
+	def _build(self, build_dir, build_name, cache, ise_path, report):
+		self._generate(build_dir, build_name, ise_path, report)
+		symtab = self.get_formatted_symtab()
+		write_to_file(os.path.join(build_dir, build_name + ".symtab"), symtab)
+		write_to_file(os.path.join(build_dir, build_name + "_host.py"), self.get_host_module())
+		if cache is not None:
+			key = cache.get_key(self.mibuild_platform, build_dir, build_name, symtab, self.mkbof_hwrtyp, ise_path)
+			report.cache = {"key": key, "hit": False}
+			if cache.restore(key, build_dir):
+				print("Restored build artifacts from cache (" + key + ")")
+				report.cache["hit"] = True
+				report.parse_ise_reports(build_dir)
+				return
+		ise.run(self.mibuild_platform, build_dir, build_name, ise_path, report=report)
+		report.parse_ise_reports(build_dir)
+		self.run_mkbof(build_dir, build_name, report)
+		if cache is not None:
+			cache.store(key, build_dir, build_name)
+
+# gpmc_burst_cs selects an additional GPMC chip select that is served
+# in synchronous burst mode, next to the asynchronous chip select 0.
+# The host must configure that chip select with the same burst length
+# and wrapping mode.
+#
+# Without gpmc_bridge, the design has no bus master and its registers
+# are accessed by a transaction-level host model in simulation.
+#
+# With perf_counters, the host bus is instrumented by performance
+# counters, mapped as the gpmc_perf bank next to the application banks.
 class GPMCToplevel(GenericToplevel):
-	def __init__(self, *args, **kwargs):
+	def __init__(self, *args, gpmc_bridge=True, gpmc_burst_cs=None, gpmc_burst_length=8,
+	  gpmc_burst_wrap=False, perf_counters=True, **kwargs):
 		GenericToplevel.__init__(self, 16, *args, **kwargs)
 
+		if not gpmc_bridge:
+			return
+		if gpmc_burst_cs is None:
+			burst_cs_n_pad = None
+		else:
+			burst_cs_n_pad = self.mibuild_platform.request("gpmc_ce_n", gpmc_burst_cs)
 		self.submodules.gpmc_bridge = GPMC(
 			self.mibuild_platform.request("gpmc"),
-			self.mibuild_platform.request("gpmc_ce_n", 0))
+			self.mibuild_platform.request("gpmc_ce_n", 0),
+			burst_cs_n_pad, gpmc_burst_length, gpmc_burst_wrap)
 		self.request_master(self.gpmc_bridge.wishbone)
+		if burst_cs_n_pad is not None:
+			self.request_master(self.gpmc_bridge.wishbone_burst)
+		if perf_counters:
+			self.submodules.instrumentation = Module()
+			self.instrumentation.submodules.gpmc_perf = PerformanceCounters(self.gpmc_bridge,
+				self.masters, native_base, csr_bank_size//2)
+			self.add_csrbankarray(self.instrumentation)
 	
-	def get_symtab(self):
+	def get_register_map(self):
+		# (name, permission, address, length in bytes, kind, bits, depth)
 		csr_base = 0x08000000
-		csr_bank_size = 0x400
-		symtab = []
-		for name, csrs, mapaddr, rmap in self.csrbankarray.banks:
+		register_map = []
+		banks = []
+		srams = []
+		for bankarray in self.csrbankarrays:
+			banks += bankarray.banks
+			srams += bankarray.srams
+		for name, csrs, mapaddr, rmap in banks:
 			reg_base = csr_base + csr_bank_size*mapaddr
 			for c in csrs:
 				if isinstance(c, (CSR, CSRStorage)):
@@ -98,14 +262,30 @@ class GPMCToplevel(GenericToplevel):
 				else:
 					permission = BOF_PERM_READ
 				length = 2*((self.csr_data_width - 1 + c.size)//self.csr_data_width)
-				symtab.append((name + "_" + c.name, permission, reg_base, length))
+				register_map.append((name + "_" + c.name, permission, reg_base, length, "csr", c.size, 1))
 				reg_base += length
-		for name, memory, mapaddr, mmap in self.csrbankarray.srams:
+		for name, memory, mapaddr, mmap in srams:
 			mem_base = csr_base + csr_bank_size*mapaddr
 			if not hasattr(memory, "bus_read_only") or not memory.bus_read_only:
 				permission = BOF_PERM_WRITE|BOF_PERM_READ
 			else:
 				permission = BOF_PERM_READ
-			length = min(2*memory.depth, csr_bank_size)
-			symtab.append((name + "_" + memory.name_override, permission, mem_base, length))
-		return symtab
+			register_map.append((name + "_" + memory.name_override, permission, mem_base,
+				2*self._words_per_entry(memory)*memory.depth, "memory", memory.width, memory.depth))
+		for name, memory, adr, size in self.native_memories:
+			if not getattr(memory, "bus_read_only", False):
+				permission = BOF_PERM_WRITE|BOF_PERM_READ
+			else:
+				permission = BOF_PERM_READ
+			register_map.append((name + "_" + memory.name_override, permission, csr_base + 2*adr,
+				2*self._words_per_entry(memory)*memory.depth, "memory", memory.width, memory.depth))
+		return register_map
+
+	def get_symtab(self):
+		return [(name, permission, address, length)
+			for name, permission, address, length, kind, bits, depth in self.get_register_map()]
+
+	def get_host_module(self):
+		register_map = [(name, bool(permission & BOF_PERM_WRITE), address, length, kind, bits, depth)
+			for name, permission, address, length, kind, bits, depth in self.get_register_map()]
+		return hostgen.get_host_module(register_map, 0x08000000)
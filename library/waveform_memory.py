@@ -2,10 +2,14 @@ from migen.fhdl.std import *
 from migen.bank.description import *
 from migen.genlib.cdc import MultiReg, PulseSynchronizer
 
+from library.timestamp import TimestampTag
+
 class WaveformMemoryOut(Module, AutoCSR):
 	def __init__(self, depth, width, spc):
 		self.specials._mem_i = Memory(width, depth)
 		self.specials._mem_q = Memory(width, depth)
+		self._mem_i.bus_native = True
+		self._mem_q.bus_native = True
 		
 		# registers are in the system clock domain
 		self._r_playback_en = CSRStorage()
@@ -61,24 +65,88 @@ class WaveformMemoryOut(Module, AutoCSR):
 				port_q.adr.eq(mem_a)
 			]
 
+# In double-buffered mode, captures alternate between two memory banks:
+# when continuous capture is enabled, the hardware fills one bank while
+# the host drains the other. A filled bank is flagged ready and tagged
+# with a sequence number until the host releases it. Starting to
+# overwrite a bank that is still ready sets its overflow flag and
+# withdraws its ready flag until it is filled again.
+#
+# ev_start and ev_done pulse when the first and the last sample of a
+# buffer are written. With a timestamp (in signal clock domain), the
+# buffers are tagged with the timestamp of their first sample, in
+# start_time or in time0 and time1 for the banks. The tags of a bank
+# must be further apart than the TimestampTag latency: in continuous
+# double-buffered mode, with a sample per cycle, size must be at least
+# 8.
+#
+# With integrate_bits, a single-buffered capture integrates pulses
+# coherently: value holds lanes two's complement samples, and the
+# memory holds their sums, each integrate_bits wider. A capture is made
+# of pulses passes (at most 2**integrate_bits, as many as the sums
+# hold, larger values being clamped), each starting on trigger (or
+# immediately if triggered is not set), the first one storing the
+# samples and the next ones adding them to the stored sums. The sums of
+# the last pass are shifted right by shift, and busy stays set until
+# then. The memory has a second read port in signal clock domain for
+# the accumulation.
 class WaveformMemoryIn(Module, AutoCSR):
-	def __init__(self, depth, width):
-		self.specials._mem = Memory(width, depth)
-		self._mem.bus_read_only = True
+	def __init__(self, depth, width, double_buffered=False, timestamp=None, lanes=1, integrate_bits=0):
+		if integrate_bits:
+			assert not double_buffered
+			lane_width = width//lanes
+			acc_width = lane_width + integrate_bits
+			mem_width = lanes*acc_width
+		else:
+			mem_width = width
+		if double_buffered:
+			self.specials._mem0 = Memory(mem_width, depth)
+			self.specials._mem1 = Memory(mem_width, depth)
+			mems = [self._mem0, self._mem1]
+		else:
+			self.specials._mem = Memory(mem_width, depth)
+			mems = [self._mem]
+		for mem in mems:
+			mem.bus_read_only = True
+			mem.bus_native = True
 		
 		# registers are in the system clock domain
 		self._r_start = CSR()
 		self._r_busy = CSRStatus()
 		self._r_size = CSRStorage(bits_for(depth), reset=depth)
+		if double_buffered:
+			self._r_continuous = CSRStorage()
+			self._r_ready = CSRStatus(2)
+			self._r_release = CSR(2)
+			self._r_overflow = CSRStatus(2)
+			self._r_sequence = CSRStatus(32)
+			self._r_seq0 = CSRStatus(32)
+			self._r_seq1 = CSRStatus(32)
+		if timestamp is not None:
+			if double_buffered:
+				self._r_time0 = CSRStatus(flen(timestamp))
+				self._r_time1 = CSRStatus(flen(timestamp))
+			else:
+				self._r_start_time = CSRStatus(flen(timestamp))
+		if integrate_bits:
+			self._r_pulses = CSRStorage(bits_for(2**integrate_bits), reset=1)
+			self._r_shift = CSRStorage(bits_for(integrate_bits))
+			self._r_triggered = CSRStorage()
 		
 		# data interface, in signal clock domain
+		# (value is written when stb is asserted)
 		self.value = Signal(width)
+		self.stb = Signal(reset=1)
+		self.ev_start = Signal()
+		self.ev_done = Signal()
+		if integrate_bits:
+			self.trigger = Signal()
 
 		###
 
 		# register controls transferred to signal clock domain
 		start = Signal()
-		done = Signal()
+		stop = Signal()
 		size = Signal(bits_for(depth))
 		self.submodules._ps_start = PulseSynchronizer("sys", "signal")
 		self.comb += [
@@ -86,7 +154,7 @@ class WaveformMemoryIn(Module, AutoCSR):
 			start.eq(self._ps_start.o)
 		]
 		self.submodules._ps_done = PulseSynchronizer("signal", "sys")
-		self.comb += self._ps_done.i.eq(done)
+		self.comb += self._ps_done.i.eq(stop)
 		self.sync += [
 			If(self._r_start.re,
 				self._r_busy.status.eq(1)
@@ -95,26 +163,194 @@ class WaveformMemoryIn(Module, AutoCSR):
 			)
 		]
 		self.specials += MultiReg(self._r_size.storage, size, "signal")
+		if double_buffered:
+			continuous = Signal()
+			self.specials += MultiReg(self._r_continuous.storage, continuous, "signal")
 		#
 		active = Signal()
+		bank = Signal()
+		done = Signal()
 		write_address = Signal(max=depth)
-		mem_port = self._mem.get_port(write_capable=True, clock_domain="signal")
-		self.specials += mem_port
+		if integrate_bits:
+			integrating = Signal()
+			pulse = Signal(max=2**integrate_bits)
+			pulses = Signal(bits_for(2**integrate_bits))
+			shift = Signal(bits_for(integrate_bits))
+			triggered = Signal()
+			first = Signal()
+			last = Signal()
+			self.specials += [
+				MultiReg(self._r_pulses.storage, pulses, "signal"),
+				MultiReg(self._r_shift.storage, shift, "signal"),
+				MultiReg(self._r_triggered.storage, triggered, "signal")
+			]
+			self.comb += [
+				first.eq(pulse == 0),
+				last.eq((pulse + 1 >= pulses) | (pulse == 2**integrate_bits - 1))
+			]
+			# the read port is addressed with the next write address so
+			# that it presents the sums at the write address, which are
+			# written back on the next cycle
+			read_port = self._mem.get_port(clock_domain="signal")
+			write_port = self._mem.get_port(write_capable=True, clock_domain="signal")
+			self.specials += read_port, write_port
+			self.comb += If(active & self.stb,
+					read_port.adr.eq(write_address + 1)
+				).Elif(active,
+					read_port.adr.eq(write_address)
+				)
+			self.sync.signal += [
+				write_port.adr.eq(write_address),
+				write_port.we.eq(active & self.stb)
+			]
+			for n in range(lanes):
+				sample = Signal((lane_width, True))
+				acc = Signal((acc_width, True))
+				total = Signal((acc_width, True))
+				dat_w = write_port.dat_w[n*acc_width:(n+1)*acc_width]
+				self.comb += [
+					sample.eq(self.value[n*lane_width:(n+1)*lane_width]),
+					acc.eq(read_port.dat_r[n*acc_width:(n+1)*acc_width]),
+					If(first,
+						total.eq(sample)
+					).Else(
+						total.eq(acc + sample)
+					)
+				]
+				shifted = dict((k, dat_w.eq(Cat(total[k:], Replicate(total[-1], k))))
+					for k in range(1, integrate_bits + 1))
+				shifted["default"] = dat_w.eq(total)
+				self.sync.signal += If(last,
+						Case(shift, shifted)
+					).Else(
+						dat_w.eq(total)
+					)
+		else:
+			for n, mem in enumerate(mems):
+				mem_port = mem.get_port(write_capable=True, clock_domain="signal")
+				self.specials += mem_port
+				self.comb += [
+					mem_port.adr.eq(write_address),
+					mem_port.dat_w.eq(self.value),
+					mem_port.we.eq(active & self.stb & (bank == n))
+				]
 		self.comb += [
-			mem_port.adr.eq(write_address),
-			mem_port.dat_w.eq(self.value),
-			mem_port.we.eq(active)
+			done.eq(active & self.stb & (write_address == size - 1)),
+			self.ev_start.eq(active & self.stb & (write_address == 0)),
+			self.ev_done.eq(done)
 		]
-		self.sync.signal += [
-			done.eq(0),
-			write_address.eq(0),
-			If(active,
-				write_address.eq(write_address + 1),
-				If(write_address == size - 1, 
+		if double_buffered:
+			on_done = [
+				If(continuous,
+					write_address.eq(0),
+					bank.eq(~bank)
+				).Else(
 					active.eq(0),
-					done.eq(1)
+					stop.eq(1)
+				)
+			]
+		elif integrate_bits:
+			on_done = [
+				active.eq(0),
+				If(last,
+					integrating.eq(0),
+					stop.eq(1)
+				).Else(
+					pulse.eq(pulse + 1)
+				)
+			]
+		else:
+			on_done = [active.eq(0), stop.eq(1)]
+		if integrate_bits:
+			on_idle = [
+				If(start,
+					integrating.eq(1),
+					pulse.eq(0)
+				).Elif(integrating & (self.trigger | ~triggered),
+					active.eq(1)
 				)
+			]
+		else:
+			on_idle = [If(start, active.eq(1))]
+		self.sync.signal += [
+			stop.eq(0),
+			If(active,
+				If(self.stb,
+					write_address.eq(write_address + 1)
+				),
+				If(done, *on_done)
 			).Else(
-				If(start, active.eq(1))
+				write_address.eq(0),
+				bank.eq(0),
+				*on_idle
 			)
 		]
+
+		if double_buffered:
+			# bank status, in system clock domain
+			self.submodules._ps_start0 = PulseSynchronizer("signal", "sys")
+			self.submodules._ps_start1 = PulseSynchronizer("signal", "sys")
+			self.submodules._ps_done0 = PulseSynchronizer("signal", "sys")
+			self.submodules._ps_done1 = PulseSynchronizer("signal", "sys")
+			self.comb += [
+				self._ps_start0.i.eq(self.ev_start & (bank == 0)),
+				self._ps_start1.i.eq(self.ev_start & (bank == 1)),
+				self._ps_done0.i.eq(done & (bank == 0)),
+				self._ps_done1.i.eq(done & (bank == 1))
+			]
+			ready = self._r_ready.status
+			overflow = self._r_overflow.status
+			sequence = self._r_sequence.status
+			released = Signal(2)
+			self.comb += If(self._r_release.re, released.eq(self._r_release.r))
+			# banks are filled alternately from bank 0, so bank 0 holds
+			# the even sequence numbers: this orders done pulses that
+			# reach this clock domain on the same cycle
+			self.sync += [
+				If(self._r_start.re,
+					ready.eq(0),
+					overflow.eq(0),
+					sequence.eq(0)
+				).Else(
+					ready.eq(ready & ~released),
+					If(self._ps_start0.o & ready[0] & ~released[0],
+						ready[0].eq(0),
+						overflow[0].eq(1)
+					),
+					If(self._ps_start1.o & ready[1] & ~released[1],
+						ready[1].eq(0),
+						overflow[1].eq(1)
+					),
+					If(self._ps_done0.o,
+						ready[0].eq(1),
+						self._r_seq0.status.eq(sequence + (self._ps_done1.o & sequence[0]))
+					),
+					If(self._ps_done1.o,
+						ready[1].eq(1),
+						self._r_seq1.status.eq(sequence + (self._ps_done0.o & ~sequence[0]))
+					),
+					sequence.eq(sequence + self._ps_done0.o + self._ps_done1.o)
+				)
+			]
+
+		if timestamp is not None:
+			if double_buffered:
+				self.submodules.tag0 = TimestampTag(timestamp)
+				self.submodules.tag1 = TimestampTag(timestamp)
+				self.comb += [
+					self.tag0.i.eq(self.ev_start & (bank == 0)),
+					self.tag1.i.eq(self.ev_start & (bank == 1)),
+					self._r_time0.status.eq(self.tag0.o),
+					self._r_time1.status.eq(self.tag1.o)
+				]
+			else:
+				self.submodules.tag = TimestampTag(timestamp)
+				# integrated captures are tagged with their first pass
+				if integrate_bits:
+					tag_event = self.ev_start & first
+				else:
+					tag_event = self.ev_start
+				self.comb += [
+					self.tag.i.eq(tag_event),
+					self._r_start_time.status.eq(self.tag.o)
+				]
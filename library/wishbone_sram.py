@@ -0,0 +1,99 @@
+from migen.fhdl.std import *
+from migen.bus import wishbone
+
+# Exposes a memory as a Wishbone slave
+#
+# Entries wider than the bus take a power-of-two number of consecutive
+# bus words, most significant word first (as with the CSR SRAM). Writes
+# to the other words of an entry are buffered and committed with the
+# last one.
+#
+# Single accesses are acknowledged on the cycle after they are issued.
+# During incrementing bursts (cti = 0b010, linear or wrapping as given by
+# bte), the next word is read ahead while the current one is
+# acknowledged, so that one word is transferred per clock.
+class WishboneSRAM(Module):
+	def __init__(self, memory, read_only=False, bus=None):
+		if bus is None:
+			bus = wishbone.Interface(16)
+		self.bus = bus
+		data_width = flen(self.bus.dat_w)
+		words_per_entry = (memory.width + data_width - 1)//data_width
+		word_bits = log2_int(words_per_entry, False)
+		adr_bits = word_bits + log2_int(memory.depth, False)
+		self.size = 2**adr_bits
+
+		###
+
+		port = memory.get_port(write_capable=not read_only)
+		self.specials += port
+
+		# address of the next word of a burst
+		next_adr = Signal(adr_bits)
+		cases = {"default": next_adr.eq(self.bus.adr + 1)}
+		for bte, wrap_bits in [(1, 2), (2, 3), (3, 4)]:
+			if wrap_bits < adr_bits:
+				cases[bte] = [
+					next_adr.eq(self.bus.adr),
+					next_adr[:wrap_bits].eq(self.bus.adr[:wrap_bits] + 1)
+				]
+		self.comb += Case(self.bus.bte, cases)
+
+		ack = Signal()
+		read_adr = Signal(adr_bits)
+		self.comb += [
+			self.bus.ack.eq(ack & self.bus.cyc & self.bus.stb),
+			If(self.bus.ack & ~self.bus.we & (self.bus.cti == 0b010),
+				read_adr.eq(next_adr)
+			).Else(
+				read_adr.eq(self.bus.adr)
+			),
+			port.adr.eq(read_adr[word_bits:])
+		]
+		self.sync += ack.eq(self.bus.cyc & self.bus.stb & (~self.bus.ack | (self.bus.cti == 0b010)))
+
+		# read data
+		if word_bits:
+			word = Signal(word_bits)
+			cases = dict()
+			for i in range(words_per_entry):
+				lsb = (words_per_entry - 1 - i)*data_width
+				cases[i] = self.bus.dat_r.eq(port.dat_r[lsb:lsb+data_width])
+			self.sync += word.eq(read_adr[:word_bits])
+			self.comb += Case(word, cases)
+		else:
+			self.comb += self.bus.dat_r.eq(port.dat_r)
+
+		# write data
+		if not read_only:
+			write = Signal()
+			self.comb += write.eq(self.bus.cyc & self.bus.stb & self.bus.we)
+			if word_bits:
+				chunks = []
+				for i in range(words_per_entry - 1):
+					wreg = Signal(data_width)
+					self.sync += If(write & (self.bus.adr[:word_bits] == i),
+						wreg.eq(self.bus.dat_w))
+					chunks.append(wreg)
+				chunks.append(self.bus.dat_w)
+				self.comb += [
+					port.we.eq(write & (self.bus.adr[:word_bits] == words_per_entry - 1)),
+					port.dat_w.eq(Cat(*reversed(chunks)))
+				]
+			else:
+				self.comb += [
+					port.we.eq(write),
+					port.dat_w.eq(self.bus.dat_w)
+				]
+
+# Acknowledges the accesses that no other slave decodes, ignoring writes
+# and reading 0, so that a stray host access does not hang the bus
+class WishboneDefaultSlave(Module):
+	def __init__(self, bus=None):
+		if bus is None:
+			bus = wishbone.Interface(16)
+		self.bus = bus
+
+		###
+
+		self.sync += self.bus.ack.eq(self.bus.cyc & self.bus.stb & ~self.bus.ack)
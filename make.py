@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
-import os, sys, imp, argparse
+import os, sys, imp, argparse, time, traceback, select
+from multiprocessing import Pool
+
+from library.build_cache import BuildCache
+from library.build_report import BuildReport
 
 def try_import(search_dirs, path, name):
 	search_dirs = [os.path.join(search_dir, path) for search_dir in search_dirs]
@@ -18,6 +22,178 @@ def find_dir(search_dirs, path):
 			return search_dir, full_dir
 	return None
 
+def find_applications(search_dirs):
+	r = []
+	for search_dir in search_dirs:
+		app_dir = os.path.join(search_dir, "application")
+		if not os.path.isdir(app_dir):
+			continue
+		for app_name in sorted(os.listdir(app_dir)):
+			if app_name not in r and os.path.isfile(os.path.join(app_dir, app_name, "app_toplevel.py")):
+				r.append(app_name)
+	return r
+
+def load_toplevel(search_dirs, platform, app_name):
+	platform_module = try_import(search_dirs, os.path.join("platform", platform), "platform")
+
+	found = find_dir(search_dirs, os.path.join("application", app_name))
+	if found is None:
+		raise IOError("Could not find application " + app_name)
+	root_dir, application_dir = found
+
+	application_module = imp.load_source(app_name, os.path.join(application_dir, "app_toplevel.py"))
+	toplevel_options = getattr(application_module, "toplevel_options", dict())
+	toplevel = platform_module.Toplevel(application_module.AppToplevel, **toplevel_options)
+	return application_dir, toplevel
+
+def build_target(search_dirs, platform, app_name, build_dir, cache=None):
+	report = BuildReport()
+	with report.phase("elaborate"):
+		application_dir, toplevel = load_toplevel(search_dirs, platform, app_name)
+	orig_dir = os.getcwd()
+	os.chdir(application_dir)
+	try:
+		toplevel.build(build_dir, cache, report=report)
+	finally:
+		os.chdir(orig_dir)
+
+# Elaborates the target and writes its Verilog, without running the
+# toolchain. Returns the report of the phases and the problems found.
+def check_target(search_dirs, platform, app_name, build_dir):
+	report = BuildReport()
+	with report.phase("elaborate"):
+		application_dir, toplevel = load_toplevel(search_dirs, platform, app_name)
+	orig_dir = os.getcwd()
+	os.chdir(application_dir)
+	try:
+		problems = toplevel.check(build_dir, report)
+	finally:
+		os.chdir(orig_dir)
+	return report, problems
+
+watched_dirs = ["application", "library", "components", "platform"]
+
+def get_source_mtimes(search_dirs):
+	r = dict()
+	for search_dir in search_dirs:
+		for watched_dir in watched_dirs:
+			for root, dirs, files in os.walk(os.path.join(search_dir, watched_dir)):
+				for filename in files:
+					if filename.endswith(".py"):
+						full_name = os.path.join(root, filename)
+						try:
+							r[full_name] = os.stat(full_name).st_mtime
+						except OSError:
+							# removed while walking
+							pass
+	return r
+
+# Removes the modules of the watched directories from sys.modules, so
+# that they are imported again from their current sources while Migen
+# and mibuild stay loaded.
+def purge_modules(search_dirs):
+	prefixes = tuple(os.path.join(search_dir, watched_dir) + os.sep
+		for search_dir in search_dirs for watched_dir in watched_dirs)
+	for name, module in list(sys.modules.items()):
+		filename = getattr(module, "__file__", None)
+		if filename is not None and os.path.abspath(filename).startswith(prefixes):
+			del sys.modules[name]
+
+def _check_and_print(search_dirs, platform, app_name, build_dir):
+	try:
+		report, problems = check_target(search_dirs, platform, app_name, build_dir)
+	except Exception:
+		traceback.print_exc()
+		print("Check FAILED")
+		return
+	total = sum(phase["time"] for phase in report.phases)
+	print(", ".join("{} {:.2f}s".format(phase["name"], phase["time"]) for phase in report.phases))
+	for problem in problems:
+		print("Problem: " + problem)
+	print("Check {} in {:.2f}s".format("FAILED" if problems else "passed", total))
+
+# Keeps checking the target as its sources change, in this process, so
+# that only the application and library modules are loaded again. The
+# full build is run when a line is entered ("q" to quit).
+def watch_target(search_dirs, platform, app_name, build_dir, cache, interval=0.5):
+	print("Watching {} for {}. Enter to run the full build, q to quit.".format(app_name, platform))
+	mtimes = None
+	interactive = True
+	while True:
+		new_mtimes = get_source_mtimes(search_dirs)
+		if new_mtimes != mtimes:
+			if mtimes is not None:
+				changed = sorted(name for name in set(mtimes) | set(new_mtimes)
+					if mtimes.get(name) != new_mtimes.get(name))
+				print("")
+				print("Changed: " + ", ".join(os.path.relpath(name) for name in changed))
+			mtimes = new_mtimes
+			purge_modules(search_dirs)
+			_check_and_print(search_dirs, platform, app_name, build_dir)
+		if not interactive:
+			time.sleep(interval)
+			continue
+		ready, w, x = select.select([sys.stdin], [], [], interval)
+		if not ready:
+			continue
+		line = sys.stdin.readline()
+		if not line:
+			# stdin closed: keep watching
+			interactive = False
+		elif line.strip() == "q":
+			return
+		else:
+			purge_modules(search_dirs)
+			try:
+				build_target(search_dirs, platform, app_name, build_dir, cache)
+				print("Build passed")
+			except Exception:
+				traceback.print_exc()
+				print("Build FAILED")
+
+# Runs in a pool worker process, which has its own working directory.
+# All output, including that of the toolchain, goes to the log file.
+def _pool_build_target(search_dirs, platform, app_name, build_dir, cache, log_name):
+	t_start = time.time()
+	log = open(log_name, "w")
+	sys.stdout.flush()
+	sys.stderr.flush()
+	os.dup2(log.fileno(), sys.stdout.fileno())
+	os.dup2(log.fileno(), sys.stderr.fileno())
+	try:
+		build_target(search_dirs, platform, app_name, build_dir, cache)
+		success = True
+	except Exception:
+		traceback.print_exc()
+		success = False
+	sys.stdout.flush()
+	sys.stderr.flush()
+	return success, time.time() - t_start
+
+# Returns the (application, platform, build directory, log) targets of
+# the application x platform matrix, each with its own build directory
+# and log.
+def get_targets(search_dirs, app_names, platforms):
+	r = []
+	for app_name in app_names:
+		found = find_dir(search_dirs, os.path.join("application", app_name))
+		if found is None:
+			raise IOError("Could not find application " + app_name)
+		root_dir, application_dir = found
+		for platform in platforms:
+			build_dir = "build" if len(platforms) == 1 else "build_" + platform
+			log_name = os.path.join(application_dir, build_dir + ".log")
+			r.append((app_name, platform, build_dir, log_name))
+	return r
+
+def print_summary(results):
+	print("")
+	print("{:<40} {:>10}  {}".format("Target", "Time (s)", "Result"))
+	print("-"*60)
+	for (app_name, platform, log_name), (success, duration) in results:
+		print("{:<40} {:>10.1f}  {}".format(app_name + "/" + platform, duration,
+			"PASS" if success else "FAIL (see " + log_name + ")"))
+
 def main():
 	print("     _____                               ")
 	print("    (, /   ) /)   ,                      ")
@@ -34,27 +210,57 @@ def main():
 	
 	parser = argparse.ArgumentParser(description="Build system and library for the RHINO platform and derivatives.")
 	parser.add_argument("-e", "--extension-dir", action="append", default=[os.getcwd()])
-	parser.add_argument("-p", "--platform", default="rhino")
-	parser.add_argument("applications", nargs=1)
+	parser.add_argument("-p", "--platform", action="append",
+		help="target platform, can be given several times (default: rhino)")
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+		help="number of builds to run in parallel")
+	parser.add_argument("--no-cache", action="store_true",
+		help="always run the toolchain, even for unchanged designs")
+	parser.add_argument("--cache-dir", default=os.path.join(os.path.expanduser("~"), ".cache", "rhino-gateware"))
+	parser.add_argument("--cache-max-size", type=int, default=2048,
+		help="maximum size of the build cache in MiB")
+	parser.add_argument("--cache-max-age", type=int, default=30,
+		help="days after which unused cache entries are evicted")
+	parser.add_argument("--watch", action="store_true",
+		help="check the application each time its sources change, and build it on request")
+	parser.add_argument("applications", nargs="*",
+		help="applications to build (default: all)")
 	args = parser.parse_args()
 	search_dirs = list(map(os.path.abspath, reversed(args.extension_dir)))
-	platform = args.platform
-	app_name = args.applications[0]
+	platforms = args.platform or ["rhino"]
+	if args.no_cache:
+		cache = None
+	else:
+		cache = BuildCache(args.cache_dir, args.cache_max_size*1024**2, args.cache_max_age*24*3600)
 
 	sys.path = search_dirs + sys.path
-	platform_module = try_import(search_dirs, os.path.join("platform", platform), "platform")
+	app_names = args.applications or find_applications(search_dirs)
 
-	root_dir, application_dir = find_dir(search_dirs, os.path.join("application", app_name))
-	if application_dir is None:
-		raise IOError("Could not find application " + app_name)
-	
-	application_module = imp.load_source(app_name, os.path.join(application_dir, "app_toplevel.py"))
-	toplevel = platform_module.Toplevel(application_module.AppToplevel)
+	if args.watch:
+		if len(app_names) != 1 or len(platforms) != 1:
+			parser.error("--watch takes a single application and platform")
+		watch_target(search_dirs, platforms[0], app_names[0], "build", cache)
+		return
 
-	orig_dir = os.getcwd()
-	os.chdir(application_dir)
-	toplevel.build()
-	os.chdir(orig_dir)
+	if len(app_names) == 1 and len(platforms) == 1 and args.jobs == 1:
+		build_target(search_dirs, platforms[0], app_names[0], "build", cache)
+		return
+
+	# Build the application x platform matrix in separate processes
+	targets = get_targets(search_dirs, app_names, platforms)
+	pool = Pool(args.jobs, maxtasksperchild=1)
+	pending = []
+	for app_name, platform, build_dir, log_name in targets:
+		print("Building {} for {} (log: {})".format(app_name, platform, log_name))
+		pending.append(((app_name, platform, log_name),
+			pool.apply_async(_pool_build_target, (search_dirs, platform, app_name, build_dir, cache, log_name))))
+	pool.close()
+	results = [(target, r.get()) for target, r in pending]
+	pool.join()
+
+	print_summary(results)
+	if not all(success for target, (success, duration) in results):
+		sys.exit(1)
 
 if __name__ == "__main__":
 	main()
@@ -0,0 +1,64 @@
+from random import Random
+
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.biplex_fft import BiplexFFT
+from library.biplex_fft_model import biplex_fft
+
+N = 64
+nbits = 16
+nfrac = 15
+butterfly_latency = 3
+frames = 6
+
+class TB(Module):
+	def __init__(self):
+		self.submodules.fft = BiplexFFT(N, nbits, nfrac, butterfly_latency)
+		prng = Random(7)
+		rand = lambda: [prng.randrange(-2**(nbits-1), 2**(nbits-1)) for i in range(N*frames)]
+		self.inputs = [rand(), rand(), rand(), rand()]
+		self.outputs = [[], [], [], []]
+		self.sync_i_cycles = []
+		self.sync_o_cycles = []
+
+	def do_simulation(self, s):
+		t = s.cycle_counter
+		if t < N*frames:
+			re0, im0, re1, im1 = [x[t] for x in self.inputs]
+			s.wr(self.fft.dat_i0.real, re0)
+			s.wr(self.fft.dat_i0.imag, im0)
+			s.wr(self.fft.dat_i1.real, re1)
+			s.wr(self.fft.dat_i1.imag, im1)
+			s.wr(self.fft.sync_i, int(t % N == 0))
+			if t % N == 0:
+				self.sync_i_cycles.append(t)
+		if s.rd(self.fft.sync_o):
+			self.sync_o_cycles.append(t)
+		if self.sync_o_cycles:
+			for o, sig in zip(self.outputs, [self.fft.dat_o0.real, self.fft.dat_o0.imag,
+			  self.fft.dat_o1.real, self.fft.dat_o1.imag]):
+				o.append(s.rd(sig))
+		s.interrupt = len(self.outputs[0]) >= N*frames
+
+def main(vcd_name="biplex_fft.vcd"):
+	tb = TB()
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	# latency and throughput
+	latency = tb.sync_o_cycles[0] - tb.sync_i_cycles[0]
+	assert latency == tb.fft.latency, (latency, tb.fft.latency)
+	periods = [b - a for a, b in zip(tb.sync_o_cycles, tb.sync_o_cycles[1:])]
+	assert all(p == N for p in periods), periods
+	print("latency: {} cycles, throughput: 1 sample pair per cycle".format(latency))
+
+	# bit-exact comparison with the reference model
+	expected = biplex_fft(*tb.inputs, N=N, nbits=nbits, nfrac=nfrac)
+	for o, e in zip(tb.outputs, expected):
+		assert list(o) == list(e.ravel()), "output mismatch"
+	print("{} frames match the reference model".format(frames))
+	return sim.cycle_counter
+
+if __name__ == "__main__":
+	main()
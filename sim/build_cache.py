@@ -0,0 +1,85 @@
+import os, time, shutil, tempfile
+
+from library.build_cache import BuildCache
+
+class Platform:
+	device = "xc6slx150t-fgg676-3"
+	xst_opt = "-ifmt MIXED"
+	bitgen_opt = "-g Binary:Yes"
+
+def write(directory, name, text):
+	with open(os.path.join(directory, name), "w") as f:
+		f.write(text)
+
+# Checks the keys, storing, restoring and eviction of the build cache in
+# a temporary directory; no ISE installation (nor simulation) is needed.
+def main(vcd_name=None):
+	tmp_dir = tempfile.mkdtemp()
+	try:
+		ise_path = os.path.join(tmp_dir, "Xilinx")
+		for version in ["14.6", "14.7"]:
+			os.makedirs(os.path.join(ise_path, version, "ISE_DS"))
+		os.makedirs(os.path.join(ise_path, "DocNav"))
+		build_dir = os.path.join(tmp_dir, "build")
+		os.mkdir(build_dir)
+		write(build_dir, "top.v", "module top();\nendmodule\n")
+		write(build_dir, "top.ucf", "NET \"clk\" LOC = \"A1\";\n")
+		write(build_dir, "top.xst", "run -ifn top.prj\n")
+		write(build_dir, "top.prj", "verilog work \"top.v\"\nverilog work \"extra.v\"\n")
+		write(build_dir, "extra.v", "module extra();\nendmodule\n")
+
+		cache = BuildCache(os.path.join(tmp_dir, "cache"))
+		platform = Platform()
+		get_key = lambda symtab="symtab", hwrtyp=3: cache.get_key(platform, build_dir, "top", symtab, hwrtyp, ise_path)
+		key = get_key()
+		assert len(key) == 64
+		assert get_key() == key
+		# every input changes the key
+		keys = [key]
+		write(build_dir, "extra.v", "module extra(input a);\nendmodule\n")
+		keys.append(get_key())
+		keys.append(get_key(symtab="other symtab"))
+		keys.append(get_key(hwrtyp=5))
+		platform.par_opt = "-ol high"
+		keys.append(get_key())
+		os.makedirs(os.path.join(ise_path, "14.10", "ISE_DS"))
+		keys.append(get_key())
+		assert len(set(keys)) == len(keys), keys
+		key = keys[-1]
+
+		# only the artifacts are stored
+		for name in ["top.bit", "top.bin", "top.bof", "top.symtab", "top_map.mrp", "top.ngc"]:
+			write(build_dir, name, name)
+		assert not cache.restore(key, build_dir)
+		cache.store(key, build_dir, "top")
+		assert sorted(os.listdir(os.path.join(cache.cache_dir, key))) == \
+			sorted(["top.bin", "top.bit", "top.bof", "top.symtab", "top_map.mrp"])
+		restore_dir = os.path.join(tmp_dir, "restore")
+		os.mkdir(restore_dir)
+		assert cache.restore(key, restore_dir)
+		assert sorted(os.listdir(restore_dir)) == sorted(os.listdir(os.path.join(cache.cache_dir, key)))
+		with open(os.path.join(restore_dir, "top.bof"), "r") as f:
+			assert f.read() == "top.bof"
+
+		# the least recently used entries go first, stale ones always
+		now = time.time()
+		size = sum(os.path.getsize(os.path.join(build_dir, name))
+			for name in os.listdir(os.path.join(cache.cache_dir, key)))
+		for i, age in enumerate([3, 2, 1]):
+			cache.store(keys[i], build_dir, "top")
+			t = now - age*3600
+			os.utime(os.path.join(cache.cache_dir, keys[i]), (t, t))
+		os.mkdir(os.path.join(cache.cache_dir, "unrelated"))
+		cache.max_size = 3*size
+		cache.evict()
+		assert sorted(os.listdir(cache.cache_dir)) == sorted(keys[1:3] + [key, "unrelated"])
+		cache.max_age = 1.5*3600
+		cache.evict()
+		assert sorted(os.listdir(cache.cache_dir)) == sorted([keys[2], key, "unrelated"])
+		print("{} keys, cache entries stored, restored and evicted".format(len(keys)))
+	finally:
+		shutil.rmtree(tmp_dir)
+	return 0
+
+if __name__ == "__main__":
+	main()
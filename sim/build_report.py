@@ -0,0 +1,61 @@
+import os, sys, json, shutil, tempfile
+
+from library.build_report import BuildReport, parse_map_report, parse_par_report, compare
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def read_fixture(name):
+	with open(os.path.join(fixture_dir, name), "r") as f:
+		return f.read()
+
+# Checks the parsing of ISE report fixtures and the comparison of build
+# reports; no ISE installation (nor simulation) is needed.
+def main(vcd_name=None):
+	utilization = parse_map_report(read_fixture("top_map.mrp"))
+	assert utilization["Slice Registers"] == {"used": 3812, "available": 184304}, utilization
+	assert utilization["occupied Slices"]["used"] == 1987, utilization
+	assert utilization["RAMB16BWERs"] == {"used": 24, "available": 268}, utilization
+	assert utilization["DSP48A1s"] == {"used": 18, "available": 180}, utilization
+
+	timing = parse_par_report(read_fixture("top.par"))
+	assert sorted(timing.keys()) == ["TS_clk100", "TS_crg_pll_sys", "TS_gpmc_clk"], timing
+	assert timing["TS_gpmc_clk"] == {"met": False, "SETUP": -0.152, "HOLD": 0.248}, timing
+	assert timing["TS_crg_pll_sys"] == {"met": True, "SETUP": 1.874, "HOLD": 0.312}, timing
+	assert timing["TS_clk100"] == {"met": True, "MINPERIOD": 6.666}, timing
+
+	# phases run in a child process record its peak memory
+	build_dir = tempfile.mkdtemp()
+	report = BuildReport()
+	with report.phase("elaborate"):
+		sum(range(10000))
+	r = report.run_phase("child", [sys.executable, "-c", "x = bytearray(50*1024**2)"])
+	assert r == 0
+	if sys.platform.startswith("linux"):
+		assert report.phases[1]["peak_rss_kb"] >= 50*1024, report.phases
+	with open(os.path.join(fixture_dir, "top_map.mrp"), "r") as src, \
+	  open(os.path.join(build_dir, "top_map.mrp"), "w") as dst:
+		dst.write(src.read())
+	report.parse_ise_reports(build_dir)
+	with open(report.write(build_dir), "r") as f:
+		old = json.load(f)
+	shutil.rmtree(build_dir)
+	assert old["utilization"] == utilization
+	assert [p["name"] for p in old["phases"]] == ["elaborate", "child"]
+
+	# regressions
+	old["timing"] = timing
+	new = json.loads(json.dumps(old))
+	assert compare(old, new) == []
+	new["phases"][0]["time"] = old["phases"][0]["time"] + 30
+	new["utilization"]["DSP48A1s"]["used"] = 40
+	new["timing"]["TS_crg_pll_sys"]["SETUP"] = 0.5
+	new["timing"]["TS_crg_pll_sys"]["met"] = False
+	regressions = compare(old, new)
+	assert len(regressions) == 4, regressions
+	assert regressions[0].startswith("elaborate:"), regressions
+	print("{} resources and {} timing constraints parsed, {} regressions flagged".format(
+		len(utilization), len(timing), len(regressions)))
+	return 0
+
+if __name__ == "__main__":
+	main()
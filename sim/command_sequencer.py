@@ -0,0 +1,52 @@
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.rf_drivers import PE43602Driver, CommandSequencer
+from sim.pe43602 import PE43602
+
+pushed = [0b101001, 0b000011, 0b111111]
+sequence = [0b000101, 0b000110, 0b000111]
+sequence_start = 2
+
+class TB(Module):
+	def __init__(self):
+		self.pads = PE43602()
+		self.submodules.driver = PE43602Driver(self.pads)
+		self.submodules.seq = CommandSequencer(self.driver.program, self.driver.busy)
+		self.busy_cleared = False
+
+	def do_simulation(self, s):
+		self.pads.do_simulation(s)
+		t = s.cycle_counter
+		s.wr(self.seq._r_push.re, 0)
+		s.wr(self.seq._r_trigger.re, 0)
+		if t == 0:
+			for i, attn in enumerate(sequence):
+				last = int(i == len(sequence) - 1)
+				s.wr(self.seq._mem, attn | (last << 6), sequence_start + i)
+		elif t < 2*len(pushed) + 2 and t % 2 == 0:
+			s.wr(self.seq._r_word.storage, pushed[t//2 - 1])
+		elif t < 2*len(pushed) + 2:
+			s.wr(self.seq._r_push.re, 1)
+		elif t == 2*len(pushed) + 2:
+			# triggered while the FIFO is still draining
+			s.wr(self.seq._r_trigger.r, sequence_start)
+			s.wr(self.seq._r_trigger.re, 1)
+		elif t > 2*len(pushed) + 4 and not s.rd(self.seq._r_busy.status):
+			self.programmed = s.rd(self.seq._r_programmed.status)
+			self.overflow = s.rd(self.seq._r_overflow.status)
+			s.interrupt = True
+
+def main(vcd_name="command_sequencer.vcd"):
+	tb = TB()
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	assert tb.pads.latched == pushed + sequence, tb.pads.latched
+	assert tb.programmed == len(pushed) + len(sequence), tb.programmed
+	assert not tb.overflow
+	print("{} pushed and {} sequenced commands programmed".format(len(pushed), len(sequence)))
+	return sim.cycle_counter
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+import os, sys, argparse, json, time, traceback
+from itertools import product
+from multiprocessing import Pool, cpu_count
+
+sim_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(sim_dir))
+
+from migen.fhdl.std import *
+from migen.fhdl import verilog
+
+from library.ti_io import DAC, DAC2X, ADC
+from library.waveform_memory import WaveformMemoryOut, WaveformMemoryIn
+from library.stream_capture import StreamCapture
+from library.stream_playback import StreamPlayback
+from library.biplex_fft import BiplexFFT
+from library.ddc import DDC
+from library.pulse_compression import MatchedFilter, FastMatchedFilter
+from library.gpmc import GPMC
+from library.perf_counters import PerformanceCounters
+from library.rf_drivers import (I2CMaster, PCA9555Driver, PE43602Driver, RFMDISMMDriver, LMH6521,
+	CommandSequencer)
+from library.frequency_hopper import FrequencyHopper
+from library.timestamp import Timestamp
+from library.build_report import _peak_rss_self
+from components.fmc150_controller import FMC150SPI
+from components.ti_wave import WaveformGenerator, WaveformPlayer, WaveformCollector
+
+# Elaboration benchmark
+#
+# Elaborates components over parameter grids and converts them to
+# Verilog, recording for each point the elaboration and conversion times,
+# the peak resident set size and the size of the generated Verilog. Each
+# point runs in a fresh worker process, so that peak memory is its own.
+# Results are saved as JSON, and compared with a baseline saved earlier
+# to catch regressions. This is not part of the test suite (run.py).
+#
+# The components are those of the library and of components/, except
+# the CRGs, the TI I/O wrappers (through the waveform components) and
+# the toplevels, which need a platform.
+
+class _Pads:
+	def __init__(self, **widths):
+		for name, width in widths.items():
+			setattr(self, name, Signal(width, name=name))
+
+	def get_ios(self):
+		return set(self.__dict__.values())
+
+def _dac_pads(width):
+	return _Pads(dat_p=width, dat_n=width, frame_p=1, frame_n=1, txenable=1)
+
+def _adc_pads(width):
+	return _Pads(dat_a_p=width, dat_a_n=width, dat_b_p=width, dat_b_n=width)
+
+class _CRG:
+	def __init__(self):
+		self.dacio_strb = Signal()
+
+def _dac(width):
+	pads = _dac_pads(width)
+	return DAC(pads, Signal()), pads.get_ios()
+
+def _dac2x(width):
+	pads = _dac_pads(width)
+	return DAC2X(pads, Signal()), pads.get_ios()
+
+def _adc(width):
+	pads = _adc_pads(width)
+	return ADC(pads), pads.get_ios()
+
+def _waveform_generator(depth, double_dac):
+	pads = _dac_pads(8)
+	return WaveformGenerator(_CRG(), pads, double_dac, depth), pads.get_ios()
+
+def _waveform_player(depth, double_dac):
+	pads = _dac_pads(8)
+	return WaveformPlayer(_CRG(), pads, double_dac, depth), pads.get_ios()
+
+def _waveform_collector(depth, ddc):
+	pads = _adc_pads(7)
+	return WaveformCollector(pads, ddc=ddc, depth=depth), pads.get_ios()
+
+def _waveform_memory_out(depth, spc):
+	return WaveformMemoryOut(depth, 16, spc), set()
+
+def _waveform_memory_in(depth, double_buffered):
+	return WaveformMemoryIn(depth, 28, double_buffered), set()
+
+def _stream_capture(depth):
+	return StreamCapture(28, depth), set()
+
+def _stream_playback(depth, spc):
+	return StreamPlayback(16, spc, depth), set()
+
+def _biplex_fft(N, butterfly_latency):
+	return BiplexFFT(N, 16, 15, butterfly_latency), set()
+
+def _ddc(fir_taps):
+	return DDC(14, fir_taps=fir_taps), set()
+
+def _matched_filter(taps):
+	return MatchedFilter(14, taps), set()
+
+def _fast_matched_filter(N):
+	return FastMatchedFilter(14, N), set()
+
+def _gpmc_pads():
+	return _Pads(clk=1, a=10, d=16, ale_n=1, we_n=1, oe_n=1, wait=1, cs_n=1, burst_cs_n=1)
+
+def _gpmc(burst):
+	pads = _gpmc_pads()
+	return GPMC(pads, pads.cs_n, pads.burst_cs_n if burst else None), pads.get_ios()
+
+def _perf_counters(latency_bins):
+	pads = _gpmc_pads()
+	m = Module()
+	m.submodules.gpmc = GPMC(pads, pads.cs_n)
+	m.submodules.perf = PerformanceCounters(m.gpmc, [m.gpmc.wishbone], 2**14, 512, latency_bins)
+	return m, pads.get_ios()
+
+def _i2c_master(fifo_depth):
+	return I2CMaster(120e6, fifo_depth=fifo_depth), set()
+
+def _pca9555():
+	pads = _Pads(scl=1, sda=1)
+	return PCA9555Driver(pads, 120e6), pads.get_ios()
+
+def _pe43602():
+	pads = _Pads(d=1, clk=1, le=1)
+	return PE43602Driver(pads), pads.get_ios()
+
+def _rfmd_ismm(readback_depth):
+	pads = _Pads(enx=1, sclk=1, sdata=1, locked=1)
+	return RFMDISMMDriver(pads, readback_depth=readback_depth), pads.get_ios()
+
+def _lmh6521():
+	pads = _Pads(scsb=1, sclk=1, sdi=1, sdo=1)
+	return LMH6521(pads), pads.get_ios()
+
+def _command_sequencer(sequence_depth):
+	pads = _Pads(d=1, clk=1, le=1)
+	m = Module()
+	m.submodules.driver = PE43602Driver(pads)
+	m.submodules.sequencer = CommandSequencer(m.driver.program, m.driver.busy, sequence_depth=sequence_depth)
+	return m, pads.get_ios()
+
+def _frequency_hopper(depth):
+	attn_pads = _Pads(d=1, clk=1, le=1)
+	synth_pads = _Pads(enx=1, sclk=1, sdata=1, locked=1)
+	m = Module()
+	m.submodules.attn = PE43602Driver(attn_pads)
+	m.submodules.synth = RFMDISMMDriver(synth_pads)
+	m.submodules.attn_seq = CommandSequencer(m.attn.program, m.attn.busy)
+	m.submodules.synth_seq = CommandSequencer(m.synth.program, m.synth.busy)
+	m.submodules.timestamp = Timestamp()
+	m.submodules.hopper = FrequencyHopper(m.synth_seq, m.attn_seq, depth, timestamp=m.timestamp.value)
+	return m, attn_pads.get_ios() | synth_pads.get_ios()
+
+def _timestamp(width):
+	t = Timestamp(width)
+	return t, {t.pps}
+
+def _fmc150_spi(init_depth):
+	sdos = [Signal(name="sdo" + str(i)) for i in range(4)]
+	return FMC150SPI(sdos, init_depth), set(sdos)
+
+# name: (factory, parameter grid)
+benchmarks = {
+	"dac": (_dac, {"width": [8]}),
+	"dac2x": (_dac2x, {"width": [8, 16]}),
+	"adc": (_adc, {"width": [7, 14]}),
+	"waveform_generator": (_waveform_generator, {"depth": [1024, 16384], "double_dac": [False, True]}),
+	"waveform_player": (_waveform_player, {"depth": [1024, 8192], "double_dac": [False, True]}),
+	"waveform_collector": (_waveform_collector, {"depth": [1024, 16384], "ddc": [False, True]}),
+	"waveform_memory_out": (_waveform_memory_out, {"depth": [1024, 16384, 65536], "spc": [1, 2, 4, 8]}),
+	"waveform_memory_in": (_waveform_memory_in, {"depth": [1024, 16384], "double_buffered": [False, True]}),
+	"stream_capture": (_stream_capture, {"depth": [256, 4096]}),
+	"stream_playback": (_stream_playback, {"depth": [1024, 8192], "spc": [1, 2]}),
+	"biplex_fft": (_biplex_fft, {"N": [64, 256, 1024, 4096], "butterfly_latency": [1, 3]}),
+	"ddc": (_ddc, {"fir_taps": [21, 63]}),
+	"matched_filter": (_matched_filter, {"taps": [16, 64]}),
+	"fast_matched_filter": (_fast_matched_filter, {"N": [256, 1024]}),
+	"gpmc": (_gpmc, {"burst": [False, True]}),
+	"perf_counters": (_perf_counters, {"latency_bins": [8, 16]}),
+	"i2c_master": (_i2c_master, {"fifo_depth": [16, 64]}),
+	"pca9555": (_pca9555, {}),
+	"pe43602": (_pe43602, {}),
+	"rfmd_ismm": (_rfmd_ismm, {"readback_depth": [16, 64]}),
+	"lmh6521": (_lmh6521, {}),
+	"command_sequencer": (_command_sequencer, {"sequence_depth": [64, 512]}),
+	"frequency_hopper": (_frequency_hopper, {"depth": [64, 1024]}),
+	"timestamp": (_timestamp, {"width": [48, 64]}),
+	"fmc150_spi": (_fmc150_spi, {"init_depth": [256, 1024]})
+}
+
+def get_points(names):
+	r = []
+	for name in names:
+		factory, grid = benchmarks[name]
+		keys = sorted(grid.keys())
+		for values in product(*[grid[key] for key in keys]):
+			r.append((name, dict(zip(keys, values))))
+	return r
+
+def point_key(name, params):
+	return name + "(" + ",".join("{}={}".format(k, v) for k, v in sorted(params.items())) + ")"
+
+# Runs in a pool worker process of its own
+def run_point(name, params):
+	try:
+		factory, grid = benchmarks[name]
+		base_rss = _peak_rss_self()
+		t_start = time.time()
+		module, ios = factory(**params)
+		fragment = module.get_fragment()
+		t_elaborated = time.time()
+		v = str(verilog.convert(fragment, ios))
+		t_converted = time.time()
+		return True, {
+			"elaborate": t_elaborated - t_start,
+			"verilog": t_converted - t_elaborated,
+			"base_rss_kb": base_rss,
+			"peak_rss_kb": _peak_rss_self(),
+			"verilog_bytes": len(v)
+		}
+	except Exception:
+		return False, traceback.format_exc()
+
+# Flags points that take longer or more memory than the tolerance allows,
+# or whose Verilog grew.
+def compare(results, baseline, tolerance):
+	r = []
+	for key, result in sorted(results.items()):
+		if key not in baseline:
+			continue
+		b = baseline[key]
+		duration = result["elaborate"] + result["verilog"]
+		b_duration = b["elaborate"] + b["verilog"]
+		if duration > b_duration*(1 + tolerance):
+			r.append("{}: {:.2f}s, baseline {:.2f}s".format(key, duration, b_duration))
+		memory = result["peak_rss_kb"] - result["base_rss_kb"]
+		b_memory = b["peak_rss_kb"] - b["base_rss_kb"]
+		if memory > b_memory*(1 + tolerance):
+			r.append("{}: {} kB, baseline {} kB".format(key, memory, b_memory))
+		if result["verilog_bytes"] > b["verilog_bytes"]:
+			r.append("{}: {} bytes of Verilog, baseline {}".format(key, result["verilog_bytes"], b["verilog_bytes"]))
+	return r
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark elaboration and Verilog conversion")
+	parser.add_argument("-j", "--jobs", type=int, default=cpu_count(),
+		help="number of points run in parallel (default: number of CPUs)")
+	parser.add_argument("--baseline", help="compare with this file")
+	parser.add_argument("--save", help="save the results to this file, for use as a baseline")
+	parser.add_argument("--tolerance", type=float, default=0.2,
+		help="allowed relative increase in time and memory (default: 0.2)")
+	parser.add_argument("benchmarks", nargs="*", default=sorted(benchmarks.keys()),
+		help="components to benchmark (default: all)")
+	args = parser.parse_args()
+
+	points = get_points(args.benchmarks)
+	pool = Pool(args.jobs, maxtasksperchild=1)
+	pending = [(point_key(name, params), pool.apply_async(run_point, (name, params)))
+		for name, params in points]
+	pool.close()
+
+	results = dict()
+	failed = []
+	print("{:56} {:>9} {:>9} {:>10} {:>12}".format("point", "elab (s)", "conv (s)", "RSS (kB)", "Verilog (B)"))
+	for key, r in pending:
+		success, result = r.get()
+		if success:
+			results[key] = result
+			print("{:56} {:>9.2f} {:>9.2f} {:>10} {:>12}".format(key, result["elaborate"], result["verilog"],
+				result["peak_rss_kb"] - result["base_rss_kb"], result["verilog_bytes"]))
+		else:
+			failed.append(key)
+			print("{:56} FAIL".format(key))
+			print(result)
+	pool.join()
+
+	regressions = []
+	if args.baseline:
+		with open(args.baseline, "r") as f:
+			baseline = json.load(f)
+		regressions = compare(results, baseline, args.tolerance)
+		for regression in regressions:
+			print("Regression: " + regression)
+	if args.save:
+		with open(args.save, "w") as f:
+			json.dump(results, f, indent=1, sort_keys=True)
+
+	if failed or regressions:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,96 @@
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from components.fmc150_controller import FMC150SPI, _spi_devices
+
+# (device, word) commands of the init sequence
+init = [(0, 0x0102), (1, 0x12345678), (2, 0x0a5a), (3, 0x8765abcd)]
+init_start = 3
+# read from the CDCE72010, whose SDO returns the response MSB first
+read_device = 1
+response = 0xcafe0123
+
+# SPI slave: latches SDI on rising clock edges (falling edges if
+# inverted) while its chip select is low, and shifts out the response
+# on the other edges
+class SPISlave:
+	def __init__(self, bits, invert, response=0):
+		self.bits = bits
+		self.invert = invert
+		self.response = response
+		self.sdo = Signal()
+		self.words = []
+		self.received = []
+		self.prev_sclk = int(invert)
+		self.prev_en_n = 1
+
+	def do_simulation(self, s, sclk, sdi, en_n):
+		if not en_n:
+			if self.prev_en_n:
+				self.received = []
+				self.out = self.bits - 1
+				s.wr(self.sdo, (self.response >> self.out) & 1)
+			rising = sclk and not self.prev_sclk
+			falling = not sclk and self.prev_sclk
+			if (falling if self.invert else rising):
+				self.received.append(sdi)
+			elif (rising if self.invert else falling) and self.out:
+				self.out -= 1
+				s.wr(self.sdo, (self.response >> self.out) & 1)
+		elif not self.prev_en_n:
+			assert len(self.received) == self.bits, self.received
+			self.words.append(sum(b << (self.bits - 1 - i) for i, b in enumerate(self.received)))
+		self.prev_sclk = sclk
+		self.prev_en_n = en_n
+
+class TB(Module):
+	def __init__(self):
+		self.slaves = [SPISlave(bits, invert) for name, bits, invert in _spi_devices]
+		self.slaves[read_device].response = response
+		self.submodules.spi = FMC150SPI([slave.sdo for slave in self.slaves])
+		self.state = "INIT"
+
+	def do_simulation(self, s):
+		sclk = s.rd(self.spi.sclk)
+		sdi = s.rd(self.spi.data)
+		en_n = s.rd(self.spi.en_n)
+		for i, slave in enumerate(self.slaves):
+			slave.do_simulation(s, sclk, sdi, (en_n >> i) & 1)
+
+		t = s.cycle_counter
+		s.wr(self.spi._r_init_start.re, 0)
+		s.wr(self.spi._r_start.re, 0)
+		busy = s.rd(self.spi._r_busy.status)
+		if t == 0:
+			s.wr(self.spi._r_divider.storage, 4)
+			for i, (device, word) in enumerate(init):
+				last = int(i == len(init) - 1)
+				s.wr(self.spi._mem_init, word | (device << 32) | (last << 34), init_start + i)
+		elif t == 1:
+			s.wr(self.spi._r_init_start.r, init_start)
+			s.wr(self.spi._r_init_start.re, 1)
+		elif t > 3 and not busy and self.state == "INIT":
+			s.wr(self.spi._r_word.storage, 0x80000000)
+			s.wr(self.spi._r_device.storage, read_device)
+			s.wr(self.spi._r_start.re, 1)
+			self.state = "READ"
+		elif t > 3 and not busy and self.state == "READ" and s.rd(self.spi._r_count.status) > len(init):
+			self.read_data = s.rd(self.spi._r_read_data.status)
+			s.interrupt = True
+
+def main(vcd_name="fmc150_spi.vcd"):
+	tb = TB()
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	for i, slave in enumerate(tb.slaves):
+		expected = [word for device, word in init if device == i]
+		if i == read_device:
+			expected.append(0x80000000)
+		assert slave.words == expected, (i, slave.words)
+	assert tb.read_data == response, hex(tb.read_data)
+	print("{} init words written, read back {:08x}".format(len(init), tb.read_data))
+	return sim.cycle_counter
+
+if __name__ == "__main__":
+	main()
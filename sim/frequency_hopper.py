@@ -0,0 +1,113 @@
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.rf_drivers import PE43602Driver, RFMDISMMDriver, CommandSequencer
+from library.frequency_hopper import FrequencyHopper
+from sim.pe43602 import PE43602
+from sim.rfmd_ismm import RFMDISMM
+
+# synthesizer register sequences: start index -> (address, data) writes
+synth_sequences = {
+	0: [(0x08, 0x1234), (0x09, 0x5678)],
+	2: [(0x08, 0x4321)]
+}
+# (synthesizer sequence or None, attenuation, dwell)
+hops = [
+	(0, 0b000101, 700),
+	(2, 0b001001, 800),
+	(None, 0b010100, 600)
+]
+
+class TB(Module):
+	def __init__(self, lead):
+		self.lead = lead
+		self.attn_pads = PE43602()
+		self.synth_pads = RFMDISMM()
+		self.submodules.attn = PE43602Driver(self.attn_pads)
+		self.submodules.synth = RFMDISMMDriver(self.synth_pads)
+		self.comb += self.synth_pads.get_statements(self.synth.data)
+		self.submodules.attn_seq = CommandSequencer(self.attn.program, self.attn.busy)
+		self.submodules.synth_seq = CommandSequencer(self.synth.program, self.synth.busy)
+		self.submodules.hopper = RenameClockDomains(
+			FrequencyHopper(self.synth_seq, self.attn_seq), {"signal": "sys"})
+		self.frames = []
+		self.started = False
+		self.idle = 0
+
+	def entry(self, synth_index, attn, dwell, last):
+		h = self.hopper
+		index_bits = flen(self.synth_seq.trigger_index)
+		attn_bits = flen(self.attn_seq.word)
+		dwell_bits = flen(h._r_lead.storage)
+		v = 0
+		offset = 0
+		for value, width in [(synth_index or 0, index_bits), (int(synth_index is not None), 1),
+		  (attn, attn_bits), (1, 1), (dwell, dwell_bits), (last, 1)]:
+			v |= value << offset
+			offset += width
+		return v
+
+	def do_simulation(self, s):
+		self.attn_pads.do_simulation(s)
+		self.synth_pads.do_simulation(s)
+		t = s.cycle_counter
+		s.wr(self.hopper._r_start.re, 0)
+		if t == 0:
+			for start, writes in synth_sequences.items():
+				for i, (addr, data) in enumerate(writes):
+					last = int(i == len(writes) - 1)
+					s.wr(self.synth_seq._mem, addr | (data << 7) | (last << 23), start + i)
+			for i, (synth_index, attn, dwell) in enumerate(hops):
+				s.wr(self.hopper._mem, self.entry(synth_index, attn, dwell, int(i == len(hops) - 1)), i)
+			s.wr(self.hopper._r_lead.storage, self.lead)
+		elif t == 1:
+			s.wr(self.hopper._r_start.r, 0)
+			s.wr(self.hopper._r_start.re, 1)
+		if s.rd(self.hopper.frame):
+			self.frames.append(t)
+		# stop once the hopper and the drivers are idle, letting the status
+		# registers settle
+		if s.rd(self.hopper._r_running.status):
+			self.started = True
+			self.idle = 0
+		elif self.started and not s.rd(self.synth_seq.busy) and not s.rd(self.attn_seq.busy):
+			self.idle += 1
+		if self.started and self.idle == 10:
+			self.index = s.rd(self.hopper._r_index.status)
+			self.hops = s.rd(self.hopper._r_hops.status)
+			self.missed = s.rd(self.hopper._r_missed.status)
+			self.missed_index = s.rd(self.hopper._r_missed_index.status)
+			s.interrupt = True
+
+def run(lead, vcd_name):
+	tb = TB(lead)
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	intervals = [b - a for a, b in zip(tb.frames, tb.frames[1:])]
+	assert intervals == [dwell for synth_index, attn, dwell in hops[:-1]], tb.frames
+	assert tb.hops == len(hops), tb.hops
+	assert tb.index == len(hops) - 1, tb.index
+	assert tb.attn_pads.latched == [attn for synth_index, attn, dwell in hops], tb.attn_pads.latched
+	expected = []
+	for synth_index, attn, dwell in hops:
+		if synth_index is not None:
+			expected += synth_sequences[synth_index]
+	assert tb.synth_pads.received == expected, tb.synth_pads.received
+	return tb, sim.cycle_counter
+
+def main(vcd_name="frequency_hopper.vcd"):
+	# programming completes ahead of every frame
+	tb, cycles = run(400, vcd_name)
+	assert tb.missed == 0, tb.missed
+	print("{} hops at frames {}".format(tb.hops, tb.frames))
+
+	# lead too short to program any hop in time
+	tb, c = run(20, None)
+	assert tb.missed == len(hops), tb.missed
+	assert tb.missed_index == len(hops) - 1, tb.missed_index
+	print("{} missed deadlines detected".format(tb.missed))
+	return cycles + c
+
+if __name__ == "__main__":
+	main()
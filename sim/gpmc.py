@@ -0,0 +1,257 @@
+from random import Random
+
+from migen.fhdl.std import *
+from migen.bus import wishbone
+from migen.sim.generic import Simulator, TopLevel
+
+from library.gpmc import GPMC
+from library.wishbone_sram import WishboneSRAM
+
+accesses = 32
+burst_length = 8
+
+class GPMCPads:
+	def __init__(self):
+		self.clk = Signal()
+		self.a = Signal(10)
+		self.d = None
+		self.ale_n = Signal(reset=1)
+		self.we_n = Signal(reset=1)
+		self.oe_n = Signal(reset=1)
+		self.wait = Signal()
+
+# Host model: asynchronous single accesses on chip select 0, waiting for
+# WAIT to be released before completing each of them
+class TB(Module):
+	def __init__(self):
+		self.pads = GPMCPads()
+		self.cs_n = Signal(reset=1)
+		self.submodules.gpmc = GPMC(self.pads, self.cs_n)
+		mem = Memory(16, 256)
+		self.specials += mem
+		self.submodules.sram = WishboneSRAM(mem, bus=self.gpmc.wishbone)
+		# the GPMC clock runs at the system clock frequency
+		self.comb += self.pads.clk.eq(ClockSignal())
+
+		prng = Random(7)
+		self.writes = [(prng.randrange(256), prng.randrange(2**16)) for i in range(accesses)]
+		self.reads = []
+		self.host = self.host_process()
+
+	def cycles(self, n):
+		for i in range(n):
+			yield
+
+	def access(self, adr, data=None):
+		s = self.s
+		s.wr(self.cs_n, 0)
+		s.wr(self.pads.ale_n, 0)
+		s.wr(self.gpmc.data.i, adr & 0xffff)
+		s.wr(self.pads.a, adr >> 16)
+		yield
+		s = self.s
+		s.wr(self.pads.ale_n, 1)
+		if data is None:
+			s.wr(self.pads.oe_n, 0)
+		else:
+			s.wr(self.pads.we_n, 0)
+			s.wr(self.gpmc.data.i, data)
+		yield from self.cycles(2)
+		while self.s.rd(self.pads.wait):
+			yield
+		# let read data through the synchronizer
+		yield from self.cycles(3)
+		s = self.s
+		if data is None:
+			assert s.rd(self.gpmc.data.oe)
+			self.reads.append(s.rd(self.gpmc.data.o))
+		s.wr(self.cs_n, 1)
+		s.wr(self.pads.we_n, 1)
+		s.wr(self.pads.oe_n, 1)
+		yield from self.cycles(4)
+
+	def host_process(self):
+		for adr, data in self.writes:
+			yield from self.access(adr, data)
+		for adr, data in self.writes:
+			yield from self.access(adr)
+
+	def do_simulation(self, s):
+		self.s = s
+		try:
+			next(self.host)
+		except StopIteration:
+			s.interrupt = True
+
+# Host model: synchronous bursts on the burst chip select. The host keeps
+# each write beat on the bus until it sees WAIT released, and takes each
+# read beat on a cycle where WAIT is released; it then holds the chip
+# select for a few cycles with garbage on the bus. The Wishbone slave can
+# be stalled, so that the write queue fills.
+class BurstTB(Module):
+	def __init__(self, wrap):
+		self.wrap = wrap
+		self.pads = GPMCPads()
+		self.cs_n = Signal(reset=1)
+		self.burst_cs_n = Signal(reset=1)
+		self.submodules.gpmc = GPMC(self.pads, self.cs_n, self.burst_cs_n, burst_length, wrap)
+		prng = Random(11)
+		init = [prng.randrange(2**16) for i in range(256)]
+		self.mem = Memory(16, 256, init=init)
+		self.specials += self.mem
+		self.submodules.sram = WishboneSRAM(self.mem)
+		bus = wishbone.Interface(16)
+		self.submodules.interconnect = wishbone.InterconnectShared(
+			[self.gpmc.wishbone, self.gpmc.wishbone_burst], [(lambda a: 1, bus)])
+		self.stall = Signal()
+		self.comb += [
+			self.sram.bus.adr.eq(bus.adr),
+			self.sram.bus.dat_w.eq(bus.dat_w),
+			self.sram.bus.sel.eq(bus.sel),
+			self.sram.bus.we.eq(bus.we),
+			self.sram.bus.cti.eq(bus.cti),
+			self.sram.bus.bte.eq(bus.bte),
+			self.sram.bus.cyc.eq(bus.cyc & ~self.stall),
+			self.sram.bus.stb.eq(bus.stb & ~self.stall),
+			bus.dat_r.eq(self.sram.bus.dat_r),
+			bus.ack.eq(self.sram.bus.ack)
+		]
+		self.comb += self.pads.clk.eq(ClockSignal())
+
+		# golden model
+		self.model = list(init)
+		self.data = iter([prng.randrange(2**16) for i in range(256)])
+		self.reads = []
+		self.expected_reads = []
+		self.write_stalls = 0
+		self.release_at = None
+		self.host = self.host_process()
+
+	def burst_addresses(self, adr, n):
+		if self.wrap:
+			base = adr & ~(burst_length - 1)
+			return [base + (adr + i) % burst_length for i in range(n)]
+		else:
+			return [adr + i for i in range(n)]
+
+	def cycles(self, n):
+		for i in range(n):
+			yield
+
+	def address_phase(self, adr):
+		s = self.s
+		s.wr(self.burst_cs_n, 0)
+		s.wr(self.pads.ale_n, 0)
+		s.wr(self.gpmc.data.i, adr & 0xffff)
+		s.wr(self.pads.a, adr >> 16)
+		yield
+
+	def end_access(self):
+		s = self.s
+		s.wr(self.gpmc.data.i, 0xdead)
+		yield from self.cycles(3)
+		s = self.s
+		s.wr(self.burst_cs_n, 1)
+		s.wr(self.pads.we_n, 1)
+		s.wr(self.pads.oe_n, 1)
+		yield from self.cycles(2)
+
+	def burst_write(self, adr):
+		values = [next(self.data) for i in range(burst_length)]
+		yield from self.address_phase(adr)
+		s = self.s
+		s.wr(self.pads.ale_n, 1)
+		s.wr(self.pads.we_n, 0)
+		s.wr(self.gpmc.data.i, values[0])
+		yield
+		n = 0
+		while n < burst_length:
+			s = self.s
+			if s.rd(self.pads.wait):
+				# WAIT is asserted for the first cycle of each access
+				if n:
+					self.write_stalls += 1
+			else:
+				n += 1
+				if n < burst_length:
+					s.wr(self.gpmc.data.i, values[n])
+			if n < burst_length:
+				yield
+		yield from self.end_access()
+		for a, value in zip(self.burst_addresses(adr, burst_length), values):
+			self.model[a] = value
+
+	def burst_read(self, adr, n):
+		yield from self.address_phase(adr)
+		s = self.s
+		s.wr(self.pads.ale_n, 1)
+		s.wr(self.pads.oe_n, 0)
+		yield
+		r = []
+		while len(r) < n:
+			s = self.s
+			if not s.rd(self.pads.wait):
+				assert s.rd(self.gpmc.data.oe)
+				r.append(s.rd(self.gpmc.data.o))
+			if len(r) < n:
+				yield
+		yield from self.end_access()
+		self.reads.append(r)
+		self.expected_reads.append([self.model[a] for a in self.burst_addresses(adr, n)])
+
+	def host_process(self):
+		yield from self.burst_write(0x13)
+		yield from self.burst_read(0x13, burst_length)
+		# a short read leaves prefetched words to discard
+		yield from self.burst_read(0x40, 3)
+		yield from self.burst_read(0x44, burst_length)
+		# fill the write queue while the slave is stalled
+		self.s.wr(self.stall, 1)
+		self.release_at = self.s.cycle_counter + 100
+		for adr in [0x80, 0x88, 0x95]:
+			yield from self.burst_write(adr)
+		self.stalled_writes = self.write_stalls
+		for adr in [0x80, 0x88, 0x95]:
+			yield from self.burst_read(adr, burst_length)
+		yield from self.cycles(20)
+		self.final = [self.s.rd(self.mem, i) for i in range(256)]
+
+	def do_simulation(self, s):
+		self.s = s
+		if s.cycle_counter == self.release_at:
+			s.wr(self.stall, 0)
+		try:
+			next(self.host)
+		except StopIteration:
+			s.interrupt = True
+
+def main(vcd_name="gpmc.vcd"):
+	tb = TB()
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+	cycle_counter = sim.cycle_counter
+
+	# golden model: the last write to each address wins
+	mem = dict()
+	for adr, data in tb.writes:
+		mem[adr] = data
+	assert tb.reads == [mem[adr] for adr, data in tb.writes], tb.reads
+	print("{} writes and {} reads through the asynchronous bridge".format(
+		len(tb.writes), len(tb.reads)))
+
+	for wrap in [False, True]:
+		tb = BurstTB(wrap)
+		sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+		sim.run()
+		cycle_counter += sim.cycle_counter
+		assert tb.reads == tb.expected_reads, (tb.reads, tb.expected_reads)
+		# no beat lost or written twice, nothing written during the
+		# chip select hold cycles
+		assert tb.final == tb.model, [(i, a, b) for i, (a, b) in enumerate(zip(tb.final, tb.model)) if a != b]
+		assert tb.stalled_writes > 0
+		print("{} burst reads through the burst bridge, wrap={}, {} write stall cycles".format(
+			len(tb.reads), wrap, tb.stalled_writes))
+	return cycle_counter
+
+if __name__ == "__main__":
+	main()
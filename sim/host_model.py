@@ -0,0 +1,70 @@
+from migen.fhdl.std import *
+from migen.bank.description import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.toplevel import GenericToplevel
+from library.host_model import HostModel
+
+pushes = 100
+storage_writes = 2000
+
+class App(Module, AutoCSR):
+	def __init__(self, toplevel):
+		self._r_config = CSRStorage(32, reset=5)
+		self._r_total = CSRStatus(32)
+		self._r_push = CSR(16)
+		self._r_sample = CSRStatus(32)
+		self.specials._mem = Memory(16, 64)
+		self.specials._wave = Memory(32, 4096)
+
+		###
+
+		self.sync += If(self._r_push.re,
+			self._r_total.status.eq(self._r_total.status + self._r_push.r))
+		port = self._wave.get_port()
+		self.specials += port
+		self.comb += [
+			port.adr.eq(self._r_config.storage),
+			self._r_sample.status.eq(port.dat_r)
+		]
+
+def program(host):
+	yield
+	cycles = []
+
+	# zero-cycle accesses
+	start = host.s.cycle_counter
+	assert (yield from host.read("app_config")) == 5
+	for i in range(storage_writes):
+		yield from host.write("app_config", i)
+	assert (yield from host.read("app_config")) == storage_writes - 1
+	host.write_memory("app_mem", range(64))
+	host.write_memory("app_wave", [0x12345678 + i for i in range(4096)])
+	assert host.read_memory("app_mem") == list(range(64))
+	cycles.append(host.s.cycle_counter - start)
+
+	# one-cycle accesses
+	start = host.s.cycle_counter
+	for i in range(pushes):
+		yield from host.write("app_push", i)
+	cycles.append(host.s.cycle_counter - start)
+	yield
+	assert (yield from host.read("app_total")) == sum(range(pushes))
+
+	# memory contents seen by the design
+	yield from host.write("app_config", 1000)
+	yield
+	yield
+	assert (yield from host.read("app_sample")) == 0x12345678 + 1000
+
+	assert cycles == [0, pushes], cycles
+	print("{} zero-cycle and {} one-cycle register accesses".format(storage_writes + 2, pushes))
+
+def main(vcd_name="host_model.vcd"):
+	host = HostModel(GenericToplevel(16, 0, None, App), program)
+	sim = Simulator(host.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+	return sim.cycle_counter
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,70 @@
+import os, imp, struct, shutil, tempfile
+
+from library.hostgen import get_host_module
+
+base = 0x08000000
+
+# (name, writable, address, length in bytes, kind, bits, depth)
+register_map = [
+	("app_a", True, base, 4, "csr", 32, 1),
+	("app_b", False, base + 4, 2, "csr", 16, 1),
+	("app_c", True, base + 6, 6, "csr", 40, 1),
+	("app_mem", True, base + 0x400, 32, "memory", 32, 8),
+	("app_rom", False, base + 0x800, 16, "memory", 16, 8)
+]
+
+def read_words(dev, address, count):
+	with open(dev, "rb") as f:
+		f.seek(address)
+		return list(struct.unpack("<{}H".format(count), f.read(2*count)))
+
+# Runs the generated host module against a sparse file standing for
+# /dev/mem; no simulation is needed.
+def main(vcd_name=None):
+	tmp_dir = tempfile.mkdtemp()
+	try:
+		module_name = os.path.join(tmp_dir, "top_host.py")
+		with open(module_name, "w") as f:
+			f.write(get_host_module(register_map, base))
+		host = imp.load_source("top_host", module_name)
+		dev = os.path.join(tmp_dir, "mem")
+		with open(dev, "wb") as f:
+			f.truncate(base + host.SIZE)
+
+		with host.Device(dev) as d:
+			d.app_a = 0x12345678
+			assert d.app_a == 0x12345678
+			try:
+				d.app_b = 1
+			except AttributeError:
+				pass
+			else:
+				raise AssertionError("read-only register written")
+			d.write_many({"app_a": 0xcafe, "app_c": 0x0102030405})
+			assert d.read_many(["app_a", "app_b", "app_c"]) == \
+				{"app_a": 0xcafe, "app_b": 0, "app_c": 0x0102030405}
+			# memories are views of the mapping, kept past close
+			mem = d.app_mem
+			assert mem.shape == (8, 2)
+			mem[3] = [0xdead, 0xbeef]
+			assert int(d.memory_values("app_mem")[3]) == 0xdeadbeef
+			rom = d.app_rom
+			try:
+				rom[0] = 1
+			except ValueError:
+				pass
+			else:
+				raise AssertionError("read-only memory written")
+		mem[4] = [1, 2]
+		del mem, rom
+
+		# most significant word first
+		assert read_words(dev, base, 6) == [0, 0xcafe, 0, 0x01, 0x0203, 0x0405]
+		assert read_words(dev, base + 0x400 + 12, 4) == [0xdead, 0xbeef, 1, 2]
+		print("{} registers and memories accessed through the host module".format(len(register_map)))
+	finally:
+		shutil.rmtree(tmp_dir)
+	return 0
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,161 @@
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.rf_drivers import I2CMaster
+
+slave_address = 0x20
+
+# Register-based I2C slave (as the PCA9555): the first byte written sets
+# the register pointer, further bytes are written from it and reads start
+# from it, the pointer incrementing after each byte. It acknowledges its
+# address, and only changes SDA while SCL is low.
+class I2CSlave:
+	def __init__(self):
+		self.registers = [0]*8
+		self.pointer = 0
+		self.out = 1
+		self.count = 0
+		self.byte = 0
+		self.addressed = False
+		self.acking = False
+		self.first = False
+		self.count_bytes = 0
+		self.read = 0
+		self.transmitting = False
+		self.tx = 0
+		self.prev_scl = 1
+		self.prev_sda = 1
+
+	def received(self, byte):
+		if self.count_bytes == 0:
+			self.addressed = byte >> 1 == slave_address
+			self.acking = self.addressed
+			self.read = byte & 1
+			self.first = True
+		elif self.addressed and not self.read:
+			if self.first:
+				self.pointer = byte
+				self.first = False
+			else:
+				self.registers[self.pointer] = byte
+				self.pointer += 1
+		self.count_bytes += 1
+
+	def next_tx(self):
+		self.tx = self.registers[self.pointer]
+		self.pointer += 1
+
+	def do_simulation(self, scl, sda):
+		if scl and self.prev_scl and sda != self.prev_sda:
+			# start (SDA falling) or stop (SDA rising) condition
+			self.count = 0
+			self.count_bytes = 0
+			self.transmitting = False
+			self.acking = False
+			self.out = 1
+		elif scl and not self.prev_scl:
+			if self.count < 8:
+				self.byte = ((self.byte << 1) | sda) & 0xff
+			self.count += 1
+			if self.count == 8 and not self.transmitting:
+				self.received(self.byte)
+			elif self.count == 9:
+				self.count = 0
+				if self.transmitting:
+					if sda:
+						self.transmitting = False
+					else:
+						self.next_tx()
+				elif self.acking and self.read:
+					self.transmitting = True
+					self.next_tx()
+		elif not scl and self.prev_scl:
+			if self.count == 8 and not self.transmitting:
+				self.out = 0 if self.acking else 1
+			elif self.transmitting and self.count < 8:
+				self.out = (self.tx >> (7 - self.count)) & 1
+			else:
+				self.out = 1
+		self.prev_scl = scl
+		self.prev_sda = sda
+
+# (address, bytes to write, number of bytes to read)
+transactions = [
+	(slave_address, [2, 0x12, 0x34], 0),
+	(slave_address, [2], 2),
+	(slave_address + 1, [2], 1)
+]
+# register pointer and bytes of the program sink write, sent to
+# slave_address
+program_bytes = [6, 0xab, 0xcd]
+
+class TB(Module):
+	def __init__(self):
+		self.submodules.master = I2CMaster(8e6, 400e3, addr=slave_address, program_bytes=len(program_bytes))
+		self.slave = I2CSlave()
+		self.results = []
+		self.program = self.host()
+
+	# host accesses, one step per cycle
+	def host(self):
+		m = self.master
+		for address, write, read in transactions:
+			self.s.wr(m._r_address.storage, address)
+			self.s.wr(m._r_write_count.storage, len(write))
+			self.s.wr(m._r_read_count.storage, read)
+			for byte in write:
+				self.s.wr(m._r_tx_data.storage, byte)
+				self.s.wr(m._r_tx_push.re, 1)
+				yield
+				self.s.wr(m._r_tx_push.re, 0)
+			self.s.wr(m._r_start.re, 1)
+			yield
+			self.s.wr(m._r_start.re, 0)
+			while self.s.rd(m._r_busy.status):
+				yield
+			rx = []
+			while self.s.rd(m._r_rx_level.status):
+				rx.append(self.s.rd(m._r_rx_data.status))
+				self.s.wr(m._r_rx_pop.re, 1)
+				yield
+				self.s.wr(m._r_rx_pop.re, 0)
+			self.results.append((rx, self.s.rd(m._r_nack.status)))
+		word = 0
+		for byte in program_bytes:
+			word = (word << 8) | byte
+		self.s.wr(m.program.stb, 1)
+		self.s.wr(m.program.payload.data, word)
+		yield
+		while not self.s.rd(m.program.ack):
+			yield
+		self.s.wr(m.program.stb, 0)
+		yield
+		while self.s.rd(m.busy):
+			yield
+
+	def do_simulation(self, s):
+		m = self.master
+		# open drain bus
+		master_sda = s.rd(m.sda.o) if s.rd(m.sda.oe) else 1
+		self.slave.do_simulation(s.rd(m.scl), master_sda & self.slave.out)
+		s.wr(m.sda.i, master_sda & self.slave.out)
+
+		self.s = s
+		try:
+			next(self.program)
+		except StopIteration:
+			s.interrupt = True
+
+def main(vcd_name="i2c_master.vcd"):
+	tb = TB()
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	assert tb.slave.registers[2:4] == [0x12, 0x34], tb.slave.registers
+	assert tb.slave.registers[6:8] == program_bytes[1:], tb.slave.registers
+	assert tb.results == [([], 0), ([0x12, 0x34], 0), ([], 1)], tb.results
+	print("{} transactions and a program write, registers written and read back".format(len(tb.results)))
+	return sim.cycle_counter
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,92 @@
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.waveform_memory import WaveformMemoryIn
+
+depth = 64
+lane_width = 16
+size = 40
+period = 120
+first_trigger = 30
+# The trigger and the samples written by the test bench are seen on the
+# next cycle, and the capture starts on the cycle after the trigger: the
+# sample at address i is that of phase i + 1.
+delay = 1
+
+def to_signed(v, bits):
+	return v - 2**bits if v & 2**(bits - 1) else v
+
+# sample of lane n, at the given phase of pulse p
+def sample(n, p, phase):
+	if n == 0:
+		return 100*phase - 1000 + p
+	else:
+		return -7*phase - 3*p
+
+# Pulses are triggered every period cycles, each sample being a function
+# of the pulse and of the phase since its trigger. The pulses register
+# is set to pulses, and triggers pulses are sent; the memory is read
+# once they are all over.
+class TB(Module):
+	def __init__(self, integrate_bits, pulses, shift, triggers):
+		self.integrate_bits = integrate_bits
+		self.pulses = pulses
+		self.shift = shift
+		self.triggers = triggers
+		wm = WaveformMemoryIn(depth, 2*lane_width, lanes=2, integrate_bits=integrate_bits)
+		self.submodules.wm = RenameClockDomains(wm, {"signal": "sys"})
+		self.done = None
+		self.result = None
+
+	def do_simulation(self, s):
+		t = s.cycle_counter
+		s.wr(self.wm._r_start.re, 0)
+		p, phase = divmod(t - first_trigger, period)
+		value = 0
+		for n in range(2):
+			value |= (sample(n, p, phase) & (2**lane_width - 1)) << (n*lane_width)
+		s.wr(self.wm.value, value)
+		s.wr(self.wm.trigger, int(t >= first_trigger and phase == 0 and p < self.triggers))
+		if t == 0:
+			s.wr(self.wm._r_size.storage, size)
+			s.wr(self.wm._r_pulses.storage, self.pulses)
+			s.wr(self.wm._r_shift.storage, self.shift)
+			s.wr(self.wm._r_triggered.storage, 1)
+		elif t == 10:
+			s.wr(self.wm._r_start.re, 1)
+		elif t < first_trigger + self.triggers*period + size + 10:
+			if t > 20 and self.done is None and not s.rd(self.wm._r_busy.status):
+				self.done = t
+		else:
+			acc_width = lane_width + self.integrate_bits
+			self.result = []
+			for i in range(size):
+				word = s.rd(self.wm._mem, i)
+				self.result.append([to_signed((word >> (n*acc_width)) & (2**acc_width - 1), acc_width)
+					for n in range(2)])
+			s.interrupt = True
+
+# Runs a capture of pulses passes; the pulses register is set to
+# pulses_register, which may exceed the passes the sums hold.
+def run(integrate_bits, passes, shift, pulses_register, triggers, vcd_name):
+	tb = TB(integrate_bits, pulses_register, shift, triggers)
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	expected = [[sum(sample(n, p, delay + i) for p in range(passes)) >> shift
+		for n in range(2)] for i in range(size)]
+	assert tb.result == expected, "integration mismatch: {}".format(tb.result)
+	# busy is set until the end of the last pass
+	last_end = first_trigger + (passes - 1)*period + delay + size
+	assert last_end < tb.done < last_end + 10, (tb.done, last_end)
+	return sim.cycle_counter
+
+def main(vcd_name="integration.vcd"):
+	cycles = run(4, 5, 2, 5, 6, vcd_name)
+	# the sums of 2 extra bits hold 4 passes: larger counts are clamped
+	cycles += run(2, 4, 1, 7, 7, None)
+	print("{} and {} (clamped) pulses of {} samples integrated".format(5, 4, size))
+	return cycles
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,61 @@
+import os, shutil, tempfile
+
+from make import find_applications, get_targets
+
+# (extension directory, application) of the applications laid out in the
+# temporary search directories
+applications = [
+	("base", "radar"),
+	("base", "demo"),
+	("extension", "radar"),
+	("extension", "sdr")
+]
+
+# Checks the discovery of the applications and the naming of the build
+# directories and logs of the target matrix; no ISE installation (nor
+# simulation) is needed.
+def main(vcd_name=None):
+	tmp_dir = tempfile.mkdtemp()
+	try:
+		for search_dir, app_name in applications:
+			app_dir = os.path.join(tmp_dir, search_dir, "application", app_name)
+			os.makedirs(app_dir)
+			with open(os.path.join(app_dir, "app_toplevel.py"), "w") as f:
+				f.write("")
+		# neither is an application
+		os.makedirs(os.path.join(tmp_dir, "base", "application", "common"))
+		with open(os.path.join(tmp_dir, "base", "application", "README"), "w") as f:
+			f.write("")
+		os.makedirs(os.path.join(tmp_dir, "empty"))
+		base, extension, empty = [os.path.join(tmp_dir, name) for name in ["base", "extension", "empty"]]
+
+		# applications found in several directories are listed once
+		assert find_applications([base, extension, empty]) == ["demo", "radar", "sdr"]
+		assert find_applications([empty]) == []
+
+		# the first search directory holding the application hosts the logs
+		targets = get_targets([extension, base], ["radar", "demo"], ["rhino"])
+		assert targets == [
+			("radar", "rhino", "build", os.path.join(extension, "application", "radar", "build.log")),
+			("demo", "rhino", "build", os.path.join(base, "application", "demo", "build.log"))
+		], targets
+		# with several platforms, each target has its own build directory
+		targets = get_targets([base, extension], ["sdr"], ["rhino", "molerad"])
+		sdr_dir = os.path.join(extension, "application", "sdr")
+		assert targets == [
+			("sdr", "rhino", "build_rhino", os.path.join(sdr_dir, "build_rhino.log")),
+			("sdr", "molerad", "build_molerad", os.path.join(sdr_dir, "build_molerad.log"))
+		], targets
+		try:
+			get_targets([base, extension], ["missing"], ["rhino"])
+		except IOError:
+			pass
+		else:
+			raise AssertionError("missing application accepted")
+		print("{} applications found, target matrix named".format(len(find_applications([base, extension]))))
+	finally:
+		shutil.rmtree(tmp_dir)
+	return 0
+
+if __name__ == "__main__":
+	main()
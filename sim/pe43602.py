@@ -5,30 +5,56 @@ from migen.sim.generic import Simulator, TopLevel
 
 from library.rf_drivers import *
 
+attn_values = [0b101001] + [1 << i for i in range(6)]
+
 class DataGen(SimActor):
 	def __init__(self):
 		self.attn = Source([("attn", 6)])
 		def data_gen():
-			yield Token("attn", {"attn": 0b101001})
-			for i in range(6):
-				yield Token("attn", {"attn": 1 << i})
+			for attn in attn_values:
+				yield Token("attn", {"attn": attn})
 		SimActor.__init__(self, data_gen())
 
+# Shifts in D on rising edges of CLK (LSB first) and latches the last
+# 8 bits on rising edges of LE
 class PE43602:
 	def __init__(self):
 		self.d = Signal()
 		self.clk = Signal()
 		self.le = Signal()
 
-def main():
+		self.bits = []
+		self.latched = []
+		self.prev_clk = 0
+		self.prev_le = 0
+
+	def do_simulation(self, s):
+		clk = s.rd(self.clk)
+		le = s.rd(self.le)
+		if clk and not self.prev_clk:
+			self.bits.append(s.rd(self.d))
+		if le and not self.prev_le:
+			word = sum(b << i for i, b in enumerate(self.bits[-8:]))
+			self.latched.append(word >> 1)
+			self.bits = []
+		self.prev_clk = clk
+		self.prev_le = le
+
+def main(vcd_name="pe43602.vcd"):
+	pads = PE43602()
 	g = DataFlowGraph()
-	g.add_connection(DataGen(), PE43602Driver(PE43602()))
+	g.add_connection(DataGen(), PE43602Driver(pads))
 	c = CompositeActor(g)
 	
 	def end_simulation(s):
 		s.interrupt = s.cycle_counter > 5 and not s.rd(c.busy)
-	f = c.get_fragment() + Fragment(sim=[end_simulation])
-	sim = Simulator(f, TopLevel(vcd_name="pe43602.vcd"))
+	f = c.get_fragment() + Fragment(sim=[pads.do_simulation, end_simulation])
+	sim = Simulator(f, TopLevel(vcd_name))
 	sim.run()
 
-main()
+	assert pads.latched == attn_values, pads.latched
+	print("{} attenuation words latched".format(len(pads.latched)))
+	return sim.cycle_counter
+
+if __name__ == "__main__":
+	main()
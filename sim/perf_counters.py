@@ -0,0 +1,133 @@
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.gpmc import GPMC
+from library.wishbone_sram import WishboneSRAM
+from library.perf_counters import PerformanceCounters
+
+native_base = 2**14
+bank_words = 512
+# (bank, offset) of the counted accesses, None for the native bus
+accesses = [(0, 1), (3, 2), (3, 7), (7, 0), (None, 5), (3, 1)]
+
+class GPMCPads:
+	def __init__(self):
+		self.clk = Signal()
+		self.a = Signal(10)
+		self.d = None
+		self.ale_n = Signal(reset=1)
+		self.we_n = Signal(reset=1)
+		self.oe_n = Signal(reset=1)
+		self.wait = Signal()
+
+# Host model: asynchronous single accesses on chip select 0, alternately
+# writes and reads. A few more accesses are made while the counters are
+# frozen, then they are cleared.
+class TB(Module):
+	def __init__(self):
+		self.pads = GPMCPads()
+		self.cs_n = Signal(reset=1)
+		self.submodules.gpmc = GPMC(self.pads, self.cs_n)
+		mem = Memory(16, 256)
+		self.specials += mem
+		self.submodules.sram = WishboneSRAM(mem, bus=self.gpmc.wishbone)
+		self.submodules.perf = PerformanceCounters(self.gpmc, [self.gpmc.wishbone],
+			native_base, bank_words)
+		self.comb += self.pads.clk.eq(ClockSignal())
+		self.host = self.host_process()
+
+	def cycles(self, n):
+		for i in range(n):
+			yield
+
+	def access(self, adr, write):
+		s = self.s
+		s.wr(self.cs_n, 0)
+		s.wr(self.pads.ale_n, 0)
+		s.wr(self.gpmc.data.i, adr & 0xffff)
+		s.wr(self.pads.a, adr >> 16)
+		yield
+		s = self.s
+		s.wr(self.pads.ale_n, 1)
+		if write:
+			s.wr(self.pads.we_n, 0)
+			s.wr(self.gpmc.data.i, adr)
+		else:
+			s.wr(self.pads.oe_n, 0)
+		yield from self.cycles(2)
+		while self.s.rd(self.pads.wait):
+			yield
+		yield from self.cycles(3)
+		s = self.s
+		s.wr(self.cs_n, 1)
+		s.wr(self.pads.we_n, 1)
+		s.wr(self.pads.oe_n, 1)
+		yield from self.cycles(4)
+
+	def access_all(self):
+		for n, (bank, offset) in enumerate(accesses):
+			if bank is None:
+				adr = native_base + offset
+			else:
+				adr = bank*bank_words + offset
+			yield from self.access(adr, n % 2 == 0)
+
+	def read_counters(self):
+		s = self.s
+		perf = self.perf
+		names = ["reads", "writes", "wait_total", "wait_max", "native"]
+		r = dict((name, s.rd(getattr(perf, "_r_" + name).status)) for name in names)
+		r["latency"] = [s.rd(getattr(perf, "_r_latency" + str(n)).status) for n in range(8)]
+		r["banks"] = [s.rd(perf._mem, n) for n in range(native_base//bank_words)]
+		return r
+
+	def host_process(self):
+		yield from self.access_all()
+		yield from self.cycles(10)
+		self.s.wr(self.perf._r_freeze.storage, 1)
+		yield from self.cycles(10)
+		self.counted = self.read_counters()
+		yield from self.access_all()
+		yield from self.cycles(10)
+		self.frozen = self.read_counters()
+		self.s.wr(self.perf._r_freeze.storage, 0)
+		self.s.wr(self.perf._r_clear.re, 1)
+		yield
+		self.s.wr(self.perf._r_clear.re, 0)
+		yield from self.cycles(50)
+		self.cleared = self.read_counters()
+
+	def do_simulation(self, s):
+		self.s = s
+		try:
+			next(self.host)
+		except StopIteration:
+			s.interrupt = True
+
+def main(vcd_name="perf_counters.vcd"):
+	tb = TB()
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	c = tb.counted
+	assert c["writes"] == (len(accesses) + 1)//2, c
+	assert c["reads"] == len(accesses)//2, c
+	assert c["native"] == sum(1 for bank, offset in accesses if bank is None), c
+	expected_banks = [0]*(native_base//bank_words)
+	for bank, offset in accesses:
+		if bank is not None:
+			expected_banks[bank] += 1
+	assert c["banks"] == expected_banks, c["banks"]
+	# the SRAM acks one cycle after each request
+	assert c["latency"] == [0, len(accesses), 0, 0, 0, 0, 0, 0], c["latency"]
+	assert len(accesses) <= c["wait_total"], c
+	assert 0 < c["wait_max"] <= c["wait_total"], c
+	assert tb.frozen == c, (tb.frozen, c)
+	assert all(v == 0 for k, v in tb.cleared.items() if not isinstance(v, list)), tb.cleared
+	assert not any(tb.cleared["latency"]) and not any(tb.cleared["banks"]), tb.cleared
+	print("{} accesses counted, {} wait cycles (at most {} per access)".format(
+		len(accesses), c["wait_total"], c["wait_max"]))
+	return sim.cycle_counter
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,116 @@
+from cmath import exp, pi
+from random import Random
+
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.pulse_compression import (MatchedFilter, FastMatchedFilter,
+	fft_coefficients, fft_coefficient_words)
+from library.pulse_compression_model import matched_filter, fast_matched_filter
+
+in_bits = 14
+samples = 512
+
+# short code for the direct form, and a linear chirp for fast convolution
+code = [(1000, 0), (1000, 0), (1000, 0), (-1000, 0), (-1000, 0), (1000, 0), (-1000, 0)]
+shift = 10
+N = 64
+chirp = [exp(1j*pi*0.02*k*k)/8 for k in range(24)]
+
+def stimulus(reference, amplitude, seed):
+	prng = Random(seed)
+	i = [prng.randrange(-64, 64) for n in range(samples)]
+	q = [prng.randrange(-64, 64) for n in range(samples)]
+	for echo in [100, 250]:
+		for k, r in enumerate(reference):
+			i[echo + k] += int(r.real*amplitude)
+			q[echo + k] += int(r.imag*amplitude)
+	return i, q
+
+class TB(Module):
+	def __init__(self, fast):
+		self.fast = fast
+		if fast:
+			self.mf = FastMatchedFilter(in_bits, N)
+			self.coefficients = fft_coefficients(chirp, N, self.mf.coef_frac)
+			self.words = fft_coefficient_words(self.coefficients, N, self.mf.coef_bits)
+			self.inputs = stimulus(chirp, 6000, 7)
+		else:
+			self.mf = MatchedFilter(in_bits, len(code))
+			mask = 2**self.mf.coef_bits - 1
+			self.words = [(r & mask) | ((s & mask) << self.mf.coef_bits) for r, s in code]
+			self.inputs = stimulus([complex(*c)/1000 for c in code], 4000, 7)
+		self.submodules.mf = RenameClockDomains(self.mf, {"signal": "sys"})
+		self.outputs = [[], []]
+		self.first = None
+
+	def do_simulation(self, s):
+		t = s.cycle_counter
+		if t == 0:
+			for k, word in enumerate(self.words):
+				s.wr(self.mf._mem, word, k)
+			if not self.fast:
+				s.wr(self.mf._r_shift.storage, shift)
+				s.wr(self.mf.stb_i, 0)
+				s.wr(self.mf._r_load.re, 1)
+		elif not self.fast:
+			s.wr(self.mf._r_load.re, 0)
+			if self.first is None and t > 2 and not s.rd(self.mf._r_busy.status):
+				self.first = t
+		else:
+			self.first = 0
+		if self.first is not None:
+			n = t - self.first
+			i, q = self.inputs
+			if n < samples:
+				s.wr(self.mf.i, i[n])
+				s.wr(self.mf.q, q[n])
+			else:
+				s.wr(self.mf.i, 0)
+				s.wr(self.mf.q, 0)
+			if not self.fast:
+				s.wr(self.mf.stb_i, 1)
+		if self.first is not None and s.rd(self.mf.stb):
+			self.outputs[0].append(s.rd(self.mf.out_i))
+			self.outputs[1].append(s.rd(self.mf.out_q))
+		s.interrupt = len(self.outputs[0]) >= samples
+
+def run(fast, vcd_name):
+	tb = TB(fast)
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	i, q = tb.inputs
+	n = len(tb.outputs[0])
+	if fast:
+		# bit-exact comparison with the reference model. The samples
+		# written at cycle n are on i and q at cycle n + 1, and pass
+		# through the input register before framing, whose first frame
+		# starts at cycle 0: it starts with two samples of the cleared
+		# register.
+		lead = 2
+		padded_i = [0]*lead + i + [0]*(2*N)
+		padded_q = [0]*lead + q + [0]*(2*N)
+		expected = fast_matched_filter(padded_i, padded_q, tb.coefficients, N, in_bits,
+			coef_frac=tb.mf.coef_frac)
+		assert all(list(o) == list(e[:n]) for o, e in zip(tb.outputs, expected)), \
+			"fast convolution output mismatch"
+	else:
+		expected = matched_filter(i, q, [c[0] for c in code], [c[1] for c in code], shift)
+		assert all(list(o) == list(e[:n]) for o, e in zip(tb.outputs, expected)), \
+			"direct form output mismatch"
+	# the compressed echoes peak when they have fully arrived
+	power = [a*a + b*b for a, b in zip(*tb.outputs)]
+	L = len(chirp) if fast else len(code)
+	peak = power.index(max(power)) - (lead if fast else 0)
+	assert peak in [100 + L - 1, 250 + L - 1], peak
+	return sim.cycle_counter
+
+def main(vcd_name="pulse_compression.vcd"):
+	cycles = run(False, vcd_name)
+	cycles += run(True, None)
+	print("direct form and fast convolution match the reference models")
+	return cycles
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,51 @@
+from migen.fhdl.std import *
+from migen.bank.description import *
+
+from library.toplevel import GenericToplevel, native_base, csr_bank_size
+
+csr_base = 0x08000000
+
+class App(Module, AutoCSR):
+	def __init__(self, toplevel):
+		self._r_config = CSRStorage(32)
+		# too large for a CSR bank
+		self.specials._big = Memory(16, 16384)
+		# 48-bit entries take 4 bus words each, on the native bus...
+		self.specials._wide = Memory(48, 100)
+		self._wide.bus_native = True
+		# ...and in a CSR bank
+		self.specials._small = Memory(48, 32)
+
+# Checks the routing of the memories of an application on the CSR banks
+# and the native bus, and their symtab entries; the design is elaborated
+# but not simulated.
+def main(vcd_name=None):
+	toplevel = GenericToplevel(16, 0, None, App)
+	symtab = toplevel.get_symtab()
+	# the bank name is that of the application
+	entries = dict((name.rsplit("_", 1)[1], (address, length))
+		for name, permission, address, length in symtab)
+
+	# memories are mapped in the order of their names, each native one
+	# aligned on its power-of-two window
+	assert [(memory.name_override, adr, size) for name, memory, adr, size in toplevel.native_memories] == [
+		("big", native_base, 16384),
+		("wide", 2*native_base, 512)
+	], toplevel.native_memories
+	assert entries["big"] == (csr_base + 2*native_base, 2*16384), entries["big"]
+	assert entries["wide"] == (csr_base + 4*native_base, 2*4*100), entries["wide"]
+	address, length = entries["small"]
+	assert length == 2*4*32, length
+	assert address < csr_base + 2*native_base and (address - csr_base) % csr_bank_size == 0, address
+	assert entries["config"][1] == 4, entries["config"]
+
+	symtab = sorted(symtab, key=lambda s: s[2])
+	for (name_a, permission_a, address_a, length_a), (name_b, permission_b, address_b, length_b) \
+	  in zip(symtab, symtab[1:]):
+		assert address_a + length_a <= address_b, (name_a, name_b)
+	assert toplevel.check_register_map() == []
+	print("{} symbols, {} memories on the native bus".format(len(symtab), len(toplevel.native_memories)))
+	return 0
+
+if __name__ == "__main__":
+	main()
@@ -5,31 +5,105 @@ from migen.sim.generic import Simulator, TopLevel
 
 from library.rf_drivers import *
 
+writes = [(0b1010010, 0)] + [(0b1010101, 1 << i) for i in range(16)]
+
 class DataGen(SimActor):
 	def __init__(self):
 		self.ismm = Source([("addr", 7), ("data", 16)])
 		def data_gen():
-			yield Token("ismm", {"addr": 0b1010010, "data": 0})
-			for i in range(16):
-				yield Token("ismm", {"addr": 0b1010101, "data": 1 << i})
+			for addr, data in writes:
+				yield Token("ismm", {"addr": addr, "data": data})
 		SimActor.__init__(self, data_gen())
 
+# Shifts in SDATA on rising edges of SCLK while ENX is low (MSB first)
+# and decodes the 25-bit words as (address, data) writes, or as reads
+# whose data it shifts out (MSB first) on the falling edges following the
+# address. There is no SDATA pad: the data triple is connected with
+# get_statements.
 class RFMDISMM:
 	def __init__(self):
 		self.enx = Signal()
 		self.sclk = Signal()
-		self.sdata = Signal()
+		self.sdata = None
 		self.sdatao = Signal()
+		self.sdataoe = Signal()
+		self.sdatai = Signal()
+		self.locked = Signal()
+
+		self.registers = dict((addr, (addr*0x9e37) & 0xffff) for addr in range(128))
+		self.bits = []
+		self.received = []
+		self.reads = []
+		self.prev_sclk = 0
+		self.prev_enx = 1
+
+	def get_statements(self, data):
+		return [
+			self.sdatao.eq(data.o),
+			self.sdataoe.eq(data.oe),
+			data.i.eq(self.sdatai)
+		]
 
-def main():
+	def do_simulation(self, s):
+		sclk = s.rd(self.sclk)
+		enx = s.rd(self.enx)
+		reading = len(self.bits) >= 9 and self.bits[1]
+		if not enx and sclk and not self.prev_sclk:
+			if reading:
+				assert not s.rd(self.sdataoe)
+			self.bits.append(s.rd(self.sdatao))
+		if not enx and not sclk and self.prev_sclk and reading and len(self.bits) < 25:
+			addr = sum(b << (6 - i) for i, b in enumerate(self.bits[2:9]))
+			s.wr(self.sdatai, (self.registers[addr] >> (24 - len(self.bits))) & 1)
+		if enx and not self.prev_enx:
+			word = 0
+			for b in self.bits:
+				word = (word << 1) | b
+			assert len(self.bits) == 25 and not word >> 24, self.bits
+			addr = (word >> 16) & 0x7f
+			if word >> 23:
+				self.reads.append(addr)
+			else:
+				self.received.append((addr, word & 0xffff))
+				self.registers[addr] = word & 0xffff
+			self.bits = []
+		self.prev_sclk = sclk
+		self.prev_enx = enx
+
+read_first = 0b1010010
+read_count = 5
+
+def main(vcd_name="rfmd_ismm.vcd"):
+	pads = RFMDISMM()
 	g = DataFlowGraph()
-	g.add_connection(DataGen(), RFMDISMMDriver(RFMDISMM()))
+	driver = RFMDISMMDriver(pads)
+	g.add_connection(DataGen(), driver)
 	c = CompositeActor(g)
-	
-	def end_simulation(s):
-		s.interrupt = s.cycle_counter > 5 and not s.rd(c.busy)
-	f = c.get_fragment() + Fragment(sim=[end_simulation])
-	sim = Simulator(f, TopLevel(vcd_name="rfmd_ismm.vcd"))
+
+	# read back a register range once all writes are done
+	state = {"read": False}
+	def read_back(s):
+		s.wr(driver._r_read.re, 0)
+		if s.cycle_counter > 5 and not s.rd(c.busy):
+			if not state["read"]:
+				s.wr(driver._r_read_first.storage, read_first)
+				s.wr(driver._r_read_count.storage, read_count)
+				s.wr(driver._r_read.re, 1)
+				state["read"] = True
+			elif not s.rd(driver._r_read_busy.status):
+				state["readback"] = [s.rd(driver._mem_readback, i) for i in range(read_count)]
+				state["read_data"] = s.rd(driver._r_read_data.status)
+				s.interrupt = True
+	f = c.get_fragment() + Fragment(pads.get_statements(driver.data),
+		sim=[pads.do_simulation, read_back])
+	sim = Simulator(f, TopLevel(vcd_name))
 	sim.run()
 
-main()
+	assert pads.received == writes, pads.received
+	addrs = list(range(read_first, read_first + read_count))
+	assert pads.reads == addrs, pads.reads
+	expected = [pads.registers[addr] for addr in addrs]
+	assert state["readback"] == expected, state["readback"]
+	assert state["read_data"] == expected[-1]
+	print("{} register writes received, {} registers read back".format(len(pads.received), read_count))
+	return sim.cycle_counter
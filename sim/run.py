@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import os, sys, imp, argparse, json, time, traceback
+
+sim_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(sim_dir))
+
+# Each test module has a main(vcd_name) function that runs its
+# simulations, checks the results against a golden model (raising
+# AssertionError on mismatch) and returns the number of simulated cycles.
+tests = [
+	"biplex_fft",
+	"build_cache",
+	"build_report",
+	"command_sequencer",
+	"ddc",
+	"fmc150_spi",
+	"frequency_hopper",
+	"gpmc",
+	"hostgen",
+	"host_model",
+	"i2c_master",
+	"integration",
+	"make_targets",
+	"pe43602",
+	"perf_counters",
+	"pulse_compression",
+	"register_map",
+	"rfmd_ismm",
+	"stream_capture",
+	"stream_playback",
+	"timestamp",
+	"waveform_generator",
+	"waveform_memory_in",
+	"wishbone_sram"
+]
+
+def run_test(name, vcd):
+	module = imp.load_source("sim_" + name, os.path.join(sim_dir, name + ".py"))
+	vcd_name = name + ".vcd" if vcd else None
+	t_start = time.time()
+	cycles = module.main(vcd_name)
+	return cycles, time.time() - t_start
+
+# Flags tests that need more cycles than in the baseline (gateware
+# regression) or simulate more slowly than the tolerance allows
+# (simulation regression).
+def compare(results, baseline, tolerance):
+	r = []
+	for name, (success, cycles, duration) in sorted(results.items()):
+		if not success or name not in baseline:
+			continue
+		b_cycles, b_duration = baseline[name]
+		if cycles > b_cycles:
+			r.append("{}: {} cycles, baseline {}".format(name, cycles, b_cycles))
+		speed = cycles/duration
+		b_speed = b_cycles/b_duration
+		if speed < b_speed*(1 - tolerance):
+			r.append("{}: {:.0f} cycles/s, baseline {:.0f}".format(name, speed, b_speed))
+	return r
+
+def main():
+	parser = argparse.ArgumentParser(description="Run the simulation test suite")
+	parser.add_argument("--vcd", action="store_true", help="write a VCD file for each test")
+	parser.add_argument("--baseline", help="compare cycles and simulation speed with this file")
+	parser.add_argument("--save", help="save the results to this file, for use as a baseline")
+	parser.add_argument("--tolerance", type=float, default=0.2,
+		help="allowed relative drop in simulation speed (default: 0.2)")
+	parser.add_argument("tests", nargs="*", default=tests, help="tests to run (default: all)")
+	args = parser.parse_args()
+
+	results = dict()
+	for name in args.tests:
+		print("=== " + name)
+		try:
+			cycles, duration = run_test(name, args.vcd)
+			results[name] = (True, cycles, duration)
+		except Exception:
+			traceback.print_exc()
+			results[name] = (False, 0, 0)
+
+	print("")
+	print("{:24} {:>6} {:>10} {:>10} {:>12}".format("test", "result", "cycles", "time (s)", "cycles/s"))
+	for name in args.tests:
+		success, cycles, duration = results[name]
+		if success:
+			print("{:24} {:>6} {:>10} {:>10.2f} {:>12.0f}".format(name, "PASS", cycles, duration,
+				cycles/duration if duration else 0))
+		else:
+			print("{:24} {:>6}".format(name, "FAIL"))
+	failed = [name for name in args.tests if not results[name][0]]
+
+	regressions = []
+	if args.baseline:
+		with open(args.baseline, "r") as f:
+			baseline = json.load(f)
+		regressions = compare(results, baseline, args.tolerance)
+		for regression in regressions:
+			print("Regression: " + regression)
+	if args.save:
+		with open(args.save, "w") as f:
+			json.dump(dict((name, [cycles, duration])
+				for name, (success, cycles, duration) in results.items() if success),
+				f, indent=1, sort_keys=True)
+
+	if failed or regressions:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
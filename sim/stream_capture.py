@@ -0,0 +1,86 @@
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.stream_capture import StreamCapture
+
+width = 16
+depth = 32
+fifo_depth = 8
+stb_period = 2
+decimation = 3
+batch = 8
+# the host stops reading between these cycles, so that the ring fills
+# and samples are dropped
+stall_start = 1500
+stall_end = 2500
+end = 3500
+
+# The input is a free-running counter, valid one cycle out of
+# stb_period. The host reads the ring whenever it holds a batch of
+# samples and then advances read_pointer.
+class TB(Module):
+	def __init__(self):
+		sc = StreamCapture(width, depth, fifo_depth)
+		self.submodules.sc = RenameClockDomains(sc, {"signal": "sys"})
+		self.samples = []
+		self.levels = []
+
+	def drain(self, s):
+		read_pointer = s.rd(self.sc._r_read_pointer.storage)
+		write_pointer = s.rd(self.sc._r_write_pointer.status)
+		level = (write_pointer - read_pointer) % depth
+		assert s.rd(self.sc._r_level.status) == level
+		self.levels.append(level)
+		for i in range(level):
+			self.samples.append(s.rd(self.sc._mem, (read_pointer + i) % depth))
+		s.wr(self.sc._r_read_pointer.storage, write_pointer)
+
+	def do_simulation(self, s):
+		t = s.cycle_counter
+		s.wr(self.sc.value, t & (2**width - 1))
+		s.wr(self.sc.stb, int(t % stb_period == 0))
+		s.wr(self.sc._r_clear.re, 0)
+		if t == 0:
+			s.wr(self.sc._r_decimation.storage, decimation)
+			s.wr(self.sc._r_enable.storage, 1)
+		elif stall_start <= t < stall_end:
+			if t == stall_end - 1:
+				self.full_level = s.rd(self.sc._r_level.status)
+				self.stall_high_water = s.rd(self.sc._r_high_water.status)
+		elif t == stall_end + 200:
+			self.dropped = s.rd(self.sc._r_dropped.status)
+			s.wr(self.sc._r_clear.re, 1)
+		elif t == stall_end + 210:
+			self.cleared_dropped = s.rd(self.sc._r_dropped.status)
+			self.cleared_high_water = s.rd(self.sc._r_high_water.status)
+		elif t == end:
+			s.interrupt = True
+		elif s.rd(self.sc._r_level.status) >= batch:
+			self.drain(s)
+
+def main(vcd_name="stream_capture.vcd"):
+	tb = TB()
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	# kept samples are decimation strobes apart, except across the
+	# samples dropped while the ring was full
+	step = stb_period*decimation
+	gaps = [(b - a) % 2**width for a, b in zip(tb.samples, tb.samples[1:])]
+	irregular = [gap for gap in gaps if gap != step]
+	assert len(irregular) == 1, irregular
+	assert irregular[0] % step == 0
+	assert irregular[0]//step - 1 == tb.dropped, (irregular, tb.dropped)
+	assert tb.dropped > 0
+	# the ring wrapped several times, and was full before the drops
+	assert len(tb.samples) > 4*depth
+	assert tb.full_level == depth - 1, tb.full_level
+	assert tb.stall_high_water == depth - 1, tb.stall_high_water
+	assert tb.cleared_dropped == 0, tb.cleared_dropped
+	assert tb.cleared_high_water < depth - 1, tb.cleared_high_water
+	print("{} samples captured, {} dropped while the ring was full".format(
+		len(tb.samples), tb.dropped))
+	return sim.cycle_counter
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,187 @@
+from migen.fhdl.std import *
+from migen.bus import wishbone
+from migen.sim.generic import Simulator, TopLevel
+
+from library.stream_playback import StreamPlayback
+from library.wishbone_sram import WishboneSRAM
+
+width = 16
+spc = 2
+depth = 64
+entries = 300
+low_water = 16
+# cycles played after the end of the stream
+tail = 50
+
+def entry_values(k):
+	return [(k + 1 + 1000*n) & (2**width - 1) for n in range(2*spc)]
+
+def entry_word(k):
+	return sum(v << (n*width) for n, v in enumerate(entry_values(k)))
+
+# Splits the played rows into runs of identical rows, and checks that
+# the first ones are the entries, each held for period cycles but the
+# last one. Returns the rows from the start of the stream.
+def check_stream(rows, count, period):
+	while rows[0] == [0]*(2*spc):
+		rows = rows[1:]
+	runs = []
+	for row in rows:
+		if runs and runs[-1][0] == row:
+			runs[-1][1] += 1
+		else:
+			runs.append([row, 1])
+	expected = [entry_values(k) for k in range(count)]
+	assert [row for row, length in runs[:count]] == expected, "stream mismatch"
+	assert all(length == period for row, length in runs[:count - 1]), \
+		set(length for row, length in runs[:count - 1])
+	return rows
+
+# The host refills the ring whenever it runs low, until all entries are
+# fed; the stream then underruns. The consumer takes samples one cycle
+# out of stb_period, and each entry is played for interpolation of them.
+class TB(Module):
+	def __init__(self, hold, interpolation, stb_period):
+		self.hold = hold
+		self.interpolation = interpolation
+		self.stb_period = stb_period
+		sp = StreamPlayback(width, spc, depth, fifo_depth=16)
+		self.submodules.sp = RenameClockDomains(sp, {"signal": "sys"})
+		self.fed = 0
+		self.rows = []
+		self.end = None
+
+	def feed(self, s, count):
+		write_pointer = s.rd(self.sp._r_write_pointer.storage)
+		for i in range(count):
+			s.wr(self.sp._mem, entry_word(self.fed), (write_pointer + i) % depth)
+			self.fed += 1
+		s.wr(self.sp._r_write_pointer.storage, (write_pointer + count) % depth)
+
+	def do_simulation(self, s):
+		t = s.cycle_counter
+		s.wr(self.sp.stb, int(t % self.stb_period == 0))
+		if t == 0:
+			s.wr(self.sp._r_hold.storage, self.hold)
+			s.wr(self.sp._r_interpolation.storage, self.interpolation)
+			s.wr(self.sp._r_low_water.storage, low_water)
+			self.feed(s, depth - 1)
+			s.wr(self.sp._r_enable.storage, 1)
+		elif self.fed < entries and s.rd(self.sp._r_low.status):
+			free = depth - 1 - s.rd(self.sp._r_level.status)
+			self.feed(s, min(free, entries - self.fed))
+		if t > 0:
+			self.rows.append([s.rd(getattr(self.sp, name + str(n)))
+				for n in range(spc) for name in ["value_i", "value_q"]])
+		if self.end is None and self.rows and self.rows[-1] == entry_values(entries - 1):
+			self.end = t
+		if self.end is not None and t == self.end + tail:
+			s.wr(self.sp._r_enable.storage, 0)
+		if self.end is not None and t == self.end + tail + 10:
+			self.underruns = s.rd(self.sp._r_underruns.status)
+			s.interrupt = True
+
+def run(hold, interpolation, stb_period, vcd_name):
+	tb = TB(hold, interpolation, stb_period)
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	# each entry is held for interpolation strobes
+	period = interpolation*stb_period
+	rows = check_stream(tb.rows, entries, period)
+	stream_cycles = entries*period
+	fill = entry_values(entries - 1) if hold else [0]*(2*spc)
+	assert all(row == fill for row in rows[stream_cycles:stream_cycles + tail - 5]), rows[stream_cycles:]
+	# underruns are counted from the end of the stream until playback
+	# is disabled, which the outputs see a few cycles later
+	assert abs(tb.underruns - (tail - period)//period) <= 3, tb.underruns
+	return sim.cycle_counter
+
+bus_depth = 16
+bus_entries = 40
+bus_interpolation = 16
+bus_prefill = 5
+
+# The host writes the entries through a WishboneSRAM, one at a time (each
+# in bus words, most significant first), and advances write_pointer after
+# each one, so that even and odd entries are written on their own. The
+# ring wraps several times.
+class BusTB(Module):
+	def __init__(self):
+		sp = StreamPlayback(width, spc, bus_depth, fifo_depth=16)
+		self.submodules.sp = RenameClockDomains(sp, {"signal": "sys"})
+		self.master = wishbone.Interface(16)
+		self.submodules.sram = WishboneSRAM(self.sp._mem, bus=self.master)
+		self.words_per_entry = 2*spc*width//16
+		self.written = []
+		self.rows = []
+		self.host = self.host_process()
+
+	def write_entry(self, adr, entry):
+		bus = self.master
+		for i in range(self.words_per_entry):
+			s = self.s
+			s.wr(bus.cyc, 1)
+			s.wr(bus.stb, 1)
+			s.wr(bus.we, 1)
+			s.wr(bus.adr, adr*self.words_per_entry + i)
+			s.wr(bus.dat_w, (entry >> 16*(self.words_per_entry - 1 - i)) & 0xffff)
+			yield
+			while not self.s.rd(bus.ack):
+				yield
+			s = self.s
+			s.wr(bus.cyc, 0)
+			s.wr(bus.stb, 0)
+			s.wr(bus.we, 0)
+			yield
+
+	def host_process(self):
+		self.s.wr(self.sp._r_interpolation.storage, bus_interpolation)
+		pointer = 0
+		for k in range(bus_entries):
+			while self.s.rd(self.sp._r_level.status) >= bus_depth - 1:
+				yield
+			yield from self.write_entry(pointer, entry_word(k))
+			self.written.append((self.s.rd(self.sp._mem, pointer), entry_word(k)))
+			pointer = (pointer + 1) % bus_depth
+			self.s.wr(self.sp._r_write_pointer.storage, pointer)
+			if k == bus_prefill - 1:
+				self.s.wr(self.sp._r_enable.storage, 1)
+			yield
+		for i in range((bus_depth + 2)*bus_interpolation):
+			yield
+
+	def do_simulation(self, s):
+		self.s = s
+		self.rows.append([s.rd(getattr(self.sp, name + str(n)))
+			for n in range(spc) for name in ["value_i", "value_q"]])
+		try:
+			next(self.host)
+		except StopIteration:
+			self.underruns = s.rd(self.sp._r_underruns.status)
+			s.interrupt = True
+
+def run_bus():
+	tb = BusTB()
+	sim = Simulator(tb.get_fragment(), TopLevel(None))
+	sim.run()
+	# each entry is committed on its own
+	for k, (word, expected) in enumerate(tb.written):
+		assert word == expected, (k, hex(word), hex(expected))
+	check_stream(tb.rows, bus_entries, bus_interpolation)
+	# the host kept up: the stream only underruns after its end
+	assert 0 < tb.underruns <= bus_depth + 2, tb.underruns
+	return sim.cycle_counter
+
+def main(vcd_name="stream_playback.vcd"):
+	cycles = run(False, 1, 1, vcd_name)
+	cycles += run(True, 1, 1, None)
+	# slower consumer
+	cycles += run(False, 3, 2, None)
+	cycles += run_bus()
+	print("{} entries played with zero fill and hold on underrun, and interpolated, "
+		"{} entries written through the bus".format(entries, bus_entries))
+	return cycles
+
+if __name__ == "__main__":
+	main()
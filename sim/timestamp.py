@@ -0,0 +1,60 @@
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.timestamp import Timestamp
+from library.waveform_memory import WaveformMemoryIn
+
+pps_edges = [100, 400]
+capture_start = 200
+snapshot = 500
+size = 16
+
+# The captured samples are the low bits of the timestamp, so the first
+# one must match the timestamp of the capture.
+class TB(Module):
+	def __init__(self):
+		self.submodules.ts = RenameClockDomains(Timestamp(), {"signal": "sys"})
+		wm = WaveformMemoryIn(64, 16, timestamp=self.ts.value)
+		self.submodules.wm = RenameClockDomains(wm, {"signal": "sys"})
+		self.comb += self.wm.value.eq(self.ts.value[:16])
+
+	def do_simulation(self, s):
+		t = s.cycle_counter
+		for csr in [self.ts._r_arm_reset, self.ts._r_snapshot, self.wm._r_start]:
+			s.wr(csr.re, 0)
+		s.wr(self.ts.pps, int(any(edge <= t < edge + 10 for edge in pps_edges)))
+		if t == 5:
+			s.wr(self.ts._r_arm_reset.re, 1)
+		elif t == pps_edges[0] + 20:
+			self.armed = s.rd(self.ts._r_armed.status)
+		elif t == capture_start:
+			s.wr(self.wm._r_size.storage, size)
+			s.wr(self.wm._r_start.re, 1)
+		elif t == snapshot:
+			s.wr(self.ts._r_snapshot.re, 1)
+		elif t == snapshot + 20:
+			self.capture = s.rd(self.wm._mem, 0)
+			self.start_time = s.rd(self.wm._r_start_time.status)
+			self.pps_time = s.rd(self.ts._r_pps_time.status)
+			self.pps_count = s.rd(self.ts._r_pps_count.status)
+			self.time = s.rd(self.ts._r_time.status)
+			s.interrupt = True
+
+def main(vcd_name="timestamp.vcd"):
+	tb = TB()
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+
+	assert not tb.armed
+	# the count was reset on the first PPS edge (reading 0 on the next
+	# cycle) and latched on the second
+	assert tb.pps_time == pps_edges[1] - pps_edges[0] - 1, tb.pps_time
+	assert tb.pps_count == len(pps_edges), tb.pps_count
+	assert tb.start_time & 0xffff == tb.capture, (tb.start_time, tb.capture)
+	assert 0 < tb.start_time - (capture_start - pps_edges[0]) <= 8, tb.start_time
+	assert 0 < tb.time - (snapshot - pps_edges[0]) <= 8, tb.time
+	print("PPS at {}, capture at {}, snapshot at {}".format(tb.pps_time, tb.start_time, tb.time))
+	return sim.cycle_counter
+
+if __name__ == "__main__":
+	main()
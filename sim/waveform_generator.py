@@ -1,124 +1,74 @@
-from math import sin, pi
+from random import Random
 
-import matplotlib.pyplot as plt
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
 
-from migen.bus.transactions import *
-from migen.bus import csr
-from migen.bank import csrgen
-from migen.flow.transactions import *
-from migen.flow.network import *
-from migen.actorlib.sim import *
-from migen.sim.generic import Simulator
-
-from library.waveform_generator import WaveformGenerator
-
-# The WaveformGenerator component gives an abstract list of registers.
-# This derived class implements it on a CSR bus.
-class CSRWG(WaveformGenerator):
-	def __init__(self, address, depth, width, spc):
-		WaveformGenerator.__init__(self, depth, width, spc)
-		self.bank = csrgen.Bank(self.get_registers(), address)
-	
-	def get_fragment(self):
-		return WaveformGenerator.get_fragment(self) + self.bank.get_fragment()
+from library.waveform_memory import WaveformMemoryOut
 
+depth = 64
 width = 16
-depth = 512
-values_i = [int((2**(width-1) - 1)*(sin(2*pi*x/depth) + 1)) for x in range(depth)]
-values_q = [int((2**(width-1) - 1)*(sin(2*pi*x/depth - pi/2) + 1)) for x in range(depth)]
-
-received_values_i = []
-received_values_q = []
+spc = 2
+size = 50
+mult = 3
+cycles = 200
+enable_cycle = 10
+# The enable register is set on the next cycle, and reaches the signal
+# domain two cycles later through its MultiReg. The first address is
+# then already on the memory ports, and its sample leaves two cycles
+# later (registered memory read and output register).
+start = enable_cycle + 1 + 2 + 2
 
-csr_mode = 0
-csr_busy = 1
-csr_size_h = 2
-csr_size_l = 3
-csr_mult_h = 4
-csr_mult_l = 5
-csr_data_in_h0 = 6
-csr_data_in_l0 = 7
-csr_data_in_h1 = 8
-csr_data_in_l1 = 9
-csr_shift_data = 10
+# Golden model: lane n starts at n*mult and advances by spc*mult, modulo
+# the waveform size
+def addresses(n, count):
+	a = n*mult
+	r = []
+	for i in range(count):
+		r.append(a)
+		a += spc*mult
+		if a >= size:
+			a -= size
+	return r
 
-def programmer(values, received_values):
-	# Go to "load waveform" mode
-	yield TWrite(csr_mode, 1)
-	# Load the waveform
-	for v0, v1 in zip(values[0::2], values[1::2]):
-		yield TWrite(csr_data_in_h0, (v0 & 0xff00) >> 8)
-		yield TWrite(csr_data_in_l0, v0 & 0x00ff)
-		yield TWrite(csr_data_in_h1, (v1 & 0xff00) >> 8)
-		yield TWrite(csr_data_in_l1, v1 & 0x00ff)
-		yield TWrite(csr_shift_data, 1)
-	
-	# Go to playback mode, default multiplier is 1
-	yield TWrite(csr_mode, 2)
-	# Wait for the collection of 2 periods
-	while len(received_values) < 2*depth:
-		yield None
-	
-	# Set new multiplier
-	yield TWrite(csr_mult_l, 2)
-	# Collect values
-	while len(received_values) < 3*depth:
-		yield None
-	
-	# Set new multiplier
-	yield TWrite(csr_mult_l, 12)
-	# Collect values
-	while len(received_values) < 4*depth:
-		yield None
+class TB(Module):
+	def __init__(self):
+		self.submodules.wm = RenameClockDomains(WaveformMemoryOut(depth, width, spc), {"signal": "sys"})
+		prng = Random(7)
+		self.values_i = [prng.randrange(2**width) for i in range(depth)]
+		self.values_q = [prng.randrange(2**width) for i in range(depth)]
+		self.outputs = [[] for i in range(2*spc)]
 
-def receiver():
-	while True:
-		t = Token("sample")
-		yield t
-		received_values_i.append(t.value["i0"])
-		received_values_q.append(t.value["q0"])
-		received_values_i.append(t.value["i1"])
-		received_values_q.append(t.value["q1"])
+	def do_simulation(self, s):
+		if s.cycle_counter == 0:
+			for i in range(depth):
+				s.wr(self.wm._mem_i, self.values_i[i], i)
+				s.wr(self.wm._mem_q, self.values_q[i], i)
+			s.wr(self.wm._r_size.storage, size)
+			s.wr(self.wm._r_mult.storage, mult)
+		elif s.cycle_counter == enable_cycle:
+			s.wr(self.wm._r_playback_en.storage, 1)
+		for n in range(spc):
+			self.outputs[2*n].append(s.rd(getattr(self.wm, "value_i" + str(n))))
+			self.outputs[2*n+1].append(s.rd(getattr(self.wm, "value_q" + str(n))))
+		s.interrupt = s.cycle_counter >= cycles
 
-def main():
-	# Create a simple dataflow system
-	receiver_layout = [
-		("i0", width),
-		("q0", width),
-		("i1", width),
-		("q1", width)
-	]
-	wg_i = CSRWG(0, depth, width, 2)
-	wg_q = CSRWG(0, depth, width, 2)
-	sink = SimActor(receiver(), ("sample", Sink, receiver_layout))
-	g = DataFlowGraph()
-	g.add_connection(wg_i, sink, sink_subr=["i0", "i1"])
-	g.add_connection(wg_q, sink, sink_subr=["q0", "q1"])
-	comp = CompositeActor(g)
-	
-	# CSR programmer and interconnect
-	csr_i_prog = csr.Initiator(programmer(values_i, received_values_i))
-	csr_i_intercon = csr.Interconnect(csr_i_prog.bus, [wg_i.bank.bus])
-	csr_q_prog = csr.Initiator(programmer(values_q, received_values_q))
-	csr_q_intercon = csr.Interconnect(csr_q_prog.bus, [wg_q.bank.bus])
-
-	# Run the simulation until the CSR programmer finishes
-	def end_simulation(s):
-		s.interrupt = csr_i_prog.done and csr_q_prog.done
-	frag = comp.get_fragment() \
-		+ csr_i_prog.get_fragment() + csr_i_intercon.get_fragment() \
-		+ csr_q_prog.get_fragment() + csr_q_intercon.get_fragment() \
-		+ Fragment(sim=[end_simulation])
-	sim = Simulator(frag)
+def main(vcd_name="waveform_generator.vcd"):
+	tb = TB()
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
 	sim.run()
-	
-	# Check correctness of the first received values
-	assert(received_values_i[:depth] == values_i)
-	assert(received_values_q[:depth] == values_q)
-	
-	# Plot waveform
-	plt.plot(received_values_i)
-	plt.plot(received_values_q)
-	plt.show()
 
-main()
+	count = cycles//2
+	expected = []
+	for n in range(spc):
+		adr = addresses(n, count)
+		expected.append([tb.values_i[a] for a in adr])
+		expected.append([tb.values_q[a] for a in adr])
+	for o, e in zip(tb.outputs, expected):
+		# the first sample is presented until playback starts
+		assert all(v == e[0] for v in o[5:start]), "output before playback"
+		assert o[start:start+count] == e, "playback mismatch"
+	print("{} samples per lane match the golden model".format(count))
+	return sim.cycle_counter
+
+if __name__ == "__main__":
+	main()
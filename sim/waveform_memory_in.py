@@ -0,0 +1,101 @@
+from migen.fhdl.std import *
+from migen.sim.generic import Simulator, TopLevel
+
+from library.waveform_memory import WaveformMemoryIn
+
+depth = 64
+width = 16
+size = 40
+stb_period = 3
+
+# The input is a free-running counter, valid one cycle out of
+# stb_period: a capture must hold consecutive valid samples.
+# Without release, the host never releases the banks, and records the
+# sequence number and the ready flags each time the overflow flags
+# change.
+class TB(Module):
+	def __init__(self, double_buffered, release=True):
+		self.double_buffered = double_buffered
+		self.release = release
+		self.overflows = []
+		wm = WaveformMemoryIn(depth, width, double_buffered)
+		self.submodules.wm = RenameClockDomains(wm, {"signal": "sys"})
+		if double_buffered:
+			self.mems = [wm._mem0, wm._mem1]
+		else:
+			self.mems = [wm._mem]
+		self.captures = []
+		self.sequences = []
+		self.state = "START"
+
+	def do_simulation(self, s):
+		t = s.cycle_counter
+		s.wr(self.wm.value, t & (2**width - 1))
+		s.wr(self.wm.stb, int(t % stb_period == 0))
+		s.wr(self.wm._r_start.re, 0)
+		if self.double_buffered:
+			s.wr(self.wm._r_release.re, 0)
+
+		if t == 0:
+			s.wr(self.wm._r_size.storage, size)
+			if self.double_buffered:
+				s.wr(self.wm._r_continuous.storage, 1)
+		elif t == 10:
+			s.wr(self.wm._r_start.re, 1)
+		elif t > 20 and not self.double_buffered:
+			if not s.rd(self.wm._r_busy.status):
+				self.captures.append([s.rd(self.mems[0], i) for i in range(size)])
+				s.interrupt = True
+		elif t > 20 and not self.release:
+			overflow = s.rd(self.wm._r_overflow.status)
+			if overflow != (self.overflows[-1][0] if self.overflows else 0):
+				self.overflows.append((overflow, s.rd(self.wm._r_sequence.status),
+					s.rd(self.wm._r_ready.status)))
+			s.interrupt = overflow == 3
+		elif t > 20:
+			ready = s.rd(self.wm._r_ready.status)
+			bank = len(self.captures) % 2
+			if ready & (1 << bank):
+				self.captures.append([s.rd(self.mems[bank], i) for i in range(size)])
+				self.sequences.append(s.rd([self.wm._r_seq0, self.wm._r_seq1][bank].status))
+				s.wr(self.wm._r_release.r, 1 << bank)
+				s.wr(self.wm._r_release.re, 1)
+			s.interrupt = len(self.captures) == 3
+
+def check_overflow(tb):
+	# a bank is flagged when its overwrite starts, before the capture
+	# that overwrites it is done, and is no longer ready then
+	assert tb.overflows == [(1, 2, 2), (3, 3, 1)], tb.overflows
+
+def check(tb):
+	previous = None
+	for capture in tb.captures:
+		steps = [(b - a) % 2**width for a, b in zip(capture, capture[1:])]
+		assert all(step == stb_period for step in steps), capture
+		# continuous captures do not lose samples between banks
+		if previous is not None:
+			assert (capture[0] - previous[-1]) % 2**width == stb_period
+		previous = capture
+	if tb.double_buffered:
+		assert tb.sequences == list(range(len(tb.captures))), tb.sequences
+
+def main(vcd_name="waveform_memory_in.vcd"):
+	cycle_counter = 0
+	for double_buffered in [False, True]:
+		tb = TB(double_buffered)
+		sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+		sim.run()
+		check(tb)
+		print("{} capture(s) of {} samples, double_buffered={}".format(
+			len(tb.captures), size, double_buffered))
+		cycle_counter += sim.cycle_counter
+	tb = TB(True, False)
+	sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+	sim.run()
+	check_overflow(tb)
+	print("overflows flagged at sequence numbers {}".format([seq for o, seq, ready in tb.overflows]))
+	cycle_counter += sim.cycle_counter
+	return cycle_counter
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,157 @@
+from random import Random
+
+from migen.fhdl.std import *
+from migen.bus import wishbone
+from migen.genlib.misc import optree
+from migen.sim.generic import Simulator, TopLevel
+
+from library.wishbone_sram import WishboneSRAM, WishboneDefaultSlave
+
+depth = 64
+
+# (start address, cti, bte, write) of the accesses, in bus words from the
+# start of the memory. Bursts are 8 words long, or as long as their
+# wrapping window. Writes cover whole entries, as the words of an entry
+# are committed with its last one.
+accesses = [
+	(4, 0b010, 0, True),
+	(16, 0b000, 0, True),
+	(17, 0b000, 0, True),
+	(30, 0b000, 0, True),
+	(31, 0b000, 0, True),
+	(6, 0b010, 1, True),
+	(20, 0b010, 2, True),
+	(4, 0b010, 0, False),
+	(3, 0b010, 0, False),
+	(17, 0b000, 0, False),
+	(30, 0b000, 0, False),
+	(6, 0b010, 1, False),
+	(13, 0b010, 2, False),
+	(21, 0b010, 2, False)
+]
+
+def burst_addresses(start, cti, bte):
+	if cti != 0b010:
+		return [start]
+	if bte == 0:
+		return [start + i for i in range(8)]
+	length = 2**(bte + 1)
+	base = start & ~(length - 1)
+	return [base + (start + i) % length for i in range(length)]
+
+# The memory is mapped at its size in bus words by an interconnect, next
+# to the default slave, and accessed by a registered master.
+class TB(Module):
+	def __init__(self, width):
+		self.width = width
+		prng = Random(width)
+		init = [prng.randrange(2**width) for i in range(depth)]
+		self.mem = Memory(width, depth, init=init)
+		self.specials += self.mem
+		self.submodules.sram = WishboneSRAM(self.mem)
+		self.submodules.default = WishboneDefaultSlave()
+		self.base = self.sram.size
+		window = log2_int(self.sram.size)
+		decoders = [lambda a: a[window:] == 1]
+		slaves = [(decoders[0], self.sram.bus),
+			(lambda a: ~optree("|", [decoder(a) for decoder in decoders]), self.default.bus)]
+		self.master = wishbone.Interface(16)
+		self.submodules.interconnect = wishbone.InterconnectShared([self.master], slaves)
+
+		# golden model, in bus words
+		self.words_per_entry = 2**log2_int((width + 15)//16, False)
+		self.words = []
+		for entry in init:
+			for i in reversed(range(self.words_per_entry)):
+				self.words.append((entry >> 16*i) & 0xffff)
+		self.data = [prng.randrange(2**16) for i in range(len(accesses)*8)]
+		self.reads = []
+		self.expected_reads = []
+		self.burst_cycles = []
+		self.host = self.host_process()
+
+	def transfer(self, adrs, cti, bte, writes=None):
+		bus = self.master
+		r = []
+		def request(n):
+			s = self.s
+			s.wr(bus.cyc, 1)
+			s.wr(bus.stb, 1)
+			s.wr(bus.adr, adrs[n])
+			s.wr(bus.bte, bte)
+			if cti == 0b010 and n == len(adrs) - 1:
+				s.wr(bus.cti, 0b111)
+			else:
+				s.wr(bus.cti, cti)
+			if writes is not None:
+				s.wr(bus.we, 1)
+				s.wr(bus.dat_w, writes[n])
+		request(0)
+		acked = 0
+		cycles = 0
+		while acked < len(adrs):
+			yield
+			cycles += 1
+			s = self.s
+			if s.rd(bus.ack):
+				if writes is None:
+					r.append(s.rd(bus.dat_r))
+				acked += 1
+				if acked < len(adrs):
+					request(acked)
+		s = self.s
+		s.wr(bus.cyc, 0)
+		s.wr(bus.stb, 0)
+		s.wr(bus.we, 0)
+		s.wr(bus.cti, 0)
+		yield
+		return r, cycles
+
+	def host_process(self):
+		data = iter(self.data)
+		for start, cti, bte, write in accesses:
+			adrs = burst_addresses(start, cti, bte)
+			if write:
+				values = [next(data) for adr in adrs]
+				r, cycles = yield from self.transfer([self.base + adr for adr in adrs], cti, bte, values)
+				for adr, value in zip(adrs, values):
+					self.words[adr] = value
+			else:
+				r, cycles = yield from self.transfer([self.base + adr for adr in adrs], cti, bte)
+				self.reads.append(r)
+				self.expected_reads.append([self.words[adr] for adr in adrs])
+			if cti == 0b010:
+				self.burst_cycles.append((len(adrs), cycles))
+		# unmapped addresses are acknowledged and read as 0
+		yield from self.transfer([3*self.base], 0, 0, [0x1234])
+		r, cycles = yield from self.transfer([3*self.base], 0, 0)
+		self.unmapped = r
+
+	def do_simulation(self, s):
+		self.s = s
+		try:
+			next(self.host)
+		except StopIteration:
+			s.interrupt = True
+
+def check(tb):
+	assert tb.reads == tb.expected_reads, (tb.reads, tb.expected_reads)
+	# after the first word, bursts transfer one word per clock
+	for length, cycles in tb.burst_cycles:
+		assert cycles == length + 1, tb.burst_cycles
+	assert tb.unmapped == [0], tb.unmapped
+
+def main(vcd_name="wishbone_sram.vcd"):
+	cycle_counter = 0
+	for width in [16, 32]:
+		tb = TB(width)
+		sim = Simulator(tb.get_fragment(), TopLevel(vcd_name))
+		sim.run()
+		check(tb)
+		print("{} accesses of which {} bursts, {}-bit entries".format(
+			len(accesses), len(tb.burst_cycles), width))
+		cycle_counter += sim.cycle_counter
+	return cycle_counter
+
+if __name__ == "__main__":
+	main()